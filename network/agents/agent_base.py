@@ -1,12 +1,21 @@
+import email.utils
 import json
+import random
+import time
 
 import requests
-from network.config import huggingface_headers, openai_headers
+from network.config import context_strategy, context_token_budget, huggingface_headers, llm_endpoint, openai_headers, rate_limit_rpm, rate_limit_tpm, request_retries
 import re
-import tiktoken
 
+from network.exceptions.malformed_stream_exception import MalformedStreamException
+from network.utils.context_assembler import ContextAssembler
 from network.utils.crane_tokenizer import CraneTokenizer
 from network.utils.error_logger import ErrorLogger
+from network.utils.http_session_pool import get_session_pool
+from network.utils.rate_limiter import RateLimiter, get_rate_limiter
+from network.utils.response_cache import get_response_cache
+from network.utils.sse_stream import read_chat_completion_stream
+from network.utils.tracer import traced
 
 
 class AgentBase:
@@ -23,9 +32,13 @@ class AgentBase:
             if self.default_provider == "openai":
                 self.open_ai = self.api_settings.get("openai", {})
                 self.model = self.open_ai.get("model", {})
-                self.endpoint = self.open_ai.get("endpoint", {})
+                self.endpoint = llm_endpoint or self.open_ai.get("endpoint", {})
                 self.api_key = self.open_ai.get("api_key", {})
                 self.max_tokens = self.open_ai.get("max_tokens", {})
+                self.context_token_budget = self.open_ai.get("context_token_budget", context_token_budget)
+                self.context_strategy = self.open_ai.get("context_strategy", context_strategy)
+                self.requests_per_minute = self.open_ai.get("requests_per_minute", rate_limit_rpm)
+                self.tokens_per_minute = self.open_ai.get("tokens_per_minute", rate_limit_tpm)
                 self.hugging_face = None
             else:
                 self.hugging_face = self.api_settings.get("huggingface", {})
@@ -33,6 +46,10 @@ class AgentBase:
                 self.endpoint = self.hugging_face.get("endpoint", {})
                 self.api_key = self.hugging_face.get("api_key", {})
                 self.max_tokens = self.hugging_face.get("max_new_tokens", {})
+                self.context_token_budget = self.hugging_face.get("context_token_budget", context_token_budget)
+                self.context_strategy = self.hugging_face.get("context_strategy", context_strategy)
+                self.requests_per_minute = self.hugging_face.get("requests_per_minute", rate_limit_rpm)
+                self.tokens_per_minute = self.hugging_face.get("tokens_per_minute", rate_limit_tpm)
                 self.open_ai = None
 
             self.context = ""
@@ -56,12 +73,27 @@ class AgentBase:
         except json.JSONDecodeError:
             self.error_logger.add_error("Error while reading the JSON file")
 
-        self.request_retries = 1
-        self.wait_time = 2
+        self.request_retries = request_retries
+        self.wait_time = 2 #base delay, in seconds, of the exponential backoff between retries
+        self.max_wait_time = 60
         self.timeout = 60
+        self.retryable_status_codes = {429, 500, 502, 503, 504}
 
         self.tokenizer = CraneTokenizer("gpt-4o-mini-2024-07-18")
-
+        self.context_assembler = None
+        if getattr(self, "context_token_budget", 0):
+            self.context_assembler = ContextAssembler(self.tokenizer, int(self.context_token_budget), self.context_strategy)
+        self.session_pool = get_session_pool() #shared by every agent, so that connections are reused across agents
+        self.response_cache = get_response_cache()
+        self.last_usage = None #token usage of the last successful call
+        self.streaming = False #if True, OpenAI completions are streamed
+        self.stop_sentence = None #when streaming, the stream is closed as soon as this sentence is received
+        self.rate_limiter = get_rate_limiter(self.default_provider, str(self.model), int(getattr(self, "requests_per_minute", 0)), int(getattr(self, "tokens_per_minute", 0)))
+        self.static_prefix = ""
+        self.static_prefix_tokens = 0
+        self.build_static_prefix()
+
+    @traced("query_model", lambda agent: {"agent": agent.name, "model": agent.model})
     def query_model(self) -> str | None:
         """
         Sends a question to a model via a POST request and returns the model's response.
@@ -71,7 +103,9 @@ class AgentBase:
         question : str
             The question or input text to send to the Hugging Face model.
         self.request_retries : int
-            Number of times the function will try to call the LLM api before returning an error
+            Number of times the function will try to call the LLM api before returning an error.
+            Rate limiting (429), server errors (5xx), timeouts and connection errors are retried
+            after the delay requested by the provider (Retry-After) or a jittered exponential backoff.
 
         Returns:
         -------
@@ -83,28 +117,252 @@ class AgentBase:
         -----
         This function assumes that `api_url` (the endpoint URL of the Hugging Face model) and `headers`
         (the request headers, including any required authorization) are defined elsewhere in the code.
+        The request is sent through the process-wide session pool, so keep-alive connections to the
+        same endpoint are reused by every agent. If the response cache is enabled, identical payloads
+        are answered from the cache instead of being sent to the provider again.
+        The errors of the failed attempts are logged only if every attempt fails: if a retry succeeds,
+        the transient errors (e.g. 429 or 503) are discarded from the agent's error log.
+        The attempts are executed by `request_attempts`, whose waits are spent sleeping.
+        """
+        attempts = self.request_attempts()
+        while True:
+            finished, result = self.advance_request(attempts)
+            if finished:
+                return result
+            time.sleep(result)
+
+    def request_attempts(self):
         """
+        Generator executing the attempts of a request, as described in `query_model`.
+
+        Instead of sleeping, it yields the seconds to wait before it can continue (for the rate limiter
+        or between two attempts), so an asynchronous caller can await them without holding a worker thread
+        or a request slot. The response (or None) is the return value of the generator.
+        """
+        self.last_usage = None
+        previous_errors = list(self.error_logger.get_errors())
+        start_time = time.perf_counter()
+        rate_limit_wait = 0.0
         for i in range(0, self.request_retries):
+            retry_after = None
             try:
                 payload, headers = self.prepare_payload()
                 #print(f"Agent: {self.name}\n Payload:<begin>{payload}</end>\n")
-                response = requests.post(self.endpoint, headers=headers, json=payload, timeout=self.timeout)
+                cache_key = None
+                if self.response_cache.is_enabled():
+                    cache_key = self.response_cache.make_key(self.default_provider, self.model, payload)
+                    cached_response = self.response_cache.get(cache_key)
+                    if cached_response is not None:
+                        filtered_response = self.clear_response(cached_response)
+                        self.record_usage(payload, cached_response, filtered_response, time.perf_counter() - start_time, cached_response=True)
+                        self.error_logger.set_errors(previous_errors)
+                        return filtered_response
+                    if self.response_cache.is_replay_only():
+                        self.error_logger.add_error(f"Cache miss ({self.name}): the response is not cached and the cache is in replay-only mode.")
+                        return None
+
+                wait = self.rate_limiter.reserve(self.estimate_request_tokens(payload))
+                if wait > 0:
+                    yield wait
+                rate_limit_wait = rate_limit_wait + wait
+                if self.streaming and self.default_provider == "openai":
+                    response = self.post_streaming(payload, headers)
+                else:
+                    response = self.session_pool.post(self.endpoint, headers=headers, json=payload, timeout=self.timeout)
 
                 if response.status_code == 200:
-                    return self.clear_response(response) #based on the provider, the response will be cleared in order to maintain only the output of the agent
+                    if cache_key is not None and not getattr(response, "stopped_early", False): #a stopped stream may be a truncated reply, which must not answer the non-streamed payload
+                        self.response_cache.put(cache_key, response.text)
+                    filtered_response = self.clear_response(response) #based on the provider, the response will be cleared in order to maintain only the output of the agent
+                    self.record_usage(payload, response, filtered_response, time.perf_counter() - start_time, rate_limit_wait=rate_limit_wait)
+                    self.error_logger.set_errors(previous_errors) #the errors of the retried attempts are not failures of the call
+                    return filtered_response
                 else:
                     self.handle_response_error(response)
+                    if response.status_code not in self.retryable_status_codes:
+                        return None
+                    retry_after = self.get_retry_after(response)
+                    if retry_after is not None:
+                        self.rate_limiter.penalize(retry_after) #every agent using the same model waits before sending new requests
 
             except requests.exceptions.Timeout:
                 self.error_logger.add_error(f"Request timed out. Please {self.name} try again later.")
-                return None
             except requests.exceptions.ConnectionError:
                 self.error_logger.add_error(f"Connection error occurred. {self.name} check your network connection.")
-                return None
+            except MalformedStreamException as e:
+                self.error_logger.add_error(f"Malformed streamed response ({self.name}): {e}") #retried like a transient error
             except requests.exceptions.RequestException as e:
                 self.error_logger.add_error(f"An error occurred({self.name}): {e}")
                 return None
 
+            if i < self.request_retries - 1:
+                yield self.get_backoff_time(i, retry_after)
+        return None
+
+    @staticmethod
+    def advance_request(attempts) -> tuple[bool, object]:
+        """
+        Runs the attempts of a request until the next wait or the end of the request.
+
+        Returns:
+            tuple[bool, object]: (False, seconds to wait) or (True, response).
+        """
+        try:
+            return False, next(attempts)
+        except StopIteration as result:
+            return True, result.value
+
+    def post_streaming(self, payload: dict, headers: dict):
+        """
+        Sends the payload requesting a streamed completion and reads the stream, closing it as soon as
+        the stop sentence is received. Error responses are returned as they are.
+
+        Returns:
+            StreamedResponse | requests.Response: The assembled response, or the error response.
+        """
+        streamed_payload = {**payload, "stream": True, "stream_options": {"include_usage": True}}
+        start_time = time.perf_counter()
+        response = self.session_pool.post(self.endpoint, headers=headers, json=streamed_payload, timeout=self.timeout, stream=True)
+        if response.status_code != 200:
+            return response
+        return read_chat_completion_stream(response, start_time, self.stop_sentence)
+
+    def get_streaming(self) -> bool:
+        return self.streaming
+
+    def set_streaming(self, streaming: bool) -> None:
+        self.streaming = streaming
+
+    def get_stop_sentence(self) -> str | None:
+        return self.stop_sentence
+
+    def set_stop_sentence(self, stop_sentence: str | None) -> None:
+        self.stop_sentence = stop_sentence
+
+    def estimate_request_tokens(self, payload: dict) -> int:
+        """
+        Estimates the tokens a request consumes from the tokens-per-minute budget: the prompt's tokens
+        plus the maximum number of generated tokens. The estimate is computed only if the rate limiter
+        enforces a tokens-per-minute budget.
+        """
+        if not self.rate_limiter.limits_tokens():
+            return 0
+        if "messages" in payload:
+            prompt_text = "".join(message["content"] for message in payload["messages"])
+        else:
+            prompt_text = payload.get("inputs", "")
+        return self.tokenizer.calculate_tokens_from_string(prompt_text) + int(self.max_tokens)
+
+    @staticmethod
+    def get_retry_after(response) -> float | None:
+        """
+        Reads the delay requested by the provider from the `retry-after-ms` or `Retry-After` headers
+        (either in seconds or as an HTTP date).
+
+        Returns:
+            float | None: The seconds to wait, or None if the provider did not specify them.
+        """
+        headers = getattr(response, "headers", None) or {}
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms is not None:
+            try:
+                return max(float(retry_after_ms) / 1000, 0.0)
+            except ValueError:
+                pass
+        retry_after = headers.get("Retry-After")
+        if retry_after is None:
+            return None
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                retry_date = email.utils.parsedate_to_datetime(retry_after)
+                return max(retry_date.timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                return None
+
+    def get_backoff_time(self, attempt: int, retry_after: float | None = None) -> float:
+        """
+        Computes the delay before the next attempt: the delay requested by the provider if any,
+        otherwise an exponential backoff based on `wait_time`. A random jitter spreads the retries of
+        concurrent agents over time.
+        """
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.wait_time / 2)
+        delay = min(self.wait_time * (2 ** attempt), self.max_wait_time)
+        return random.uniform(delay / 2, delay)
+
+    def get_rate_limiter(self) -> RateLimiter:
+        return self.rate_limiter
+
+    def record_usage(self, payload: dict, response, filtered_response: str, latency: float, cached_response: bool = False, rate_limit_wait: float = 0.0) -> None:
+        """
+        Records the token usage of a successful call in `last_usage` and in the tokenizer's counters.
+
+        The tokens are read from the `usage` field of the provider's response, including the prompt tokens
+        served from the provider's prefix cache (`prompt_tokens_details.cached_tokens`). If the provider does
+        not report them (e.g. Hugging Face), they are estimated locally with the tokenizer.
+
+        Args:
+            payload (dict): The payload sent to the provider.
+            response: The response of the provider (or the cached one).
+            filtered_response (str): The output of the agent extracted from the response.
+            latency (float): The duration of the call in seconds.
+            cached_response (bool): True if the response was read from the response cache.
+            rate_limit_wait (float): The seconds spent waiting for the rate limiter.
+        """
+        usage = None
+        try:
+            response_data = response.json()
+            if isinstance(response_data, dict):
+                usage = response_data.get("usage")
+        except ValueError:
+            usage = None
+
+        cached_prompt_tokens = 0
+        if usage and "prompt_tokens" in usage:
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+            cached_prompt_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+            estimated = False
+        else:
+            if "messages" in payload:
+                prompt_text = "".join(message["content"] for message in payload["messages"])
+            else:
+                prompt_text = payload.get("inputs", "")
+            prompt_tokens = self.tokenizer.calculate_tokens_from_string(prompt_text)
+            completion_tokens = self.tokenizer.calculate_tokens_from_string(filtered_response or "")
+            estimated = True
+
+        if not cached_response:
+            self.tokenizer.add_to_input_tokens(prompt_tokens)
+            self.tokenizer.add_to_output_tokens(completion_tokens)
+
+        self.last_usage = {
+            "model": self.model,
+            "provider": self.default_provider,
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "estimated": estimated,
+            "cached_response": cached_response,
+            "latency": round(latency, 6),
+            "rate_limit_wait": round(rate_limit_wait, 6)
+        }
+        time_to_first_token = getattr(response, "time_to_first_token", None)
+        if time_to_first_token is not None:
+            self.last_usage["time_to_first_token"] = round(time_to_first_token, 6)
+            self.last_usage["stopped_early"] = response.stopped_early
+
+    def get_last_usage(self) -> dict | None:
+        return self.last_usage
+
+    def set_last_usage(self, last_usage: dict | None) -> None:
+        self.last_usage = last_usage
+
+    def get_tokenizer(self) -> CraneTokenizer:
+        return self.tokenizer
+
     def get_context(self) -> str:
         return self.context
 
@@ -116,12 +374,14 @@ class AgentBase:
 
     def set_original_context(self, original_context: str) -> None:
         self.original_context = original_context
+        self.build_static_prefix()
 
     def get_instructions(self) -> str:
         return self.instructions
 
     def set_instructions(self, instructions: str | dict) -> None:
         self.instructions = instructions
+        self.build_static_prefix()
 
     def get_request_retries(self) -> int:
         return self.request_retries
@@ -224,19 +484,16 @@ class AgentBase:
 
         Returns:
             dict: A dictionary containing the following keys:
-                - "inputs" (str): A string combining the context and instructions.
+                - "inputs" (str): The static prefix followed by the conversation history and the input data.
                 - "parameters" (dict): A dictionary containing:
                     - "max_new_tokens" (int): The maximum number of tokens to generate.
         """
-        full_context = (
-            f"### System Context\n{self.original_context.strip()}\n\n"
-            f"### Conversation History\n{self.additional_context}"
-        )
-
+        additional_context = self.get_budgeted_additional_context()
         payload = {
             "inputs": (
-                f"{full_context}\n\n"
-                f"### Instructions\n{self.instructions}\n### Data provided as input\n{self.input_problem}"
+                f"{self.static_prefix}"
+                f"### Conversation History\n{additional_context}\n\n"
+                f"### Data provided as input\n{self.input_problem}"
             ),
             "parameters": {
                 "max_new_tokens": int(self.max_tokens),  # Add token limit for Hugging Face
@@ -249,43 +506,73 @@ class AgentBase:
         Construct the payload for an OpenAI Chat API request.
 
         This method assembles a payload dictionary compatible with OpenAI's chat-based
-        models (e.g., GPT-4). It merges the original system context and the conversational
-        history into a unified system message, and includes user instructions for the model
-        to respond to.
+        models (e.g., GPT-4). The first message is the agent's static prefix, which is
+        byte-identical across calls so that the provider's prompt caching can apply; the
+        conversation history and the input data follow in separate messages.
 
         Returns:
             dict: A payload dictionary with the following structure:
                 - "model" (str): The name of the OpenAI model to use.
                 - "messages" (list of dict): A list containing:
-                    - {"role": "system", "content": str}: The combined system context and conversation history.
-                    - {"role": "user", "content": str}: The user's current instructions or prompt.
+                    - {"role": "system", "content": str}: The static prefix (system context and instructions).
+                    - {"role": "system", "content": str}: The conversation history.
+                    - {"role": "user", "content": str}: The data provided as input.
                 - "max_tokens" (int): The maximum number of tokens allowed in the generated response.
         """
-        if self.additional_context == "":
-            full_context = (
-                f"### System Instructions\n{self.original_context.strip()}\n\n"
-                f"### Conversation History\nThere is not yet a conversation history to retrieve."
-            )
-        else:
-            full_context = (
-                f"### System Instructions\n{self.original_context.strip()}\n\n"
-                f"### Conversation History\n{self.additional_context}"
-            )
+        additional_context = self.get_budgeted_additional_context()
+        if additional_context == "":
+            additional_context = "There is not yet a conversation history to retrieve."
 
         payload = {
             "model": self.model,
             "messages": [
-                {"role": "system", "content": full_context},  # Combined context
-                {"role": "user", "content": f"### Instructions\n{self.instructions}\n### Data provided as input\n{self.input_problem}"}
+                {"role": "system", "content": self.static_prefix},
+                {"role": "system", "content": f"### Conversation History\n{additional_context}"},
+                {"role": "user", "content": f"### Data provided as input\n{self.input_problem}"}
             ],
             "max_tokens": int(self.max_tokens),
         }
-
-        #for m in payload["messages"]:
-            #tokens = self.tokenizer.calculate_tokens_from_string(m["content"])
-            #print(f"Agent {self.name} tokens {tokens}")
         return payload
 
+    def build_static_prefix(self) -> None:
+        """
+        Precomputes the part of the prompt that never changes between calls: the system context
+        (specialization, personality, context) and the instructions. It is rebuilt only when the
+        original context or the instructions are replaced, so every request of the agent starts
+        with the same bytes.
+        """
+        if self.default_provider == "openai":
+            self.static_prefix = (
+                f"### System Instructions\n{self.original_context.strip()}\n\n"
+                f"### Instructions\n{self.instructions}"
+            )
+        else:
+            self.static_prefix = (
+                f"### System Context\n{self.original_context.strip()}\n\n"
+                f"### Instructions\n{self.instructions}\n\n"
+            )
+        if self.context_assembler is not None:
+            self.static_prefix_tokens = self.tokenizer.calculate_tokens_from_string(self.static_prefix)
+
+    def get_static_prefix(self) -> str:
+        return self.static_prefix
+
+    def get_budgeted_additional_context(self):
+        """
+        Returns the additional context reduced by the context assembler, so that the prompt fits
+        within the agent's token budget. If the agent has no budget, the context is returned as is.
+
+        Returns:
+            str | list: The additional context to include in the prompt.
+        """
+        if self.context_assembler is None:
+            return self.additional_context
+        fixed_tokens = self.static_prefix_tokens + self.tokenizer.calculate_tokens_from_string(str(self.input_problem)) + 50 # 50 tokens are reserved for the headers and the messages' formatting
+        return self.context_assembler.fit(self.additional_context, fixed_tokens)
+
+    def get_context_assembler(self) -> ContextAssembler | None:
+        return self.context_assembler
+
     def prepare_payload(self):
         if self.default_provider == "openai":
             payload = self.get_openai_payload()
@@ -303,8 +590,6 @@ class AgentBase:
         filtered_response = ""
         if self.default_provider == "openai":
             filtered_response = response.json()["choices"][0]["message"]["content"]
-            #output_tokens = response.json()["usage"]["completion_tokens"]
-            #print(f"Agent: {self.name} output tokens {output_tokens}")
         if self.default_provider == "huggingface":
             # print(f"the response length of {self.name} is:" + str(len(response.json()[0]["generated_text"].split())))
             # print(response.json())
@@ -317,8 +602,10 @@ class AgentBase:
         return filtered_response
 
     def handle_response_error(self, response) -> None:
-        if response.status_code == 503:
-            self.error_logger.add_error(f"Service unavailable ({self.name}): Retrying in {self.wait_time} seconds...")
+        if response.status_code == 429:
+            self.error_logger.add_error(f"Too many requests ({self.name}): the rate limit of the provider has been reached.")
+        elif response.status_code == 503:
+            self.error_logger.add_error(f"Service unavailable ({self.name}): the provider is temporarily unable to handle the request.")
         elif response.status_code == 400:
             self.error_logger.add_error(f"Bad request ({self.name}): The server could not understand the request.")
         elif response.status_code == 401:
@@ -0,0 +1,228 @@
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError: #not available on Windows
+    resource = None
+
+file_io_events = ("open", "os.rename", "os.remove", "os.mkdir", "os.listdir")
+file_io_counts = {event: 0 for event in file_io_events}
+
+
+def count_file_io(event: str, args) -> None:
+    if event in file_io_counts:
+        file_io_counts[event] = file_io_counts[event] + 1
+
+
+def get_file_io_counts() -> dict:
+    return dict(file_io_counts)
+
+
+def get_peak_rss_kb() -> int | None:
+    """
+    Returns the peak resident set size of the process in KB, or None where it cannot be measured.
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss // 1024 if sys.platform == "darwin" else peak_rss #bytes on macOS, KB on Linux
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """
+    Linearly interpolated percentile of an ascending list of values.
+    """
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize_spans(spans: list[dict]) -> dict:
+    """
+    Groups the spans by name and computes count, mean, p50, p95 and p99 of their duration in seconds.
+    """
+    durations = {}
+    for span in spans:
+        durations.setdefault(span["name"], []).append(span["duration"])
+    phases = {}
+    for name, values in sorted(durations.items()):
+        values.sort()
+        phases[name] = {
+            "count": len(values),
+            "mean": sum(values) / len(values),
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99)
+        }
+    return phases
+
+
+def create_synthetic_dataset(dataset_folder: str, size: int, snippet_lines: int) -> tuple[str, str]:
+    """
+    Writes `size` CRs with the layout of the dataset: snippets/before_CR_<n>.java and tasks_description/cr_task_CR_<n>.json.
+
+    Returns:
+        tuple[str, str]: The snippets folder and the tasks description folder.
+    """
+    snippets_folder = os.path.join(dataset_folder, "snippets")
+    tasks_description_folder = os.path.join(dataset_folder, "tasks_description")
+    os.makedirs(snippets_folder, exist_ok=True)
+    os.makedirs(tasks_description_folder, exist_ok=True)
+    for cr_number in range(size):
+        body = "\n".join(f"        int value{line} = compute({line}, {cr_number});" for line in range(snippet_lines))
+        with open(os.path.join(snippets_folder, f"before_CR_{cr_number}.java"), "w") as snippet:
+            snippet.write(f"public class Synthetic{cr_number} {{\n    public void run() {{\n{body}\n    }}\n}}\n")
+        with open(os.path.join(tasks_description_folder, f"cr_task_CR_{cr_number}.json"), "w") as task_description:
+            json.dump({"cr_task": f"Rename the variables of Synthetic{cr_number} so that they describe the computed values."}, task_description)
+    return snippets_folder, tasks_description_folder
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_configuration(records: list, prompt_set: str, prompts_path: str, concurrency: int, streaming: bool, mock_server, concurrent_reviewers: bool = False) -> dict:
+    """
+    Executes every CR (record) of the synthetic dataset with the given prompt set and concurrency,
+    and measures throughput, per-phase latency, peak RSS and file I/O of the run.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from network.main import process_cr
+    from network.utils.event_log_writer import get_event_log_writer
+    from network.utils.tracer import get_tracer
+
+    tracer = get_tracer()
+    tracer.clear()
+    mock_requests_before = dict(mock_server.state.counters)
+    file_io_before = get_file_io_counts()
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()): #the conversations' logs would dominate the output
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(
+                lambda record: process_cr(record, prompt_set, prompts_path, streaming, concurrent_reviewers=concurrent_reviewers),
+                records
+            ))
+        get_event_log_writer().flush() #the records still buffered belong to this run
+    wall_time = time.perf_counter() - start_time
+    file_io_after = get_file_io_counts()
+
+    return {
+        "prompt_set": prompt_set,
+        "concurrency": concurrency,
+        "streaming": streaming,
+        "crs": len(records),
+        "errors": sum(1 for outcome in outcomes if outcome["error"]),
+        "wall_time": wall_time,
+        "crs_per_second": len(records) / wall_time if wall_time > 0 else 0.0,
+        "phases": summarize_spans(tracer.get_spans()),
+        "peak_rss_kb": get_peak_rss_kb(),
+        "file_io": {event: file_io_after[event] - file_io_before[event] for event in file_io_events},
+        "llm_requests": {name: count - mock_requests_before.get(name, 0) for name, count in mock_server.state.counters.items()}
+    }
+
+
+def main(args):
+    """
+    Runs the benchmark in an isolated environment: a temporary BASE_PATH, the local RAG backend,
+    the hash embedder and the in-process mock server as provider. The environment is set up before
+    the first import of the network modules, since the configuration is read at import time.
+    """
+    work_folder = tempfile.mkdtemp(prefix="crane_benchmark_")
+    base_folder = os.path.join(work_folder, "conversations")
+    os.makedirs(base_folder)
+    os.environ.update({
+        "BASE_PATH": base_folder,
+        "DATASET_PATH": os.path.join(work_folder, "dataset"),
+        "RAG_BACKEND": "local",
+        "EMBEDDER": "hash",
+        "RESPONSE_CACHE_MODE": "off",
+        "STORAGE_MODE": args.storage,
+        "TRACE_OUTPUT": ""
+    })
+
+    from network.mock.mock_server import MockServer, MockState
+
+    mock_server = MockServer(port=0, state=MockState(latency=args.latency, error_rate_429=args.error_rate_429, retry_after=args.retry_after)).start()
+    os.environ["LLM_ENDPOINT"] = mock_server.get_chat_endpoint() #the mock server does not import the configuration
+
+    from network.utils.tracer import get_tracer
+    get_tracer().enable()
+
+    from network.utils.dataset_loader import DatasetLoader
+
+    create_synthetic_dataset(os.environ["DATASET_PATH"], args.size, args.snippet_lines)
+    dataset_loader = DatasetLoader(os.environ["DATASET_PATH"])
+    dataset_loader.ensure_manifest(rebuild=True) #the snippets may have been rewritten in place, which does not make the manifest stale
+    records = list(dataset_loader.records())
+    prompt_sets = args.prompt_sets or sorted(os.path.basename(path) for path in glob.glob(os.path.join(args.prompts_path, "system_prompt_*")))
+    sys.addaudithook(count_file_io)
+
+    runs = []
+    for prompt_set in prompt_sets:
+        for concurrency in args.concurrency:
+            run = run_configuration(records, prompt_set, args.prompts_path, concurrency, args.streaming, mock_server, args.concurrent_reviewers)
+            runs.append(run)
+            conversation_phase = run["phases"].get("conversation", {})
+            print(f"{prompt_set} concurrency {concurrency}: {run['crs_per_second']:.2f} CRs/s, {run['errors']} errors, "
+                  f"conversation p50 {conversation_phase.get('p50', 0):.3f} s p95 {conversation_phase.get('p95', 0):.3f} s p99 {conversation_phase.get('p99', 0):.3f} s, "
+                  f"peak RSS {run['peak_rss_kb']} KB, {run['file_io']['open']} files opened")
+    mock_server.stop()
+
+    results = {
+        "commit": get_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "parameters": {
+            "size": args.size,
+            "snippet_lines": args.snippet_lines,
+            "latency": args.latency,
+            "error_rate_429": args.error_rate_429,
+            "streaming": args.streaming,
+            "concurrent_reviewers": args.concurrent_reviewers,
+            "storage": args.storage
+        },
+        "runs": runs
+    }
+    output_path = args.output or f"benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    with open(output_path, "w") as output:
+        json.dump(results, output, indent=4)
+    print(f"Results saved in {output_path}")
+    return results
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the conversations of CRANE on a synthetic dataset against the local mock server.")
+    parser.add_argument("--size", type=int, default=20, help="number of synthetic CRs")
+    parser.add_argument("--snippet-lines", type=int, default=40, help="lines of each synthetic snippet")
+    parser.add_argument("--concurrency", type=lambda value: [int(level) for level in value.split(",")], default=[1, 8], help="comma separated concurrency levels (default: 1,8)")
+    parser.add_argument("--prompt-sets", nargs="*", default=None, help="prompt sets to benchmark (default: every system_prompt_* folder)")
+    parser.add_argument("--prompts-path", default="../prompts", help="path of the folder containing the prompt sets")
+    parser.add_argument("--latency", default="fixed:0.05", help="latency of the mock LLM requests, see network.mock.mock_server")
+    parser.add_argument("--error-rate-429", type=float, default=0.0, help="fraction of the mock LLM requests rejected with 429")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After seconds of the simulated 429")
+    parser.add_argument("--streaming", action="store_true", help="stream the reviewers' responses")
+    parser.add_argument("--concurrent-reviewers", action="store_true", help="query the reviewers of a round concurrently")
+    parser.add_argument("--storage", choices=["directory", "event_log"], default="directory", help="storage mode of the conversations' outputs")
+    parser.add_argument("--output", default=None, help="path of the JSON results (default: benchmark_<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    main(parse_arguments())
@@ -2,6 +2,7 @@ from network.agents.agent_base import AgentBase
 from network.agents.moderator import Moderator
 from network.agents.reviewer import Reviewer
 from network.communication.message import Message
+from network.communication.rendered_history import RenderedHistory
 
 class Conversation:
     def __init__(self, moderator: Moderator, reviewers: list[Reviewer], feedback_agent: AgentBase):
@@ -9,9 +10,13 @@ class Conversation:
         self.reviewers = reviewers
         self.feedback_agent = feedback_agent
         self.history = []
+        self.rendered_pieces = [] #rendering of each message of the history, computed once when the message is added
+        self.rendered_history = None #view of the whole history, reused until a new message is added
 
     def set_message(self, message: Message) -> None:
         self.history.append(message)
+        self.rendered_pieces.append(repr(message))
+        self.rendered_history = None
 
     def add_message(self, message: Message) -> list[Message]:
         """
@@ -23,14 +28,31 @@ class Conversation:
         Returns:
             list[Message]: list of messages that compose the conversation.
         """
-        self.history.append(message.to_dict())
+        self.history.append(message)
+        self.rendered_pieces.append(repr(message))
+        self.rendered_history = None
         return self.history
 
     def get_history(self) -> list[Message]:
         return self.history
 
+    def get_rendered_history(self) -> RenderedHistory:
+        """
+        Returns the history as a view that renders like `str(history)`, assembled from the cached
+        renderings of the messages. The view is not affected by the messages added later.
+
+        Returns:
+            RenderedHistory: The view of the current history.
+        """
+        if self.rendered_history is None:
+            self.rendered_history = RenderedHistory(self.history, self.rendered_pieces)
+        return self.rendered_history
+
     def set_history(self, new_history) -> None:
-        self.history = new_history
+        # new lists are created, so that the views of the previous history remain valid
+        self.history = list(new_history)
+        self.rendered_pieces = [repr(message) for message in self.history]
+        self.rendered_history = None
 
     def get_moderator(self) -> Moderator:
         return self.moderator
@@ -1,33 +1,58 @@
+import asyncio
 import os
 import json
 
 from network.agents.agent_base import AgentBase
 from network.communication.conversation import Conversation
 from network.communication.message import Message
-from network.config import base_path
+from network.communication.rendered_history import RenderedHistory
+from network.config import base_path, event_log_scope, request_retries, storage_mode
+from network.utils.checkpoint_store import CheckpointStore
+from network.utils.dataset_loader import get_shard_namespace
 from network.utils.error_logger import ErrorLogger
+from network.utils.event_log_writer import get_event_log_writer
+from network.utils.id_allocator import get_id_allocator
+from network.utils.replay_source import ReplaySource
+from network.utils.tracer import traced
+from network.utils.usage_tracker import UsageTracker
 from network.communication.conversational_rag import ConversationalRAG
 
 
+def trace_tags(conversation_manager, *args, **kwargs) -> dict:
+    return {"conversation_id": conversation_manager.conversation_id, "iteration_id": conversation_manager.iteration_id}
+
+
 class ConversationManager:
-    def __init__(self, conversation: Conversation, max_retries: int = None, messages_per_iteration: int = None, human_role: str = "", human_flag: bool = False):
+    def __init__(self, conversation: Conversation, max_retries: int = None, messages_per_iteration: int = None, human_role: str = "", human_flag: bool = False, concurrent_reviewers: bool = False, streaming: bool = False, shard: tuple[int, int] = None):
         #fundamental setup
         self.conversation = conversation
         self.moderator = self.conversation.get_moderator()
         self.reviewers = self.conversation.get_reviewers()
         self.feedback_agent = self.conversation.get_feedback_agent()
-        self.conversational_rag = ConversationalRAG("https://crane-0nuuost.svc.aped-4627-b74a.pinecone.io")
+        rag_namespace = None if shard is None else get_shard_namespace(shard) #the shards running at the same time do not share a local store
+        self.conversational_rag = ConversationalRAG("https://crane-0nuuost.svc.aped-4627-b74a.pinecone.io", namespace=rag_namespace)
 
         #handling files
         self.iteration_id = "0"
         self.conversation_id = "0"
         self.base_path = base_path
+        self.shard = shard #(index, count): the outputs are written in the shard's folder and the ids are interleaved with the other shards'
+        id_offset, id_stride = 0, 1
+        if shard is not None:
+            self.base_path = os.path.join(base_path, get_shard_namespace(shard))
+            os.makedirs(self.base_path, exist_ok=True)
+            id_offset, id_stride = shard
         self.conversation_manager_path = os.path.join(self.base_path, "conversation_id.json")
+        self.id_allocator = get_id_allocator(self.conversation_manager_path, id_offset, id_stride)
+        self.storage_mode = storage_mode #directory: a file for each output, event_log: records appended to a JSON lines log
+        self.event_log_scope = event_log_scope
 
         #conversation's settings
         self.stopping_condition = False
         if max_retries is None:
-            self.max_retries = 5
+            #the moderator and the feedback agent are queried up to max_retries times, and every query already retries
+            #the transient errors REQUEST_RETRIES times: the default keeps the requests of a call at about 5 in total
+            self.max_retries = max(1, 5 // max(request_retries, 1))
         else:
             self.max_retries = max_retries
 
@@ -37,11 +62,40 @@ class ConversationManager:
             self.messages_per_iteration = messages_per_iteration
 
         self.error_logger = ErrorLogger()
+        self.usage_tracker = UsageTracker()
         self.error_state = False
         self.cr_name = ""
 
         self.human_role = human_role
         self.human_flag = human_flag
+        self.concurrent_reviewers = concurrent_reviewers #if True, the reviewers of a round are queried concurrently
+        self.stop_sentence = "Another round is not needed."
+        self.rendered_rag_content = None #RAG content whose rendering is cached in rendered_rag
+        self.rendered_rag = None
+        self.checkpoint = None #if set, the completed agent calls are recorded in (and restored from) this checkpoint
+        self.call_counters = {} #(iteration, phase, agent) -> number of calls of the agent in the phase
+        self.replay_source = None #if set, the agent calls are answered by the recorded responses and no provider is contacted
+        self.request_semaphore = None #if set, caps the requests in flight of the asynchronous calls (shared by the conversations of a scheduler)
+        self.set_streaming(streaming)
+
+    def get_concurrent_reviewers(self) -> bool:
+        return self.concurrent_reviewers
+
+    def set_concurrent_reviewers(self, concurrent_reviewers: bool) -> None:
+        self.concurrent_reviewers = concurrent_reviewers
+
+    def get_streaming(self) -> bool:
+        return self.streaming
+
+    def set_streaming(self, streaming: bool) -> None:
+        """
+        Enables or disables the streaming of the reviewers' responses. While streaming, a reviewer's
+        stream is closed as soon as the reviewer replies with the stop sentence.
+        """
+        self.streaming = streaming
+        for reviewer in self.reviewers:
+            reviewer.set_streaming(streaming)
+            reviewer.set_stop_sentence(self.stop_sentence if streaming else None)
 
     def get_max_retries(self) -> int:
         return self.max_retries
@@ -51,97 +105,81 @@ class ConversationManager:
 
     def get_conversation_id(self) -> str:
         """
-        Retrieves the `conversation_id` from the JSON file.
+        Retrieves the `conversation_id` of the current conversation.
 
-        This method opens the JSON file in read mode, reads the data,
-        and extracts the value of the `conversation_id` key. If the
-        key does not exist, it defaults to an empty dictionary.
+        The id is allocated by the `IdAllocator` when the conversation starts and is kept
+        in memory, hence no file is read.
 
         Returns:
-            str: The value of the `conversation_id` attribute, or an
-                 empty dictionary if not found.
+            str: The value of the `conversation_id` attribute.
         """
-        with open(self.conversation_manager_path, "r") as conversation_file:
-            conversation_data = json.load(conversation_file)
-            self.conversation_id = conversation_data.get("conversation_id", {})
-            return self.conversation_id
+        return self.conversation_id
 
     def set_conversation_id(self, new_conversation_id: str) -> None:
-        """
-        Updates the `conversation_id` in the JSON file with a new value.
-
-        This method reads the existing JSON data from the file, updates
-        the value of the `conversation_id` key, and then writes the updated
-        data back to the file.
-
-        Args:
-            new_conversation_id (str): The new value to assign to the
-                                       `conversation_id` key.
-        """
-        with open(self.conversation_manager_path, "r") as read_conversation_file:
-            conversation_data = json.load(read_conversation_file)
-            conversation_data["conversation_id"] = new_conversation_id
-
-            with open(self.conversation_manager_path, "w") as write_conversation_file:
-                json.dump(conversation_data, write_conversation_file, indent=4)
+        self.conversation_id = new_conversation_id
 
     def increment_conversation_id(self):
         int_conversation_id = int(self.conversation_id)
         int_conversation_id = int_conversation_id + 1
         self.set_conversation_id(str(int_conversation_id))
 
+    def allocate_conversation_id(self) -> str:
+        """
+        Reserves a new unique conversation id and resets the iteration id.
+
+        The allocation is the only operation touching `conversation_id.json`: it is performed
+        under a file lock, so concurrent workers (threads or processes) never share an id.
+        A conversation resumed from a checkpoint keeps the id it was assigned, so that its
+        outputs are completed in the same folders, and a replayed conversation takes the id of its
+        recording, so that its outputs can be compared with the recorded ones.
+
+        Returns:
+            str: The allocated conversation id.
+        """
+        if self.replay_source is not None and self.replay_source.get_conversation_id() is not None:
+            self.conversation_id = self.replay_source.get_conversation_id()
+        elif self.checkpoint is not None and self.checkpoint.get_conversation_id() is not None:
+            self.conversation_id = self.checkpoint.get_conversation_id()
+        else:
+            self.conversation_id = self.id_allocator.allocate_conversation_id()
+            if self.checkpoint is not None:
+                self.checkpoint.set_conversation_id(self.conversation_id)
+        self.iteration_id = "0"
+        self.call_counters = {}
+        self.conversational_rag.invalidate_history_cache() #a conversation manager handles a single conversation at a time
+        return self.conversation_id
+
     def reset_conversation(self):
+        self.id_allocator.reset()
         self.set_conversation_id("0")
 
     def ensure_conversation_path(self) -> str:
         """
         Ensures the existence of a directory path for the current conversation.
-        If the directory does not exist, it is created.
+        If the directory does not exist, it is created (unless the outputs are stored in an event log).
 
         Returns:
             str: The full path to the current conversation's directory.
         """
         current_conversation = f"conversation_{self.get_conversation_id()}"
         full_conversation_path = os.path.join(self.base_path, current_conversation)
-        if not os.path.exists(full_conversation_path):
+        if self.storage_mode != "event_log" and not os.path.exists(full_conversation_path):
             os.makedirs(full_conversation_path)
         return full_conversation_path
 
     def get_iteration_id(self) -> str:
         """
-        Retrieves the `iteration_id` from the JSON file.
+        Retrieves the `iteration_id` of the current conversation.
 
-        This method opens the JSON file in read mode, reads the data,
-        and extracts the value of the `iteration_id` key. If the
-        key does not exist, it defaults to an empty dictionary.
+        Iteration ids are local to a conversation and are kept in memory.
 
         Returns:
-            str: The value of the `iteration_id` attribute, or an
-                 empty dictionary if not found.
+            str: The value of the `iteration_id` attribute.
         """
-        with open(self.conversation_manager_path, "r") as iteration_file:
-            iteration_data = json.load(iteration_file)
-            self.iteration_id = iteration_data.get("iteration_id", {})
-            return self.iteration_id
+        return self.iteration_id
 
     def set_iteration_id(self, new_iteration_id: str) -> None:
-        """
-        Updates the `iteration_id` in the JSON file with a new value.
-
-        This method reads the existing JSON data from the file, updates
-        the value of the `iteration_id` key, and then writes the updated
-        data back to the file.
-
-        Args:
-            new_iteration_id (str): The new value to assign to the
-                                       `iteration_id` key.
-        """
-        with open(self.conversation_manager_path, "r") as read_iteration_file:
-            iteration_data = json.load(read_iteration_file)
-            iteration_data["iteration_id"] = new_iteration_id
-
-            with open(self.conversation_manager_path, "w") as write_iteration_file:
-                json.dump(iteration_data, write_iteration_file, indent=4)
+        self.iteration_id = new_iteration_id
 
     def increment_iteration_id(self):
         int_iteration_id = int(self.iteration_id)
@@ -154,17 +192,55 @@ class ConversationManager:
     def ensure_iteration_path(self) -> str:
         """
         Ensures the existence of a directory path for the current iteration within a conversation.
-        If the directory does not exist, it is created.
+        If the directory does not exist, it is created (unless the outputs are stored in an event log).
 
         Returns:
             str: The full path to the current iteration's directory.
         """
         current_iteration = f"conversation_{self.get_conversation_id()}/iteration_{self.get_iteration_id()}"
         full_iteration_path = os.path.join(self.base_path, current_iteration)
-        if not os.path.exists(full_iteration_path):
+        if self.storage_mode != "event_log" and not os.path.exists(full_iteration_path):
             os.makedirs(full_iteration_path)
         return full_iteration_path
 
+    def get_event_log_path(self) -> str:
+        """
+        Returns the path of the event log of the current conversation: a log for each conversation,
+        or a log shared by all the conversations of the process if the scope is "batch".
+        """
+        if self.event_log_scope == "batch":
+            return os.path.join(self.base_path, f"events_{os.getpid()}.jsonl")
+        return os.path.join(self.base_path, f"conversation_{self.conversation_id}.jsonl")
+
+    def write_output(self, relative_path: str, data) -> None:
+        """
+        Writes an output of the current conversation. In the directory storage mode, the output is written
+        in `relative_path` within the conversation's directory (JSON files are indented, other files are
+        written as text). In the event log mode, a record with the same path and data is appended to the
+        event log, which `network.convert_event_log` converts back to the directory layout.
+
+        Args:
+            relative_path (str): The path of the output within the conversation's directory.
+            data: The data to save, serializable as JSON.
+        """
+        if self.storage_mode == "event_log":
+            record = {
+                "conversation_id": self.conversation_id,
+                "iteration_id": self.iteration_id,
+                "file": relative_path,
+                "data": data
+            }
+            get_event_log_writer().append(self.get_event_log_path(), record)
+            return None
+
+        output_file = os.path.join(self.base_path, f"conversation_{self.conversation_id}", relative_path)
+        with open(output_file, "w") as output:
+            if relative_path.endswith(".json"):
+                json.dump(data, output, indent=4)
+            else:
+                output.write(data)
+
+    @traced("save_responses", trace_tags)
     def save_model_responses(self, messages: list[Message]) -> None:
         """
         Saves a list of model responses as a JSON file in the current iteration's directory.
@@ -173,17 +249,14 @@ class ConversationManager:
             messages (list[Message]): The list of messages to save, where each message is expected
             to be an instance of the Message class.
         """
-
-        full_path = os.path.join(self.base_path, f"conversation_{self.get_conversation_id()}/iteration_{self.get_iteration_id()}")
-        output_file = os.path.join(full_path, "responses.json")
         data = {
             "conversation_id": self.conversation_id,
             "iteration_id": self.iteration_id,
-            "responses": messages
+            "responses": [message.to_dict() if isinstance(message, Message) else message for message in messages] #the messages are serialized only here
         }
-        with open(output_file, "w") as output:
-            json.dump(data, output, indent=4)
+        self.write_output(f"iteration_{self.iteration_id}/responses.json", data)
 
+    @traced("save_response", trace_tags)
     def save_non_reviewer_response(self, message, file_name: str) -> None:
         """
         Saves the response of the moderator/feedback agent as a JSON file in the current iteration's directory.
@@ -192,25 +265,153 @@ class ConversationManager:
             message: The messages to save. It is expected to be an instance of the Message class.
             file_name (str): the name of the json file in which the response has to be saved
         """
-        full_path = os.path.join(self.base_path, f"conversation_{self.get_conversation_id()}/iteration_{self.get_iteration_id()}")
-        saving_file = os.path.join(full_path, f"{file_name}.json")
         data = {
             "conversation_id": self.conversation_id,
             "iteration_id": self.iteration_id,
             "response": [message]
         }
-        with open(saving_file, "w") as output:
-            json.dump(data, output, indent=4)
+        self.write_output(f"iteration_{self.iteration_id}/{file_name}.json", data)
 
+    @traced("save_errors", trace_tags)
     def save_errors(self) -> None:
-        full_path = os.path.join(self.base_path, f"conversation_{self.conversation_id}/iteration_{self.iteration_id}")
-        errors_file = os.path.join(full_path, "errors.txt")
-
-        with open (errors_file, "w") as output:
-            output.write(self.error_logger.from_array_to_text(f"iteration n.{self.iteration_id}"))
+        self.write_output(f"iteration_{self.iteration_id}/errors.txt", self.error_logger.from_array_to_text(f"iteration n.{self.iteration_id}"))
         return None
 
-    def simulate_iteration(self, input_text: str = None) -> None:
+    def get_checkpoint(self) -> CheckpointStore | None:
+        return self.checkpoint
+
+    def set_checkpoint(self, checkpoint: CheckpointStore | None) -> None:
+        self.checkpoint = checkpoint
+
+    def get_replay_source(self) -> ReplaySource | None:
+        return self.replay_source
+
+    def set_replay_source(self, replay_source: ReplaySource | None) -> None:
+        self.replay_source = replay_source
+
+    def replay_agent_call(self, agent: AgentBase, call_key: str) -> str | None:
+        """
+        Answers the call with its recorded response, restoring the recorded usage in the agent.
+        The prompt is still assembled, so that replaying measures the whole orchestration except
+        the provider. A call without a recorded response fails, as it did in the recorded run.
+        """
+        agent.prepare_payload()
+        call = self.replay_source.get_call(call_key)
+        if call is None:
+            agent.set_last_usage(None)
+            agent.set_error_logger(agent.get_error_logger() + [f"Replay ({agent.get_name()}): no recorded response for the call {call_key}."])
+            return None
+        agent.set_last_usage(call["usage"])
+        return call["response"]
+
+    def reserve_call_key(self, agent: AgentBase, phase: str) -> str:
+        """
+        Returns the key of the next call of the agent in the given phase of the current iteration.
+        The keys are reserved in the order in which the calls are issued, which is deterministic
+        also when the reviewers are queried concurrently.
+        """
+        counter_key = (self.iteration_id, phase, agent.get_name())
+        call_number = self.call_counters.get(counter_key, 0)
+        self.call_counters[counter_key] = call_number + 1
+        return CheckpointStore.make_key(self.iteration_id, phase, agent.get_name(), call_number)
+
+    def restore_agent_call(self, agent: AgentBase, call_key: str) -> str | None:
+        """
+        Returns the response of the call if it was already completed according to the checkpoint, and
+        restores its usage in the agent (marked as resumed, so it is not charged twice).
+        """
+        if self.checkpoint is None:
+            return None
+        call = self.checkpoint.get_call(call_key)
+        if call is None:
+            return None
+        agent.set_last_usage({**call["usage"], "resumed": True} if call["usage"] is not None else None)
+        return call["response"]
+
+    def checkpoint_agent_call(self, agent: AgentBase, call_key: str, response: str | None) -> None:
+        if self.checkpoint is not None and response is not None:
+            self.checkpoint.record_call(call_key, response, agent.get_last_usage())
+
+    async def acall_agent(self, agent: AgentBase, call_key: str) -> str | None:
+        """
+        Queries the agent, unless the call was already completed according to the checkpoint or the
+        conversation is replayed from a recording. Every agent call of the conversation goes through this method.
+        If a request semaphore is set, the request waits for a free slot, so that the requests in flight are
+        capped across all the conversations sharing the semaphore (see `aquery_agent`).
+
+        Args:
+            agent (AgentBase): The agent to query, whose prompt has already been prepared.
+            call_key (str): The key returned by `reserve_call_key`.
+
+        Returns:
+            str | None: The response of the agent, or None if the request failed.
+        """
+        if self.replay_source is not None:
+            return self.replay_agent_call(agent, call_key)
+        response = self.restore_agent_call(agent, call_key)
+        if response is not None:
+            return response
+        response = await self.aquery_agent(agent)
+        if self.checkpoint is not None:
+            await asyncio.to_thread(self.checkpoint_agent_call, agent, call_key, response) #the call is appended to the checkpoint's journal
+        return response
+
+    @traced("query_model", lambda conversation_manager, agent: {"agent": agent.get_name(), "model": agent.model})
+    async def aquery_agent(self, agent: AgentBase) -> str | None:
+        """
+        Queries the agent like `AgentBase.query_model`, executing the steps of its request (see
+        `AgentBase.request_attempts`) in worker threads, within the request semaphore. The waits for the
+        rate limiter and between the attempts are awaited outside the semaphore, so throttled requests
+        keep neither a request slot nor a worker thread from the other requests.
+
+        Returns:
+            str | None: The response of the agent, or None if the request failed.
+        """
+        attempts = agent.request_attempts()
+        while True:
+            finished, result = await self.arun_request(agent.advance_request, attempts)
+            if finished:
+                return result
+            await asyncio.sleep(result)
+
+    def get_request_semaphore(self) -> asyncio.Semaphore | None:
+        return self.request_semaphore
+
+    def set_request_semaphore(self, request_semaphore: asyncio.Semaphore | None) -> None:
+        self.request_semaphore = request_semaphore
+
+    async def arun_request(self, function, *args):
+        """
+        Executes a blocking function that sends requests to the providers (the query of an agent, or the
+        embedding and vector store requests of the RAG) in a worker thread. If a request semaphore is set,
+        the function waits for a free slot, so that every request of the conversations sharing the
+        semaphore is capped.
+        """
+        if self.request_semaphore is None:
+            return await asyncio.to_thread(function, *args)
+        async with self.request_semaphore:
+            return await asyncio.to_thread(function, *args)
+
+    def record_agent_usage(self, agent: AgentBase) -> None:
+        """
+        Records the token usage of the last call of the agent, tagged with the current conversation and iteration.
+        """
+        self.usage_tracker.record(self.conversation_id, self.iteration_id, agent.get_name(), agent.get_last_usage())
+
+    @traced("save_usage", trace_tags)
+    def save_usage(self) -> None:
+        """
+        Saves the token usage and the estimated cost of the current iteration in `usage.json`, next to
+        `responses.json`, and the ones of the whole conversation in the conversation's directory.
+        """
+        self.write_output(f"iteration_{self.iteration_id}/usage.json", self.usage_tracker.get_iteration_usage(self.conversation_id, self.iteration_id))
+        self.write_output("usage.json", self.usage_tracker.get_conversation_usage(self.conversation_id))
+
+    def get_usage_tracker(self) -> UsageTracker:
+        return self.usage_tracker
+
+    @traced("iteration", trace_tags)
+    async def asimulate_iteration(self, input_text: str = None) -> None:
         """
         This method orchestrates the entire conversation flow, simulating
         a full iteration of the conversation process, consisting of an
@@ -218,70 +419,68 @@ class ConversationManager:
         After completing all rounds, it saves the generated responses from the model
         and resets the messages for the next iteration.
 
+        If `concurrent_reviewers` is enabled, in every round the reviewers are queried concurrently,
+        so the latency of a round is bound by the slowest reviewer instead of the sum of all the
+        reviewers' latencies; otherwise they are queried one after the other.
+        The responses are added to the conversation's history in the same order in which the
+        reviewers are configured, hence the saved history is deterministic.
+
         Args:
             input_text (str, optional): The input text to initiate the conversation.
-            If not provided (None), a default or pre-existing input will be used.
-            This input serves as the starting point for the conversation iteration.
 
         Returns:
             None
         """
-
-        self.initial_review_selection(input_text)
+        await self.ainitial_review_selection(input_text)
         if self.error_state:
             return None
         for i in range(0, self.messages_per_iteration):
-            self.subsequent_rounds(input_text)
+            await self.asubsequent_rounds(input_text)
             if self.error_state:
                 return None
 
-        self.save_model_responses(self.conversation.get_history())
+        await asyncio.to_thread(self.save_model_responses, self.conversation.get_history())
         self.reset_iteration_messages()
 
-    def initial_review_selection(self, input_text):
+    @traced("rag_retrieve", trace_tags)
+    def retrieve_rag_content(self) -> list[str] | str | None:
         """
-            Performs the initial review selection process by querying the designated reviewers
-            and retrieving relevant RAG (retrieval-augmented generation) content if applicable.
-
-            The function first checks whether the current iteration is not the initial one.
-            If it's not the first iteration, it attempts to retrieve the full RAG content
-            from the conversation history. If retrieval fails, an error is logged, and the
-            iteration is reset. For each reviewer, the function sets the full prompt based
-            on the input text, and if applicable, the retrieved RAG content.
-            It then sends the full prompt to the reviewer's model and handles the response.
+        Retrieves the RAG content of the current conversation.
 
-            If a response is received, it is added as a message to the history conversation.
-            If no response is received or an error occurs, an error message is logged.
+        During the first iteration there is nothing to retrieve, so an empty string is returned.
+        If the retrieval fails, the simulation is stopped and None is returned.
 
-            Args:
-                input_text (str): The text to be reviewed and sent to the reviewers.
-
-            Raises:
-                RetrievalRAGException: If RAG content retrieval fails during a non-initial iteration.
-            """
+        Returns:
+            list[str] | str | None: The retrieved RAG content, an empty string during the first
+            iteration or None if the retrieval failed.
+        """
         rag_content = ""
         if self.iteration_id != "0":
-            rag_content = self.conversational_rag.retrieve_full_history(self.conversation_id)
+            rag_content = self.conversational_rag.retrieve_full_history(self.conversation_id, int(self.iteration_id))
             if rag_content is None:
                 self.stop_simulation(f"Unable to retrieve RAG's content during the iteration number {self.iteration_id}.")
                 return None
                 #raise RetrievalRAGException(f"Unable to retrieve RAG's content during the iteration number {self.iteration_id}.")
+        return rag_content
 
-        for reviewer in self.reviewers:
-            if self.iteration_id != "0":
-                reviewer.set_additional_context(rag_content)
-                reviewer.set_input_problem(input_text)
-            else:
-                reviewer.set_input_problem(input_text)
-            reviewer_response = reviewer.query_model()
-            if reviewer_response is None:
-                self.error_logger.add_error(f"An error occurred while communicating with {reviewer.get_name()} during the first step.")
-                self.from_agent_get_errors(reviewer, "  ")
-                reviewer.set_error_logger([])
-            elif reviewer_response is not None:
-                message = Message(reviewer.get_name(), reviewer_response)
-                self.conversation.add_message(message)
+    def prepare_initial_review(self, reviewer, input_text, rag_content) -> None:
+        if self.iteration_id != "0":
+            reviewer.set_additional_context(rag_content)
+            reviewer.set_input_problem(input_text)
+        else:
+            reviewer.set_input_problem(input_text)
+
+    def handle_initial_review_response(self, reviewer, reviewer_response) -> None:
+        self.record_agent_usage(reviewer)
+        if reviewer_response is None:
+            self.error_logger.add_error(f"An error occurred while communicating with {reviewer.get_name()} during the first step.")
+            self.from_agent_get_errors(reviewer, "  ")
+            reviewer.set_error_logger([])
+        elif reviewer_response is not None:
+            message = Message(reviewer.get_name(), reviewer_response)
+            self.conversation.add_message(message)
 
+    def human_initial_review(self, input_text, rag_content) -> None:
         if self.human_flag == True and self.human_role == "reviewer":
             print("   >>> Now it's your turn as Reviewer.")
             print(f"   >>> Additional RAG informations are is: {rag_content}")
@@ -290,54 +489,68 @@ class ConversationManager:
             message = Message("Human Reviewer", reviewer_response)
             self.conversation.add_message(message)
 
-    def subsequent_rounds(self, input_text) -> None:
+    @traced("initial_review", trace_tags)
+    async def ainitial_review_selection(self, input_text):
         """
-        Conducts subsequent review rounds by querying reviewers with the updated conversation history.
+        Performs the initial review selection process by querying the designated reviewers
+        and retrieving relevant RAG (retrieval-augmented generation) content if applicable.
 
-        This function iterates over the list of reviewers, updating their prompts with the
-        conversation history (and potentially RAG content). Each reviewer is allowed to respond
-        once per iteration. If a reviewer fails to respond or encounters an error, an error is logged,
-        and the process continues. This ensures the review process proceeds even if individual reviewers
-        do not provide a response.
+        The function first checks whether the current iteration is not the initial one.
+        If it's not the first iteration, it attempts to retrieve the full RAG content
+        from the conversation history. If retrieval fails, an error is logged, and the
+        iteration is reset. For each reviewer, the function sets the full prompt based
+        on the input text, and if applicable, the retrieved RAG content.
+        It then sends the full prompt to the reviewer's model and handles the response.
+
+        If a response is received, it is added as a message to the history conversation.
+        If no response is received or an error occurs, an error message is logged.
 
-        The number of iterations and the number of responses per reviewer are currently limited to 1
-        but can be adjusted in the future based on system capabilities.
+        If `concurrent_reviewers` is enabled, all the reviewers are queried concurrently and their
+        responses are added to the history in the reviewers' order, otherwise they are queried one
+        after the other.
 
         Args:
             input_text (str): The text to be reviewed and sent to the reviewers.
-
-        Returns:
-            None
-
-        Raises:
-            RetrievalRAGException: If the RAG content retrieval fails during a non-initial iteration.
         """
-        rag_content = ""
-        if self.iteration_id != "0":
-            rag_content = self.conversational_rag.retrieve_full_history(self.conversation_id)
-            if rag_content is None:
-                self.stop_simulation(f"Unable to retrieve RAG's content during the iteration number {self.iteration_id}.")
-                return None
-                #raise RetrievalRAGException(f"Unable to retrieve RAG's content during the iteration number {self.iteration_id}.")
+        rag_content = await self.arun_request(self.retrieve_rag_content) #the vector store is queried without blocking the event loop
+        if rag_content is None:
+            return None
 
-        for reviewer in self.reviewers:
-            if self.iteration_id != "0":
-                integrated_data = self.integrate_rag_and_history(rag_content, self.conversation.get_history())
-                reviewer.set_additional_context(integrated_data)
-                reviewer.set_input_problem(input_text)
-            else:
-                reviewer.set_additional_context(self.conversation.get_history())
-                reviewer.set_input_problem(input_text)
-            reviewer_response = reviewer.query_model()
-            if reviewer_response is None:
-                self.error_logger.add_error(f"An error occurred wile trying to communicate with {reviewer.get_name()}.")
-                self.from_agent_get_errors(reviewer, "  ")
-                reviewer.set_error_logger([])
-                reviewer_response = "" #the reviewers' messages are non-blocking: if a reviewer does not respond, the conversation will continue
-            reviewer.increment_iteration_messages()
-            message = Message(reviewer.get_name(), reviewer_response)
-            self.conversation.add_message(message)
+        if self.concurrent_reviewers:
+            for reviewer in self.reviewers:
+                self.prepare_initial_review(reviewer, input_text, rag_content)
+            reviewer_responses = await asyncio.gather(*(self.acall_agent(reviewer, self.reserve_call_key(reviewer, "initial_review")) for reviewer in self.reviewers))
+            for reviewer, reviewer_response in zip(self.reviewers, reviewer_responses):
+                self.handle_initial_review_response(reviewer, reviewer_response)
+        else:
+            for reviewer in self.reviewers:
+                self.prepare_initial_review(reviewer, input_text, rag_content)
+                reviewer_response = await self.acall_agent(reviewer, self.reserve_call_key(reviewer, "initial_review"))
+                self.handle_initial_review_response(reviewer, reviewer_response)
+
+        self.human_initial_review(input_text, rag_content)
 
+    def prepare_subsequent_round(self, reviewer, input_text, rag_content) -> None:
+        if self.iteration_id != "0":
+            integrated_data = self.integrate_rag_and_history(rag_content, self.conversation.get_rendered_history())
+            reviewer.set_additional_context(integrated_data)
+            reviewer.set_input_problem(input_text)
+        else:
+            reviewer.set_additional_context(self.conversation.get_rendered_history())
+            reviewer.set_input_problem(input_text)
+
+    def handle_subsequent_round_response(self, reviewer, reviewer_response) -> None:
+        self.record_agent_usage(reviewer)
+        if reviewer_response is None:
+            self.error_logger.add_error(f"An error occurred wile trying to communicate with {reviewer.get_name()}.")
+            self.from_agent_get_errors(reviewer, "  ")
+            reviewer.set_error_logger([])
+            reviewer_response = "" #the reviewers' messages are non-blocking: if a reviewer does not respond, the conversation will continue
+        reviewer.increment_iteration_messages()
+        message = Message(reviewer.get_name(), reviewer_response)
+        self.conversation.add_message(message)
+
+    def human_subsequent_round(self, input_text, rag_content) -> None:
         if self.human_flag == True and self.human_role == "reviewer":
             print("   >>> Now it's your turn as Reviewer.")
             print(f"   >>> The conversation is: {self.conversation.get_history()}")
@@ -347,6 +560,43 @@ class ConversationManager:
             message = Message("Human Reviewer", reviewer_response)
             self.conversation.add_message(message)
 
+    @traced("subsequent_round", trace_tags)
+    async def asubsequent_rounds(self, input_text) -> None:
+        """
+        Conducts subsequent review rounds by querying reviewers with the updated conversation history.
+
+        This function iterates over the list of reviewers, updating their prompts with the
+        conversation history (and potentially RAG content). Each reviewer is allowed to respond
+        once per iteration. If a reviewer fails to respond or encounters an error, an error is logged,
+        and the process continues. This ensures the review process proceeds even if individual reviewers
+        do not provide a response.
+
+        If `concurrent_reviewers` is enabled, every reviewer of the round receives the history as it
+        was at the beginning of the round, since all of them are queried at the same time, and the
+        responses are added to the history in the reviewers' order. Otherwise the reviewers are queried
+        one after the other, and every reviewer sees the replies of the previous ones.
+
+        Args:
+            input_text (str): The text to be reviewed and sent to the reviewers.
+        """
+        rag_content = await self.arun_request(self.retrieve_rag_content) #the vector store is queried without blocking the event loop
+        if rag_content is None:
+            return None
+
+        if self.concurrent_reviewers:
+            for reviewer in self.reviewers:
+                self.prepare_subsequent_round(reviewer, input_text, rag_content)
+            reviewer_responses = await asyncio.gather(*(self.acall_agent(reviewer, self.reserve_call_key(reviewer, "subsequent_round")) for reviewer in self.reviewers))
+            for reviewer, reviewer_response in zip(self.reviewers, reviewer_responses):
+                self.handle_subsequent_round_response(reviewer, reviewer_response)
+        else:
+            for reviewer in self.reviewers:
+                self.prepare_subsequent_round(reviewer, input_text, rag_content)
+                reviewer_response = await self.acall_agent(reviewer, self.reserve_call_key(reviewer, "subsequent_round"))
+                self.handle_subsequent_round_response(reviewer, reviewer_response)
+
+        self.human_subsequent_round(input_text, rag_content)
+
     def simulate_conversation(self, cr_task: str = None, input_text: str = None) -> None:
         """
         Simulates a conversation process for a given change request task and input text over multiple iterations.
@@ -366,68 +616,86 @@ class ConversationManager:
         Returns:
             None
 
+        Raises:
+            RuntimeError: If it is called from a running event loop (e.g. in IPython or Jupyter), where the
+            conversation has to be awaited with `asimulate_conversation`.
+
         Notes:
             - The simulation process involves multiple iterations, and the stopping condition must be explicitly checked.
             - The conversation and iteration folder paths are ensured before each iteration.
             - The simulation proceeds for a maximum of n iterations unless the stopping condition is satisfied earlier.
             - Errors encountered during the simulation are logged and saved.
-            - The iteration ID is incremented with each cycle, and the conversation ID is incremented once the simulation is complete.
-            - The `simulate_iteration` method is used to simulate each iteration based on the current input text and summarized history.
+            - A unique conversation ID is allocated when the simulation starts and the iteration ID is incremented with each cycle.
+            - The iterations are driven by the state machine of `asimulate_conversation`, run in a new event loop, so the
+              conversation executes the same phases whether it runs alone or interleaved with other conversations.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.run(self.asimulate_conversation(cr_task, input_text)) #the conversation's span is traced by asimulate_conversation
+            return None
+        raise RuntimeError("simulate_conversation cannot be called from a running event loop (e.g. in IPython or Jupyter): await asimulate_conversation instead.")
+
+    @traced("conversation", lambda conversation_manager, *args, **kwargs: {"cr_name": conversation_manager.cr_name})
+    async def asimulate_conversation(self, cr_task: str = None, input_text: str = None) -> None:
         """
+        Simulates the conversation from a running event loop. It is driven by `simulate_conversation`
+        for a single conversation, and used to interleave many conversations in a single event loop
+        (see `ConversationScheduler`).
 
-        self.ensure_conversation_path() #ensures that the conversation's folder path exists
+        The conversation is a state machine over its phases:
+            review -> summarization -> feedback -> end of iteration -> review -> ... -> done
+        Every phase awaits the calls of its agents, so while a conversation waits for a response, the
+        event loop advances the phases of the other conversations. After the review of the second
+        iteration, the conversation jumps to the end of the iteration if the reviewers are satisfied.
+        An error in any phase ends the conversation, saving its errors and usage.
 
+        Args:
+            cr_task (str, optional): The description of the change request task to be simulated.
+            input_text (str, optional): The current problem or input text that the conversation is centered around.
+        """
+        await asyncio.to_thread(self.allocate_conversation_id) #the allocation waits for a file lock
+        await asyncio.to_thread(self.ensure_conversation_path)
         print(f"(conversation {self.conversation_id}): Starting the execution of CRANE for {self.cr_name}")
-        print(f"   Entering in the iteration number {self.get_iteration_id()}")
-        self.ensure_iteration_path() #ensures that the iteration's folder path exists
-        self.simulate_iteration(f"CHANGE REQUEST TASK: {cr_task}; Current problem: {input_text}") #simulates the iteration
-        if self.error_state:
-            self.save_errors()
-            self.increment_conversation_id()
-            return None
-        summarized_history = self.summarize_iteration_history()  # summarizes the previous iteration's history
-        if self.error_state:
-            self.save_errors()
-            self.increment_conversation_id()
-            return None
-        current_input_text = self.fetch_model_feedback(summarized_history, input_text)  # provides the summarized history as a feedback to the model
-        if self.error_state:
-            self.save_errors()
-            self.increment_conversation_id()
-            return None
-        self.save_errors()
-        self.increment_iteration_id()
-
-        i = 0
-        while i < 1 and self.stopping_condition == False:
-            print(f"   Entering in the iteration number {self.get_iteration_id()}")
-            self.error_logger.reset_errors()
-            self.ensure_iteration_path() # ensures that the iteration's folder path exists
-            self.simulate_iteration(f"### CR_TASK \n{cr_task}\n\n ### Code snippet\n{current_input_text}")  # simulates the iteration
-            if self.error_state:
-                self.save_errors()
-                self.increment_conversation_id()
-                return None
-            self.check_stopping_condition()  # checks if the stopping condition is reached
-            if not self.stopping_condition:
-                summarized_history = self.summarize_iteration_history()  # summarizes the previous iteration's history
-                if self.error_state:
-                    self.save_errors()
-                    self.increment_conversation_id()
-                    return None
-                current_input_text = self.fetch_model_feedback(summarized_history, current_input_text)  # provides the summarized history as a feedback to the model
+
+        max_iterations = 2
+        completed_iterations = 0
+        current_input_text = input_text
+        summarized_history = None
+        phase = "review"
+        while phase != "done":
+            if phase == "review":
+                print(f"   Entering in the iteration number {self.get_iteration_id()}")
+                if completed_iterations == 0:
+                    review_input = f"CHANGE REQUEST TASK: {cr_task}; Current problem: {current_input_text}"
+                else:
+                    self.error_logger.reset_errors()
+                    review_input = f"### CR_TASK \n{cr_task}\n\n ### Code snippet\n{current_input_text}"
+                await asyncio.to_thread(self.ensure_iteration_path)
+                await self.asimulate_iteration(review_input)
+                if completed_iterations > 0 and not self.error_state:
+                    self.check_stopping_condition()
+                phase = "end_of_iteration" if self.error_state or self.stopping_condition else "summarization"
+            elif phase == "summarization":
+                summarized_history = await self.asummarize_iteration_history()
+                phase = "end_of_iteration" if self.error_state else "feedback"
+            elif phase == "feedback":
+                current_input_text = await self.afetch_model_feedback(summarized_history, current_input_text)
+                phase = "end_of_iteration"
+            elif phase == "end_of_iteration":
+                await asyncio.to_thread(self.save_errors) #the files are written without blocking the event loop
+                await asyncio.to_thread(self.save_usage)
                 if self.error_state:
-                    self.save_errors()
-                    self.increment_conversation_id()
                     return None
-            self.save_errors()
-            self.increment_iteration_id()
-            i=i+1
+                self.increment_iteration_id()
+                completed_iterations = completed_iterations + 1
+                phase = "done" if completed_iterations == max_iterations or self.stopping_condition else "review"
 
-        self.increment_conversation_id()
+        self.conversational_rag.invalidate_history_cache(self.conversation_id) #the history of a completed conversation is not needed anymore
         self.reset_iteration()
 
-    def fetch_model_feedback(self, summarized_history, input_text) -> str | None:
+    @traced("feedback", trace_tags)
+    async def afetch_model_feedback(self, summarized_history, input_text) -> str | None:
         """
         Fetches feedback from the model based on the reviewers' suggestions and history.
 
@@ -448,31 +716,48 @@ class ConversationManager:
             FeedbackException: If the feedback agent fails to provide a valid response after the maximum number of retries.
         """
         if self.human_flag == True and self.human_role == "feedback_agent":
-            print("   >>> Now it's your turn as Feedback Agent.")
-            print(f"   >>> The Summary of Suggestions is: \n {summarized_history}")
-            print(f"   >>> The problem is: {input_text}")
-            feedback_response = input("   >>> Answer:")
-            feedback_message = Message("Human Feedback Agent", feedback_response)
-            self.save_non_reviewer_response(feedback_message.to_dict(), f"change_{self.cr_name}")
-            return feedback_response
-        else:
-            self.feedback_agent.set_additional_context(f"  ## Summary of Suggestions\n{summarized_history}\n\n")
-            self.feedback_agent.set_input_problem(f"  ## Current problem\n{input_text}")
-            for i in range(0, self.max_retries):
-                feedback_response = self.feedback_agent.query_model()
-                if feedback_response is None:
-                    self.error_logger.add_error(f"Attempt {i}: An error occurred while communicating with the feedback agent.")
-                    self.from_agent_get_errors(self.feedback_agent, "   ")
-                    self.feedback_agent.set_error_logger([])
-                elif feedback_response is not None:
-                    feedback_message = Message(self.feedback_agent.get_name(), feedback_response)
-                    self.save_non_reviewer_response(feedback_message.to_dict(), f"change_{self.cr_name}")
-                    return feedback_response
-            self.stop_simulation(f"The feedback agent failed to provide a valid response after {self.max_retries} attempts.")
-            return None
+            return self.human_feedback(summarized_history, input_text)
+        self.prepare_feedback(summarized_history, input_text)
+        for i in range(0, self.max_retries):
+            feedback_response = await self.acall_agent(self.feedback_agent, self.reserve_call_key(self.feedback_agent, "feedback"))
+            if await asyncio.to_thread(self.handle_feedback_response, i, feedback_response): #the change is saved without blocking the event loop
+                return feedback_response
+        self.stop_simulation(f"The feedback agent failed to provide a valid response after {self.max_retries} attempts.")
+        return None
         #raise FeedbackException(f"The feedback agent failed to provide a valid response after {self.max_retries} attempts.")
 
-    def summarize_iteration_history(self) -> str | None:
+    def human_feedback(self, summarized_history, input_text) -> str:
+        print("   >>> Now it's your turn as Feedback Agent.")
+        print(f"   >>> The Summary of Suggestions is: \n {summarized_history}")
+        print(f"   >>> The problem is: {input_text}")
+        feedback_response = input("   >>> Answer:")
+        feedback_message = Message("Human Feedback Agent", feedback_response)
+        self.save_non_reviewer_response(feedback_message.to_dict(), f"change_{self.cr_name}")
+        return feedback_response
+
+    def prepare_feedback(self, summarized_history, input_text) -> None:
+        self.feedback_agent.set_additional_context(f"  ## Summary of Suggestions\n{summarized_history}\n\n")
+        self.feedback_agent.set_input_problem(f"  ## Current problem\n{input_text}")
+
+    def handle_feedback_response(self, attempt: int, feedback_response: str | None) -> bool:
+        """
+        Handles an attempt of the feedback agent: a valid response is saved as the change of the CR.
+
+        Returns:
+            bool: True if the response is valid, False if the feedback agent has to be queried again.
+        """
+        self.record_agent_usage(self.feedback_agent)
+        if feedback_response is None:
+            self.error_logger.add_error(f"Attempt {attempt}: An error occurred while communicating with the feedback agent.")
+            self.from_agent_get_errors(self.feedback_agent, "   ")
+            self.feedback_agent.set_error_logger([])
+            return False
+        feedback_message = Message(self.feedback_agent.get_name(), feedback_response)
+        self.save_non_reviewer_response(feedback_message.to_dict(), f"change_{self.cr_name}")
+        return True
+
+    @traced("summarization", trace_tags)
+    async def asummarize_iteration_history(self) -> str | None:
         """
         Summarizes the iteration's history using the moderator.
 
@@ -484,6 +769,9 @@ class ConversationManager:
         of attempts. If all attempts fail, an error is logged, the iteration is reset, and an
         exception is raised.
 
+        The summary is saved in the RAG in a worker thread, so that the event loop keeps serving the
+        other conversations, and within the request semaphore, since saving it sends the embedding request.
+
         Returns:
             str: The summarized response from the moderator model. If no valid response is obtained after retries,
             an empty string is returned.
@@ -492,41 +780,67 @@ class ConversationManager:
             SummarizationException: If the moderator fails to provide a valid response after the maximum number of retries.
             SaveRAGException: If saving the summarized history to RAG fails after a successful summarization.
         """
-        summarized_response = ""
         if self.human_flag == True and self.human_role == "moderator":
-            print(f"   >>> Now it's your turn as Moderator.")
-            print(f"   >>> The Suggestions are {self.conversation.get_history()}")
-            summarized_response = input(f"   >>> Answer:")
-            moderator_message = Message("Human Moderator", summarized_response)
-            self.save_non_reviewer_response(moderator_message.to_dict(), "summary")
-            self.conversation.set_history([])  # if the history is correctly summarized, the iteration's history will be deleted leaving space for the new one
-            save_state = self.conversational_rag.save_iteration(self.conversation_id, self.iteration_id,summarized_response)
-            if save_state == 0:
-                self.stop_simulation(f"Failed to save messages to RAG (iteration_id={self.iteration_id}).")
-                return None
-                # raise SaveRAGException(f"Failed to save messages to RAG (iteration_id={self.iteration_id}).")
-            return summarized_response
-        else:
-            self.moderator.set_input_problem(self.conversation.get_history())
-            for i in range(0, self.max_retries):
-                summarized_response = self.moderator.query_model()
-                if summarized_response is None:
-                    self.error_logger.add_error(f"Attempt {i}: An error occurred while communicating with the moderator during the summarization of the input.")
-                    self.from_agent_get_errors(self.moderator, "   ")
-                    self.moderator.set_error_logger([])
-                elif summarized_response is not None:
-                    moderator_message = Message(self.moderator.get_name(), summarized_response)
-                    self.save_non_reviewer_response(moderator_message.to_dict(), "summary")
-                    self.conversation.set_history([]) #if the history is correctly summarized, the iteration's history will be deleted leaving space for the new one
-                    save_state = self.conversational_rag.save_iteration(self.conversation_id, self.iteration_id, summarized_response)
-                    if save_state == 0:
-                        self.stop_simulation(f"Failed to save messages to RAG (iteration_id={self.iteration_id}).")
-                        return None
-                        #raise SaveRAGException(f"Failed to save messages to RAG (iteration_id={self.iteration_id}).")
-                    return summarized_response
-            self.stop_simulation(f"The moderator failed to provide a valid response after {self.max_retries} attempts.")
+            return self.human_summarization()
+        self.prepare_summarization()
+        for i in range(0, self.max_retries):
+            summarized_response = await self.acall_agent(self.moderator, self.reserve_call_key(self.moderator, "summarization"))
+            if await self.arun_request(self.handle_summarization_response, i, summarized_response):
+                return None if self.error_state else summarized_response
+        self.stop_simulation(f"The moderator failed to provide a valid response after {self.max_retries} attempts.")
+        return None
+        #raise SummarizationException(f"The moderator failed to provide a valid response after {self.max_retries} attempts.")
+
+    def human_summarization(self) -> str | None:
+        print(f"   >>> Now it's your turn as Moderator.")
+        print(f"   >>> The Suggestions are {self.conversation.get_history()}")
+        summarized_response = input(f"   >>> Answer:")
+        moderator_message = Message("Human Moderator", summarized_response)
+        self.save_non_reviewer_response(moderator_message.to_dict(), "summary")
+        self.conversation.set_history([])  # if the history is correctly summarized, the iteration's history will be deleted leaving space for the new one
+        save_state = self.conversational_rag.save_iteration(self.conversation_id, self.iteration_id,summarized_response)
+        if save_state == 0:
+            self.stop_simulation(f"Failed to save messages to RAG (iteration_id={self.iteration_id}).")
+            return None
+            # raise SaveRAGException(f"Failed to save messages to RAG (iteration_id={self.iteration_id}).")
+        return summarized_response
+
+    def prepare_summarization(self) -> None:
+        """
+        Passes the iteration's history to the moderator as its input problem. If the moderator has a
+        token budget, the history is passed as its additional context instead, which the context assembler
+        fits within the budget (the input problem is never reduced), and the input problem is a short
+        summarization request.
+        """
+        if self.moderator.get_context_assembler() is None:
+            self.moderator.set_input_problem(self.conversation.get_rendered_history())
             return None
-            #raise SummarizationException(f"The moderator failed to provide a valid response after {self.max_retries} attempts.")
+        self.moderator.set_additional_context(self.conversation.get_rendered_history())
+        self.moderator.set_input_problem("Summarize the feedback given by the reviewers in the conversation history of this iteration.")
+
+    def handle_summarization_response(self, attempt: int, summarized_response: str | None) -> bool:
+        """
+        Handles an attempt of the moderator to summarize the iteration: a valid summary is saved,
+        the iteration's history is cleared and the summary is saved in the RAG.
+
+        Returns:
+            bool: True if no other attempt is needed (the summary was saved, or the simulation was stopped
+            because the RAG failed), False if the moderator has to be queried again.
+        """
+        self.record_agent_usage(self.moderator)
+        if summarized_response is None:
+            self.error_logger.add_error(f"Attempt {attempt}: An error occurred while communicating with the moderator during the summarization of the input.")
+            self.from_agent_get_errors(self.moderator, "   ")
+            self.moderator.set_error_logger([])
+            return False
+        moderator_message = Message(self.moderator.get_name(), summarized_response)
+        self.save_non_reviewer_response(moderator_message.to_dict(), "summary")
+        self.conversation.set_history([]) #if the history is correctly summarized, the iteration's history will be deleted leaving space for the new one
+        save_state = self.conversational_rag.save_iteration(self.conversation_id, self.iteration_id, summarized_response)
+        if save_state == 0:
+            self.stop_simulation(f"Failed to save messages to RAG (iteration_id={self.iteration_id}).")
+            #raise SaveRAGException(f"Failed to save messages to RAG (iteration_id={self.iteration_id}).")
+        return True
 
     def check_stopping_condition(self) -> None:
         """
@@ -535,7 +849,7 @@ class ConversationManager:
         Returns:
             bool: returns True if the stopping condition has been met.
         """
-        if all(message["content"] == "Another round is not needed." for message in self.conversation.get_history()):
+        if all(message.get_content() == self.stop_sentence for message in self.conversation.get_history()):
             self.stopping_condition = True
         else:
             self.stopping_condition = False
@@ -567,23 +881,27 @@ class ConversationManager:
 
         Converts each RAG (Retrieval-Augmented Generation) content item into a message
         format consistent with the conversation history, labeling the sender as "RAG".
-        The new RAG messages are then appended to the existing history.
+        The new RAG messages are then appended to the existing history. The RAG messages are
+        rendered once for each retrieved content and reused by every reviewer and round.
 
         Args:
             rag_content (list): A list of strings representing content retrieved via RAG.
-            history (list): A list of existing message dictionaries in the format
+            history (RenderedHistory | list): The existing messages, in the format
                             [{"sender": str, "content": str}, ...].
 
         Returns:
-            list: A combined list of message dictionaries including the original history
-                  and the newly formatted RAG content.
+            RenderedHistory | list: The original history followed by the formatted RAG content.
         """
-        rag_as_history = [{"sender": "RAG", "content": content} for content in rag_content]
-        integrated_data = history + rag_as_history
-        return integrated_data
+        if rag_content != self.rendered_rag_content:
+            self.rendered_rag = RenderedHistory.from_items({"sender": "RAG", "content": content} for content in rag_content)
+            self.rendered_rag_content = rag_content
+        if isinstance(history, RenderedHistory):
+            return history + self.rendered_rag
+        return history + list(self.rendered_rag)
 
     def stop_simulation(self, message: str):
-        self.reset_iteration()
+        #the iteration id is kept, so that the errors and the usage are saved in the failed iteration's folder
+        #(it is reset when the conversation completes or a new conversation id is allocated)
         self.error_logger.add_error(message)
         self.error_state = True
 
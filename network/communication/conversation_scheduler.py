@@ -0,0 +1,94 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ConversationScheduler:
+    """
+    Executes many conversations in a single event loop, interleaving their phases.
+
+    Every conversation is a coroutine (see `ConversationManager.asimulate_conversation`) that awaits
+    the responses of its agents: while a conversation waits, the loop advances the ready phases of
+    the others, so a single process keeps the provider busy with the reviewers of some CRs, the
+    moderator of others and the feedback agent of others at the same time.
+
+    Two limits bound the resources:
+        - `max_in_flight_requests`: requests sent to the providers at the same time, across all the
+          conversations (a semaphore shared by the conversations). The blocking requests are executed
+          by a thread pool of the same size, so no thread is created beyond the cap.
+        - `max_active_conversations`: conversations started and not completed yet. The records are
+          pulled lazily, so only the active conversations are in memory.
+    """
+    def __init__(self, max_in_flight_requests: int, max_active_conversations: int):
+        if max_in_flight_requests < 1 or max_active_conversations < 1:
+            raise ValueError("The limits of the scheduler must be at least 1")
+        self.max_in_flight_requests = max_in_flight_requests
+        self.max_active_conversations = max_active_conversations
+        self.request_semaphore = None #created in the scheduler's event loop
+        self.peak_active_conversations = 0
+
+    def get_request_semaphore(self) -> asyncio.Semaphore | None:
+        return self.request_semaphore
+
+    def get_peak_active_conversations(self) -> int:
+        return self.peak_active_conversations
+
+    async def arun(self, items, process, on_completed) -> None:
+        """
+        Processes every item with the coroutine function `process(item)`, keeping at most
+        `max_active_conversations` of them active, and calls `on_completed(item, result, error)`
+        as soon as each of them completes (in completion order).
+        """
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight_requests, thread_name_prefix="crane-request")
+        loop.set_default_executor(executor) #used by asyncio.to_thread, i.e. by the agents' requests (shut down by asyncio.run)
+        self.request_semaphore = asyncio.Semaphore(self.max_in_flight_requests)
+        items = iter(items)
+        active_tasks = {}
+
+        def start_next_item() -> None:
+            item = next(items, None)
+            if item is not None:
+                active_tasks[asyncio.create_task(process(item))] = item
+                self.peak_active_conversations = max(self.peak_active_conversations, len(active_tasks))
+
+        for _ in range(self.max_active_conversations):
+            start_next_item()
+        while active_tasks:
+            done_tasks, _ = await asyncio.wait(active_tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done_tasks:
+                item = active_tasks.pop(task)
+                if task.exception() is not None:
+                    on_completed(item, None, task.exception())
+                else:
+                    on_completed(item, task.result(), None)
+                start_next_item()
+
+    def execute(self, items, process):
+        """
+        Runs the scheduler's event loop in a background thread, yielding (item, result, error) as the
+        items complete, so that the caller consumes the results like the ones of a thread pool.
+        """
+        completed = queue.Queue()
+        end_of_items = object()
+        scheduler_errors = []
+
+        def run_event_loop() -> None:
+            try:
+                asyncio.run(self.arun(items, process, lambda item, result, error: completed.put((item, result, error))))
+            except BaseException as e:
+                scheduler_errors.append(e)
+            finally:
+                completed.put(end_of_items)
+
+        event_loop_thread = threading.Thread(target=run_event_loop, name="crane-scheduler", daemon=True)
+        event_loop_thread.start()
+        while True:
+            entry = completed.get()
+            if entry is end_of_items:
+                break
+            yield entry
+        event_loop_thread.join()
+        if scheduler_errors:
+            raise scheduler_errors[0]
@@ -1,22 +1,30 @@
 import os
-import openai
-from pinecone import Pinecone
-from network.config import pinecone_key
+from network.communication.embedders.embedder import Embedder
+from network.communication.embedders.embedder_factory import create_embedder
+from network.communication.vector_stores.vector_store import VectorStore
+from network.communication.vector_stores.vector_store_factory import create_vector_store
 from network.utils.error_logger import ErrorLogger
+from network.utils.tracer import traced
 
 class ConversationalRAG:
-    def __init__(self, endpoint):
+    def __init__(self, endpoint, vector_store: VectorStore = None, embedder: Embedder = None, namespace: str = None):
         self.endpoint = endpoint
-        self.pc = Pinecone(api_key=pinecone_key)
-        self.index = self.pc.Index("crane")
-
-        index_stats = self.index.describe_index_stats()
+        self.embedder = create_embedder() if embedder is None else embedder #the embedder is selected by EMBEDDER
+        if vector_store is None:
+            vector_store = create_vector_store(namespace=namespace, dimension=self.embedder.get_dimension()) #the backend is selected by RAG_BACKEND
+        self.vector_store = vector_store
         self.error_logger = ErrorLogger()
 
+        #write-through cache of the histories saved in and retrieved from the vector store
+        self.history_top_k = 10
+        self.history_cache = {} #conversation_id -> list of (iteration, history) in reverse chronological order
+        self.history_cache_hits = 0
+        self.history_cache_misses = 0
+
     def get_embedding(self, text: str) -> list[float]:
         """
-        Generate an embedding vector for the given text using OpenAI's
-        'text-embedding-ada-002' model.
+        Generate an embedding vector for the given text using the configured embedder
+        (by default OpenAI's 'text-embedding-ada-002' model).
 
         Parameters:
             text (str): The input string to be embedded.
@@ -24,15 +32,24 @@ class ConversationalRAG:
         Returns:
             List[float]: A list of floats representing the embedding vector.
         """
-        response = openai.embeddings.create(
-            input=text,
-            model="text-embedding-ada-002"
-        )
-        return response.data[0].embedding
+        return self.embedder.embed([text])[0]
+
+    def get_embeddings(self, texts: list[str]) -> list[list[float]]:
+        """
+        Generate the embedding vectors of many texts with a single request to the embedder.
+        Texts that have already been embedded are read from the embedding cache.
+
+        Parameters:
+            texts (list[str]): The input strings to be embedded.
+
+        Returns:
+            List[List[float]]: One embedding vector for each text, in the same order.
+        """
+        return self.embedder.embed(texts)
 
     def save_iteration(self, conversation: str, iteration: str, full_history: str) -> int:
         """
-        Save a single iteration of a conversation to a Pinecone vector index.
+        Save a single iteration of a conversation to the vector store.
 
         Parameters:
             conversation (str): A unique identifier for the conversation.
@@ -42,64 +59,156 @@ class ConversationalRAG:
         Returns:
             int: 1 if the operation was successful, 0 if an exception occurred.
         """
-        try:
-            vector = [0.1] * 1536  # Dummy vector for now
+        return self.save_iterations(conversation, [(iteration, full_history)])
 
-            response = self.index.upsert(vectors=[(f"{conversation}-{iteration}", vector, {
-                "history": full_history,
-                "iteration": iteration,
-                "conversation_id": conversation
-            })])
+    @traced("rag_save")
+    def save_iterations(self, conversation: str, iterations: list[tuple[str, str]]) -> int:
+        """
+        Save many iterations of a conversation to the vector store, embedding all of them
+        with a single request.
+
+        Parameters:
+            conversation (str): A unique identifier for the conversation.
+            iterations (list[tuple[str, str]]): The (iteration, full_history) pairs to save.
+
+        Returns:
+            int: 1 if the operation was successful, 0 if an exception occurred.
+        """
+        try:
+            vectors = self.get_embeddings([full_history for _, full_history in iterations])
+
+            self.vector_store.upsert([
+                (f"{conversation}-{iteration}", vector, {
+                    "history": full_history,
+                    "iteration": iteration,
+                    "conversation_id": conversation
+                })
+                for (iteration, full_history), vector in zip(iterations, vectors)
+            ])
+            self.update_history_cache(conversation, iterations)
 
             return 1
 
         except Exception as e:
-            self.error_logger.add_error(f"Exception while saving to RAG (iteration_id={iteration}): {str(e)}")
+            iteration_ids = ", ".join(str(iteration) for iteration, _ in iterations)
+            self.error_logger.add_error(f"Exception while saving to RAG (iteration_id={iteration_ids}): {str(e)}")
             return 0
 
     def clear_all_data(self):
         """
-        Delete all vectors from the connected Pinecone index.
+        Delete all vectors from the connected vector store.
 
         This operation irreversibly removes all stored data, including all
         conversation embeddings and associated metadata.
 
         Use with caution, especially in production environments.
         """
-        self.index.delete(delete_all=True)  # This will delete all vectors in the index
+        self.vector_store.delete_all()
+        self.invalidate_history_cache()
 
-    def retrieve_full_history(self, conversation_id: str):
+    @traced("rag_query")
+    def retrieve_full_history(self, conversation_id: str, expected_iterations: int = None):
         """
         Retrieve all stored conversation iterations associated with a given conversation ID.
 
+        The history is kept in a write-through cache: the iterations saved through this object are
+        added to the cached history (creating it), so until the cache of the conversation is invalidated,
+        the calls are answered from memory. A history retrieved from the vector store is cached only if
+        it is complete, since an eventually consistent index may not return the latest iterations yet:
+        an empty history, or one with fewer iterations than expected, is returned but not cached.
+
         Parameters:
             conversation_id (str): The unique identifier for the conversation.
+            expected_iterations (int, optional): The number of iterations already saved for the conversation.
 
         Returns:
             List[str] or None: A list of conversation history entries in reverse chronological
             order if successful, or None if an exception occurs.
         """
+        conversation_id = str(conversation_id)
+        cached_history = self.history_cache.get(conversation_id)
+        if cached_history is not None:
+            self.history_cache_hits = self.history_cache_hits + 1
+            return [history for _, history in cached_history]
+        self.history_cache_misses = self.history_cache_misses + 1
+
         try:
-            # Use a dummy vector for retrieval (same size as stored vectors)
-            query_vector = [0.1] * 1536
-
-            # Query Pinecone with metadata filtering
-            query_result = self.index.query(
-                vector=query_vector,
-                top_k=10,  # Retrieve multiple matches
-                include_metadata=True,
-                namespace="",  # Explicitly set default namespace
-                filter={"conversation_id": {"$eq": str(conversation_id)}}
-            )
-            retrieved_messages = [
-                match["metadata"]["history"]
-                for match in query_result.get("matches", [])
-                if "metadata" in match and "history" in match["metadata"]
+            # The whole history is requested, so the query vector is irrelevant: only the metadata filter matters
+            query_vector = [0.1] * self.embedder.get_dimension()
+
+            matches = self.vector_store.query(query_vector, top_k=self.history_top_k, conversation_id=conversation_id)  # Retrieve multiple matches
+            retrieved_history = [
+                (int(match["metadata"].get("iteration", 0)), match["metadata"]["history"])
+                for match in matches
+                if "history" in match["metadata"]
             ]
-
-            retrieved_messages.reverse()
-            return retrieved_messages
+            retrieved_history.sort(key=lambda entry: entry[0], reverse=True)
+            minimum_iterations = 1 if expected_iterations is None else min(max(expected_iterations, 1), self.history_top_k)
+            if len(retrieved_history) >= minimum_iterations:
+                self.history_cache[conversation_id] = retrieved_history
+            return [history for _, history in retrieved_history]
 
         except Exception as e:
             self.error_logger.add_error(f"Error: Exception occurred while retrieving history for conversation_id={conversation_id}: {str(e)}")
             return None
+
+    def update_history_cache(self, conversation: str, iterations: list[tuple[str, str]]) -> None:
+        """
+        Adds the saved iterations to the cached history of the conversation, creating it if the conversation
+        is not cached: the iterations of a conversation are saved through the same object, so the next
+        retrieval is answered without querying the vector store.
+        """
+        cached_history = self.history_cache.get(str(conversation), [])
+        saved_iterations = {int(iteration) for iteration, _ in iterations}
+        updated_history = [entry for entry in cached_history if entry[0] not in saved_iterations]
+        updated_history.extend((int(iteration), full_history) for iteration, full_history in iterations)
+        updated_history.sort(key=lambda entry: entry[0], reverse=True)
+        self.history_cache[str(conversation)] = updated_history[:self.history_top_k]
+
+    def invalidate_history_cache(self, conversation_id: str = None) -> None:
+        """
+        Removes the cached history of the given conversation, or of every conversation if
+        no conversation ID is provided, so that the next retrieval queries the vector store.
+        """
+        if conversation_id is None:
+            self.history_cache = {}
+        else:
+            self.history_cache.pop(str(conversation_id), None)
+
+    def get_history_cache_statistics(self) -> dict:
+        lookups = self.history_cache_hits + self.history_cache_misses
+        return {
+            "hits": self.history_cache_hits,
+            "misses": self.history_cache_misses,
+            "hit_ratio": self.history_cache_hits / lookups if lookups else 0.0,
+            "cached_conversations": len(self.history_cache)
+        }
+
+    @traced("rag_query")
+    def retrieve_relevant_history(self, conversation_id: str, query_text: str, top_k: int = 3):
+        """
+        Retrieve the stored conversation iterations that are most relevant to the given text.
+
+        Parameters:
+            conversation_id (str): The unique identifier for the conversation.
+            query_text (str): The text the iterations are ranked against.
+            top_k (int): The maximum number of iterations to retrieve.
+
+        Returns:
+            List[str] or None: A list of conversation history entries sorted by decreasing
+            relevance if successful, or None if an exception occurs.
+        """
+        try:
+            query_vector = self.get_embedding(query_text)
+            matches = self.vector_store.query(query_vector, top_k=top_k, conversation_id=conversation_id)
+            return [match["metadata"]["history"] for match in matches if "history" in match["metadata"]]
+
+        except Exception as e:
+            self.error_logger.add_error(f"Error: Exception occurred while retrieving relevant history for conversation_id={conversation_id}: {str(e)}")
+            return None
+
+    def get_vector_store(self) -> VectorStore:
+        return self.vector_store
+
+    def get_embedder(self) -> Embedder:
+        return self.embedder
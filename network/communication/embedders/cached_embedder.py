@@ -0,0 +1,91 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+
+from network.communication.embedders.embedder import Embedder
+
+
+class EmbeddingCache:
+    """
+    Persistent cache of embeddings stored in a local SQLite database, keyed by the hash
+    of the embedding model and of the text.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self.connection.commit()
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\n{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: list[str]) -> dict:
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" for _ in chunk)
+                for key, blob in self.connection.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk):
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: list[tuple[str, list[float]]]) -> None:
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, array("f", vector).tobytes()) for key, vector in items]
+            )
+            self.connection.commit()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+class CachedEmbedder(Embedder):
+    """
+    Embedder wrapping another one with a persistent cache: the texts already embedded are read
+    from the cache and all the remaining ones are embedded with a single call to the wrapped embedder.
+    """
+    def __init__(self, embedder: Embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        model_name = self.embedder.get_model_name()
+        keys = [self.cache.make_key(model_name, text) for text in texts]
+        embeddings = self.cache.get_many(list(set(keys)))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in embeddings:
+                missing[key] = text
+        self.hits = self.hits + len(texts) - sum(1 for key in keys if key in missing)
+        self.misses = self.misses + len(missing)
+
+        if missing:
+            missing_keys = list(missing.keys())
+            new_embeddings = self.embedder.embed([missing[key] for key in missing_keys])
+            self.cache.put_many(list(zip(missing_keys, new_embeddings)))
+            embeddings.update(zip(missing_keys, new_embeddings))
+
+        return [embeddings[key] for key in keys]
+
+    def get_model_name(self) -> str:
+        return self.embedder.get_model_name()
+
+    def get_dimension(self) -> int:
+        return self.embedder.get_dimension()
+
+    def get_statistics(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
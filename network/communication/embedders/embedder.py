@@ -0,0 +1,28 @@
+from abc import ABC, abstractmethod
+
+
+class Embedder(ABC):
+    """
+    Interface of the embedding generators used by the `ConversationalRAG`. An embedder must implement
+    every method, otherwise it cannot be instantiated.
+    """
+    @abstractmethod
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        """
+        Generates the embeddings of the given texts.
+
+        Args:
+            texts (list[str]): The texts to embed.
+
+        Returns:
+            list[list[float]]: One embedding for each text, in the same order.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_model_name(self) -> str:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_dimension(self) -> int:
+        raise NotImplementedError
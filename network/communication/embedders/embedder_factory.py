@@ -0,0 +1,43 @@
+import os
+import threading
+
+from network.communication.embedders.cached_embedder import CachedEmbedder, EmbeddingCache
+from network.communication.embedders.embedder import Embedder
+from network.config import embedder_type, embedding_cache_path, embedding_dimension, embedding_model
+
+embedding_caches = {}
+embedding_caches_lock = threading.Lock()
+
+
+def create_embedder(embedder: str = None) -> Embedder:
+    """
+    Creates the embedder selected by the configuration (EMBEDDER), wrapped by the persistent
+    embedding cache unless EMBEDDING_CACHE_PATH is empty.
+
+    Args:
+        embedder (str, optional): "openai" or "hash". Defaults to the configured embedder.
+
+    Returns:
+        Embedder: The embedder.
+
+    Raises:
+        ValueError: If the embedder is not supported.
+    """
+    embedder = embedder_type if embedder is None else embedder
+    if embedder == "openai":
+        from network.communication.embedders.openai_embedder import OpenAIEmbedder
+        base_embedder = OpenAIEmbedder(embedding_model, embedding_dimension)
+    elif embedder == "hash":
+        from network.communication.embedders.hash_embedder import HashEmbedder
+        base_embedder = HashEmbedder(embedding_dimension)
+    else:
+        raise ValueError(f"Unsupported embedder: {embedder}")
+
+    if not embedding_cache_path:
+        return base_embedder
+
+    absolute_path = os.path.abspath(embedding_cache_path)
+    with embedding_caches_lock:
+        if absolute_path not in embedding_caches:
+            embedding_caches[absolute_path] = EmbeddingCache(absolute_path)
+        return CachedEmbedder(base_embedder, embedding_caches[absolute_path])
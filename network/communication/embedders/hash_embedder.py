@@ -0,0 +1,39 @@
+import hashlib
+import math
+import re
+
+from network.communication.embedders.embedder import Embedder
+
+
+class HashEmbedder(Embedder):
+    """
+    Local and deterministic embedder based on the hashing trick: every word of the text is hashed
+    to a dimension of the vector, which is then normalized. It does not capture the semantic of
+    the text as a language model would, but texts sharing many words obtain similar vectors.
+    It is meant for tests and offline executions.
+    """
+    def __init__(self, dimension: int = 1536):
+        self.dimension = dimension
+        self.word_pattern = re.compile(r"\w+")
+
+    def embed_text(self, text: str) -> list[float]:
+        vector = [0.0] * self.dimension
+        for word in self.word_pattern.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dimension] += 1.0 if value & (1 << 63) else -1.0
+
+        norm = math.sqrt(sum(component * component for component in vector))
+        if norm == 0:
+            vector[0] = 1.0  # empty texts are mapped to a fixed non-zero vector
+            return vector
+        return [component / norm for component in vector]
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_text(text) for text in texts]
+
+    def get_model_name(self) -> str:
+        return f"hash-{self.dimension}"
+
+    def get_dimension(self) -> int:
+        return self.dimension
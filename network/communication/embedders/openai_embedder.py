@@ -0,0 +1,30 @@
+import openai
+
+from network.communication.embedders.embedder import Embedder
+
+
+class OpenAIEmbedder(Embedder):
+    """
+    Embedder based on the OpenAI embeddings API. All the texts are sent with a single
+    request (split in chunks of `batch_size` texts if necessary).
+    """
+    def __init__(self, model: str = "text-embedding-ada-002", dimension: int = 1536, batch_size: int = 2048):
+        self.model = model
+        self.dimension = dimension
+        self.batch_size = batch_size
+
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            response = openai.embeddings.create(
+                input=texts[start:start + self.batch_size],
+                model=self.model
+            )
+            embeddings.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+        return embeddings
+
+    def get_model_name(self) -> str:
+        return self.model
+
+    def get_dimension(self) -> int:
+        return self.dimension
@@ -1,15 +1,22 @@
-import json
-from lib2to3.fixes.fix_input import context
-from operator import truediv
-
 import re
 
+response_to_regex = re.compile(r"in response to: (\w+)", re.IGNORECASE)
+
+
 class Message:
+    """
+    A message of the conversation. The optional "in response to: <agent>" pattern is parsed once,
+    when the message is created: it is removed from the content and its agent is kept in `response_to`.
+    """
+    __slots__ = ("sender", "content", "response_to")
+
+    response_to_pattern = "in response to: "
+
     def __init__(self, sender: str, content):
         self.sender = sender
         self.content = content
-        self.response_to = ""
-        self.response_to_pattern = "in response to: "
+        self.response_to = None #None if the message is not in response to a specific agent
+        self.extract_response_to_pattern()
 
     def contains_response_to(self) -> bool:
         """
@@ -19,11 +26,7 @@ class Message:
             bool: True if message is in response to a specific agent,
                   False otherwise
         """
-        lower_content = self.content.lower()
-        if self.response_to_pattern in lower_content:
-            return True
-        else:
-            return False
+        return self.response_to is not None
 
     def extract_response_to_pattern(self) -> None:
         """
@@ -35,11 +38,11 @@ class Message:
         Returns:
              None
         """
-        pattern = rf"{self.response_to_pattern}(\w+)"
-        match = re.search(pattern, self.content, re.IGNORECASE) #allows to search the pattern while being cae insensitive
+        if not isinstance(self.content, str) or self.response_to_pattern not in self.content.lower():
+            return None
+        match = response_to_regex.search(self.content) #allows to search the pattern while being case insensitive
         if match:
-            matched_substring = match.group(0)
-            self.content = self.content.replace(matched_substring, "", 1) #allows to remove the pattern "in response to: " once is recognized the first time
+            self.content = self.content.replace(match.group(0), "", 1) #allows to remove the pattern "in response to: " once is recognized the first time
             self.response_to = match.group(1)
         else:
             self.response_to = ""
@@ -52,19 +55,26 @@ class Message:
             result(dict): dictionary composed by a sender a message and an optional field
                           which indicates if the message is in response to a specific agent
         """
-        if self.contains_response_to():
-            self.extract_response_to_pattern()
-            result = {
+        if self.response_to is not None:
+            return {
                 "sender": self.sender,
                 "content": self.content,
                 "in response to": self.response_to
             }
-        else:
-            result = {
-                "sender": self.sender,
-                "content": self.content,
-            }
-        return result
+        return {
+            "sender": self.sender,
+            "content": self.content,
+        }
+
+    def __repr__(self) -> str:
+        # messages are rendered in the prompts as their dictionaries
+        return repr(self.to_dict())
+
+    def get_sender(self) -> str:
+        return self.sender
 
     def get_content(self):
-        return self.content
\ No newline at end of file
+        return self.content
+
+    def get_response_to(self) -> str | None:
+        return self.response_to
@@ -0,0 +1,66 @@
+import itertools
+
+
+class RenderedHistory:
+    """
+    Read-only view of a sequence of messages together with their cached renderings.
+
+    A view renders exactly like the equivalent list of dictionaries (`str(list)`), but it is
+    assembled by joining the renderings computed once, when each message was added, instead of
+    serializing every message again. The rendering of the whole view is computed at most once.
+
+    Views share the underlying lists, which are only ever appended to, and remember their length:
+    messages added after the view was created are not part of it.
+    """
+    __slots__ = ("items", "pieces", "start", "end", "rendered")
+
+    def __init__(self, items: list, pieces: list[str], start: int = 0, end: int = None):
+        self.items = items
+        self.pieces = pieces
+        self.start = start
+        self.end = len(items) if end is None else end
+        self.rendered = None
+
+    @classmethod
+    def from_items(cls, items: list) -> "RenderedHistory":
+        items = list(items)
+        return cls(items, [repr(item) for item in items])
+
+    def get_pieces(self) -> list[str]:
+        return self.pieces[self.start:self.end]
+
+    def __str__(self) -> str:
+        if self.rendered is None:
+            self.rendered = "[" + ", ".join(self.get_pieces()) + "]"
+        return self.rendered
+
+    __repr__ = __str__
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __iter__(self):
+        return itertools.islice(self.items, self.start, self.end)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, end, step = index.indices(len(self))
+            if step != 1:
+                return self.items[self.start:self.end][index]
+            return RenderedHistory(self.items, self.pieces, self.start + start, self.start + max(end, start))
+        if index < 0:
+            index = index + len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history index out of range")
+        return self.items[self.start + index]
+
+    def __add__(self, other) -> "RenderedHistory":
+        """
+        Concatenates the view with another view or with a list, whose items are rendered now.
+        """
+        if not isinstance(other, RenderedHistory):
+            other = RenderedHistory.from_items(other)
+        return RenderedHistory(
+            self.items[self.start:self.end] + other.items[other.start:other.end],
+            self.get_pieces() + other.get_pieces()
+        )
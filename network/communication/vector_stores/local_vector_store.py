@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from network.communication.vector_stores.vector_store import VectorStore
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process backend storing the vectors in a memory-mapped NumPy matrix.
+
+    The folder of the store contains:
+        - `embeddings.f32`: the memory-mapped float32 matrix, one row for each vector.
+        - `metadata.jsonl`: an append-only log mapping every row to its id and metadata.
+        - `store.json`: the dimension and the capacity of the matrix.
+
+    An in-memory index maps every `conversation_id` to its rows, so a query only compares
+    the vectors of a single conversation and does not require any network access.
+    """
+    def __init__(self, path: str, dimension: int = 1536, initial_capacity: int = 1024):
+        self.path = path
+        self.embeddings_path = os.path.join(path, "embeddings.f32")
+        self.metadata_path = os.path.join(path, "metadata.jsonl")
+        self.header_path = os.path.join(path, "store.json")
+        self.lock = threading.Lock()
+
+        self.ids = [] # row -> id
+        self.metadata = [] # row -> metadata
+        self.rows_by_id = {}
+        self.rows_by_conversation = {}
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        if os.path.exists(self.header_path):
+            with open(self.header_path, "r") as header_file:
+                header = json.load(header_file)
+            if header["dimension"] != dimension:
+                raise ValueError(f"The local vector store in {path} has dimension {header['dimension']}, expected {dimension}: use another RAG_LOCAL_PATH for this embedder")
+            self.dimension = header["dimension"]
+            self.capacity = header["capacity"]
+            self.embeddings = np.memmap(self.embeddings_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dimension))
+            self.load_metadata()
+        else:
+            self.dimension = dimension
+            self.capacity = initial_capacity
+            self.embeddings = np.memmap(self.embeddings_path, dtype=np.float32, mode="w+", shape=(self.capacity, self.dimension))
+            self.write_header()
+            open(self.metadata_path, "w").close()
+
+        self.metadata_file = open(self.metadata_path, "a")
+
+    def write_header(self) -> None:
+        temporary_path = f"{self.header_path}.tmp"
+        with open(temporary_path, "w") as header_file:
+            json.dump({"dimension": self.dimension, "capacity": self.capacity}, header_file)
+        os.replace(temporary_path, self.header_path)
+
+    def load_metadata(self) -> None:
+        with open(self.metadata_path, "r") as metadata_file:
+            for line in metadata_file:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                self.index_row(record["row"], record["id"], record["metadata"])
+
+    def index_row(self, row: int, vector_id: str, metadata: dict) -> None:
+        if row == len(self.ids):
+            self.ids.append(vector_id)
+            self.metadata.append(metadata)
+        else:
+            previous_conversation = str(self.metadata[row].get("conversation_id", ""))
+            if row in self.rows_by_conversation.get(previous_conversation, []):
+                self.rows_by_conversation[previous_conversation].remove(row)
+            self.ids[row] = vector_id
+            self.metadata[row] = metadata
+        self.rows_by_id[vector_id] = row
+        self.rows_by_conversation.setdefault(str(metadata.get("conversation_id", "")), []).append(row)
+
+    def grow(self, required_rows: int) -> None:
+        """
+        Doubles the capacity of the matrix until it can contain the required rows.
+        """
+        new_capacity = self.capacity
+        while new_capacity < required_rows:
+            new_capacity = new_capacity * 2
+        self.embeddings.flush()
+        del self.embeddings
+        with open(self.embeddings_path, "r+b") as embeddings_file:
+            embeddings_file.truncate(new_capacity * self.dimension * np.dtype(np.float32).itemsize)
+        self.capacity = new_capacity
+        self.embeddings = np.memmap(self.embeddings_path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dimension))
+        self.write_header()
+
+    def upsert(self, vectors: list[tuple[str, list[float], dict]]) -> None:
+        with self.lock:
+            new_rows = sum(1 for vector_id, _, _ in vectors if vector_id not in self.rows_by_id)
+            if len(self.ids) + new_rows > self.capacity:
+                self.grow(len(self.ids) + new_rows)
+
+            for vector_id, values, metadata in vectors:
+                values = np.asarray(values, dtype=np.float32)
+                if values.shape != (self.dimension,):
+                    raise ValueError(f"Vector {vector_id} has dimension {values.shape[0]}, expected {self.dimension}")
+                row = self.rows_by_id.get(vector_id, len(self.ids))
+                self.embeddings[row] = values
+                self.index_row(row, vector_id, metadata)
+                self.metadata_file.write(json.dumps({"row": row, "id": vector_id, "metadata": metadata}) + "\n")
+
+            self.embeddings.flush()
+            self.metadata_file.flush()
+
+    def query(self, vector: list[float], top_k: int, conversation_id: str) -> list[dict]:
+        with self.lock:
+            rows = list(self.rows_by_conversation.get(str(conversation_id), []))
+            if not rows:
+                return []
+            candidates = self.embeddings[rows]
+
+        query_vector = np.asarray(vector, dtype=np.float32)
+        norms = np.linalg.norm(candidates, axis=1) * np.linalg.norm(query_vector)
+        scores = candidates @ query_vector / np.where(norms == 0, 1, norms)
+        best_positions = np.argsort(-scores, kind="stable")[:top_k]
+        return [
+            {"id": self.ids[rows[position]], "score": float(scores[position]), "metadata": self.metadata[rows[position]]}
+            for position in best_positions
+        ]
+
+    def delete_all(self) -> None:
+        with self.lock:
+            self.ids = []
+            self.metadata = []
+            self.rows_by_id = {}
+            self.rows_by_conversation = {}
+            self.metadata_file.close()
+            self.metadata_file = open(self.metadata_path, "w")
+
+    def describe(self) -> dict:
+        return {"dimension": self.dimension, "total_vector_count": len(self.ids), "capacity": self.capacity}
+
+    def close(self) -> None:
+        with self.lock:
+            self.embeddings.flush()
+            self.metadata_file.close()
@@ -0,0 +1,38 @@
+from pinecone import Pinecone
+
+from network.communication.vector_stores.vector_store import VectorStore
+from network.config import pinecone_host, pinecone_key
+
+
+class PineconeVectorStore(VectorStore):
+    """
+    Backend storing the vectors in a remote Pinecone index.
+    """
+    def __init__(self, index_name: str = "crane"):
+        self.pc = Pinecone(api_key=pinecone_key)
+        self.index = self.pc.Index(index_name) if pinecone_host is None else self.pc.Index(name=index_name, host=pinecone_host)
+
+        index_stats = self.index.describe_index_stats()
+
+    def upsert(self, vectors: list[tuple[str, list[float], dict]]) -> None:
+        self.index.upsert(vectors=vectors)
+
+    def query(self, vector: list[float], top_k: int, conversation_id: str) -> list[dict]:
+        query_result = self.index.query(
+            vector=vector,
+            top_k=top_k,  # Retrieve multiple matches
+            include_metadata=True,
+            namespace="",  # Explicitly set default namespace
+            filter={"conversation_id": {"$eq": str(conversation_id)}}
+        )
+        return [
+            {"id": match["id"], "score": match.get("score"), "metadata": match["metadata"]}
+            for match in query_result.get("matches", [])
+            if "metadata" in match
+        ]
+
+    def delete_all(self) -> None:
+        self.index.delete(delete_all=True)  # This will delete all vectors in the index
+
+    def describe(self) -> dict:
+        return self.index.describe_index_stats()
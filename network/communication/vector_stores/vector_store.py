@@ -0,0 +1,44 @@
+from abc import ABC, abstractmethod
+
+
+class VectorStore(ABC):
+    """
+    Interface of the storage backends used by the `ConversationalRAG`.
+
+    A backend stores vectors identified by an id, together with a metadata dictionary which
+    always contains the `conversation_id` the vector belongs to. A backend must implement every
+    method, otherwise it cannot be instantiated.
+    """
+    @abstractmethod
+    def upsert(self, vectors: list[tuple[str, list[float], dict]]) -> None:
+        """
+        Inserts the given vectors, replacing the ones with the same id.
+
+        Args:
+            vectors (list[tuple[str, list[float], dict]]): The (id, values, metadata) triples to store.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def query(self, vector: list[float], top_k: int, conversation_id: str) -> list[dict]:
+        """
+        Retrieves the vectors of a conversation that are most similar to the given one.
+
+        Args:
+            vector (list[float]): The query vector.
+            top_k (int): The maximum number of matches to return.
+            conversation_id (str): The conversation the matches must belong to.
+
+        Returns:
+            list[dict]: The matches, sorted by decreasing similarity, each one composed by
+                        the keys "id", "score" and "metadata".
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_all(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def describe(self) -> dict:
+        raise NotImplementedError
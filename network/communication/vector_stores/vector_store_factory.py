@@ -0,0 +1,44 @@
+import os
+import threading
+
+from network.communication.vector_stores.vector_store import VectorStore
+from network.config import embedding_dimension, rag_backend, rag_local_path
+
+local_vector_stores = {}
+local_vector_stores_lock = threading.Lock()
+
+
+def create_vector_store(backend: str = None, namespace: str = None, dimension: int = None) -> VectorStore:
+    """
+    Creates the storage backend of the RAG selected by the configuration (RAG_BACKEND).
+
+    Local stores are shared by every caller of the process that uses the same folder and dimension,
+    since the in-memory index of a store must be unique. A local store is not shared across processes,
+    so processes running at the same time (e.g. the shards of a batch) use different namespaces.
+
+    Args:
+        backend (str, optional): "pinecone" or "local". Defaults to the configured backend.
+        namespace (str, optional): The subfolder of RAG_LOCAL_PATH of a local store (e.g. the shard's folder).
+        dimension (int, optional): The dimension of the vectors of a local store (the embedder's dimension).
+            Defaults to EMBEDDING_DIMENSION.
+
+    Returns:
+        VectorStore: The storage backend.
+
+    Raises:
+        ValueError: If the backend is not supported, or if an existing local store has a different dimension.
+    """
+    backend = rag_backend if backend is None else backend
+    if backend == "pinecone":
+        from network.communication.vector_stores.pinecone_vector_store import PineconeVectorStore
+        return PineconeVectorStore()
+    elif backend == "local":
+        from network.communication.vector_stores.local_vector_store import LocalVectorStore
+        absolute_path = os.path.abspath(rag_local_path if namespace is None else os.path.join(rag_local_path, namespace))
+        dimension = embedding_dimension if dimension is None else int(dimension)
+        with local_vector_stores_lock:
+            if (absolute_path, dimension) not in local_vector_stores:
+                local_vector_stores[(absolute_path, dimension)] = LocalVectorStore(absolute_path, dimension)
+            return local_vector_stores[(absolute_path, dimension)]
+    else:
+        raise ValueError(f"Unsupported RAG backend: {backend}")
@@ -0,0 +1,70 @@
+import argparse
+import fnmatch
+import glob
+import os
+import sys
+
+
+def list_outputs(base_path: str) -> set[str]:
+    """
+    Returns the paths (relative to `base_path`) of the files in the conversations' directories.
+    """
+    outputs = set()
+    for conversation_path in glob.glob(os.path.join(base_path, "conversation_*")):
+        if not os.path.isdir(conversation_path):
+            continue
+        for folder, _, files in os.walk(conversation_path):
+            for file_name in files:
+                outputs.add(os.path.relpath(os.path.join(folder, file_name), base_path))
+    return outputs
+
+
+def compare_outputs(expected_path: str, actual_path: str, ignored_patterns: list[str] = None) -> dict:
+    """
+    Compares byte by byte the outputs of two runs (e.g. a recorded run and its replay).
+
+    Args:
+        expected_path (str): The base folder of the reference run.
+        actual_path (str): The base folder of the run to check.
+        ignored_patterns (list[str]): Glob patterns of the files that are not compared (e.g. "*usage.json").
+
+    Returns:
+        dict: The compared files, and the files that are different or present in a single run.
+    """
+    ignored_patterns = ignored_patterns or []
+    expected_outputs = list_outputs(expected_path)
+    actual_outputs = list_outputs(actual_path)
+    is_ignored = lambda relative_path: any(fnmatch.fnmatch(relative_path, pattern) for pattern in ignored_patterns)
+
+    different = []
+    for relative_path in sorted(expected_outputs & actual_outputs):
+        if is_ignored(relative_path):
+            continue
+        with open(os.path.join(expected_path, relative_path), "rb") as expected, open(os.path.join(actual_path, relative_path), "rb") as actual:
+            if expected.read() != actual.read():
+                different.append(relative_path)
+    return {
+        "compared": sum(1 for relative_path in expected_outputs & actual_outputs if not is_ignored(relative_path)),
+        "different": different,
+        "missing": sorted(relative_path for relative_path in expected_outputs - actual_outputs if not is_ignored(relative_path)),
+        "unexpected": sorted(relative_path for relative_path in actual_outputs - expected_outputs if not is_ignored(relative_path))
+    }
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Compares byte by byte the conversations' outputs of two runs of CRANE.")
+    parser.add_argument("expected", help="base folder of the reference run")
+    parser.add_argument("actual", help="base folder of the run to check")
+    parser.add_argument("--ignore", nargs="*", default=[], help="glob patterns of the files that are not compared")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    comparison = compare_outputs(args.expected, args.actual, args.ignore)
+    for label in ("different", "missing", "unexpected"):
+        for relative_path in comparison[label]:
+            print(f"{label}: {relative_path}")
+    identical = not (comparison["different"] or comparison["missing"] or comparison["unexpected"])
+    print(f"Compared {comparison['compared']} files: {'identical' if identical else 'the outputs differ'}")
+    sys.exit(0 if identical else 1)
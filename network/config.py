@@ -7,7 +7,10 @@ openai_api_key = os.getenv("OPENAI_API_KEY")
 huggingface_api_key = os.getenv("huggingface_API_KEY")
 base_path = os.getenv("BASE_PATH")
 dataset_path = os.getenv("DATASET_PATH")
+dataset_manifest = os.getenv("DATASET_MANIFEST") #manifest of the dataset's CRs (default: manifest.jsonl in the dataset's folder)
 pinecone_key = os.getenv("PINECONE_KEY")
+llm_endpoint = os.getenv("LLM_ENDPOINT") #if set, replaces the endpoint of every OpenAI agent (e.g. with the local mock server)
+pinecone_host = os.getenv("PINECONE_HOST") #host of the index, e.g. the local mock server (the OpenAI client reads OPENAI_BASE_URL by itself)
 
 openai_headers = {
     "Authorization": f"Bearer {openai_api_key}"
@@ -15,4 +18,44 @@ openai_headers = {
 
 huggingface_headers = {
     "Authorization": f"Bearer {huggingface_api_key}"
-}
\ No newline at end of file
+}
+
+http_pool_connections = int(os.getenv("HTTP_POOL_CONNECTIONS", "10")) #number of per-host connection pools kept by each session
+http_pool_maxsize = int(os.getenv("HTTP_POOL_MAXSIZE", "32")) #number of keep-alive connections kept for each host
+
+response_cache_mode = os.getenv("RESPONSE_CACHE_MODE", "off") #off, read_through, record_only or replay_only
+response_cache_path = os.getenv("RESPONSE_CACHE_PATH", os.path.join(base_path or ".", "response_cache.sqlite3"))
+response_cache_max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "0")) #0 means unlimited
+response_cache_max_bytes = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", "0")) #0 means unlimited
+response_cache_ttl = float(os.getenv("RESPONSE_CACHE_TTL", "0")) #seconds, 0 means that the responses never expire
+
+rag_backend = os.getenv("RAG_BACKEND", "pinecone") #pinecone or local
+rag_local_path = os.getenv("RAG_LOCAL_PATH", os.path.join(base_path or ".", "rag_store"))
+
+embedder_type = os.getenv("EMBEDDER", "openai") #openai or hash (local and deterministic)
+embedding_model = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+embedding_dimension = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(base_path or ".", "embedding_cache.sqlite3")) #empty to disable the cache
+
+context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0")) #default prompt budget of the agents, 0 means unlimited
+context_strategy = os.getenv("CONTEXT_STRATEGY", "drop_oldest") #drop_oldest, latest_per_sender or summarize
+
+# USD per million of prompt, cached prompt and completion tokens, used to estimate the cost of the requests
+model_pricing = {
+    "gpt-4o-mini-2024-07-18": {"prompt": 0.15, "cached_prompt": 0.075, "completion": 0.60},
+    "gpt-4o-mini": {"prompt": 0.15, "cached_prompt": 0.075, "completion": 0.60},
+    "gpt-4o": {"prompt": 2.50, "cached_prompt": 1.25, "completion": 10.00},
+}
+
+trace_output = os.getenv("TRACE_OUTPUT", "") #path prefix of the trace files, empty to disable tracing
+
+request_retries = int(os.getenv("REQUEST_RETRIES", "5")) #attempts of each LLM request before giving up
+rate_limit_rpm = int(os.getenv("RATE_LIMIT_RPM", "0")) #default requests per minute of each provider's model, 0 means unlimited
+rate_limit_tpm = int(os.getenv("RATE_LIMIT_TPM", "0")) #default tokens per minute of each provider's model, 0 means unlimited
+
+storage_mode = os.getenv("STORAGE_MODE", "directory") #directory (one file for each output) or event_log (JSON lines appended to a log)
+event_log_scope = os.getenv("EVENT_LOG_SCOPE", "conversation") #conversation (a log for each conversation) or batch (a log for each process)
+event_log_fsync = os.getenv("EVENT_LOG_FSYNC", "interval") #always (every record), interval (every background flush) or never
+event_log_flush_interval = float(os.getenv("EVENT_LOG_FLUSH_INTERVAL", "1.0")) #seconds between the background flushes
+
+checkpoint_path = os.getenv("CHECKPOINT_PATH", os.path.join(base_path or ".", "checkpoints")) #checkpoints of the CRs, used by --resume (empty to disable)
@@ -0,0 +1,69 @@
+import argparse
+import glob
+import json
+import os
+
+
+def find_event_logs(paths: list[str]) -> list[str]:
+    """
+    Expands the given paths: folders are replaced by the event logs they contain.
+    """
+    event_logs = []
+    for path in paths:
+        if os.path.isdir(path):
+            event_logs.extend(sorted(glob.glob(os.path.join(path, "conversation_*.jsonl")) + glob.glob(os.path.join(path, "events_*.jsonl"))))
+        else:
+            event_logs.append(path)
+    return event_logs
+
+
+def convert_event_logs(event_logs: list[str], output_path: str) -> int:
+    """
+    Writes the outputs recorded in the event logs with the directory layout:
+    conversation_<id>/iteration_<n>/responses.json, summary.json, errors.txt, usage.json, ...
+
+    When an output was recorded more than once (e.g. the usage of the conversation, updated at the end
+    of every iteration), the last record wins, as it would have overwritten the file.
+
+    Args:
+        event_logs (list[str]): The paths of the event logs.
+        output_path (str): The folder in which the conversations' directories are created.
+
+    Returns:
+        int: The number of written files.
+    """
+    outputs = {}
+    for event_log in event_logs:
+        with open(event_log, "r", encoding="utf-8") as log:
+            for line_number, line in enumerate(log, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping the truncated record at line {line_number} of {event_log}")
+                    continue
+                outputs[os.path.join(f"conversation_{record['conversation_id']}", record["file"])] = record["data"]
+
+    for relative_path, data in outputs.items():
+        output_file = os.path.join(output_path, relative_path)
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        with open(output_file, "w") as output:
+            if relative_path.endswith(".json"):
+                json.dump(data, output, indent=4)
+            else:
+                output.write(data)
+    return len(outputs)
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Converts the event logs of CRANE to the directory layout of the conversations.")
+    parser.add_argument("event_logs", nargs="+", help="event logs, or folders containing them")
+    parser.add_argument("--output", required=True, help="folder in which the conversations' directories are written")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    written_files = convert_event_logs(find_event_logs(args.event_logs), args.output)
+    print(f"Written {written_files} files in {args.output}")
@@ -0,0 +1,3 @@
+class MalformedStreamException(Exception):
+    """Custom exception to handle malformed or truncated streamed responses."""
+    pass
\ No newline at end of file
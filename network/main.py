@@ -1,69 +1,332 @@
-import json
+import argparse
+import asyncio
+import glob
 import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
-from network.config import dataset_path
+from network.config import base_path, checkpoint_path, dataset_manifest, dataset_path, storage_mode, trace_output
 from network.agents.agent_base import AgentBase
 from network.agents.moderator import Moderator
 from network.agents.reviewer import Reviewer
 from network.communication.conversation import Conversation
 from network.communication.conversation_manager import ConversationManager
+from network.communication.conversation_scheduler import ConversationScheduler
 from network.communication.message import Message
+from network.utils.checkpoint_store import CheckpointStore
+from network.utils.dataset_loader import DatasetLoader, DatasetRecord, get_shard_namespace, parse_shard
+from network.utils.event_log_writer import get_event_log_writer
+from network.utils.http_session_pool import get_session_pool
+from network.utils.rate_limiter import get_rate_limiters_statistics
+from network.utils.replay_source import ReplayIndex
+from network.utils.response_cache import get_response_cache
+from network.utils.tracer import get_tracer
+from network.utils.usage_tracker import UsageTracker
 
-def conversation_setup():
-    moderator = Moderator("../prompts/system_prompt_3/moderator.json")
-    reviewer1 = Reviewer("../prompts/system_prompt_3/reviewer_1.json")
-    reviewer2 = Reviewer("../prompts/system_prompt_3/reviewer_2.json")
-    reviewers = [reviewer1, reviewer2]
+PROMPT_SETS = ["system_prompt_1", "system_prompt_2", "system_prompt_3", "system_prompt_4"]
 
-    feedback_agent = AgentBase("../prompts/system_prompt_3/feedback_agent.json")
+
+def conversation_setup(prompt_set: str = "system_prompt_3", prompts_path: str = "../prompts"):
+    """
+    Builds a new conversation whose agents are configured by the given prompt set.
+
+    Every reviewer file found in the prompt set folder (reviewer_1.json, reviewer_2.json, ...)
+    is loaded, so prompt sets with a different number of reviewers are supported.
+
+    Args:
+        prompt_set (str): The name of the folder containing the agents' configuration.
+        prompts_path (str): The path of the folder containing the prompt sets.
+
+    Returns:
+        Conversation: A conversation with freshly created agents.
+    """
+    prompt_set_path = os.path.join(prompts_path, prompt_set)
+    moderator = Moderator(os.path.join(prompt_set_path, "moderator.json"))
+    reviewer_files = sorted(glob.glob(os.path.join(prompt_set_path, "reviewer_*.json")))
+    reviewers = [Reviewer(reviewer_file) for reviewer_file in reviewer_files]
+
+    feedback_agent = AgentBase(os.path.join(prompt_set_path, "feedback_agent.json"))
 
     conversation = Conversation(moderator, reviewers, feedback_agent)
     return conversation
 
-def main(conversation):
-    snippets_folder = os.path.join(dataset_path, "snippets")
-    tasks_description_folder = os.path.join(dataset_path, "tasks_description")
-    snippets = os.listdir(snippets_folder)
-    tasks_description = os.listdir(tasks_description_folder)
-    conversation_outcome = ""
 
-    for i in range (0, 1):
-        try:
-            conversation_manager = ConversationManager(conversation, human_role="reviewer", human_flag=False) #reviewer, moderator or feedback_agent are accepted as roles
-        except Exception as e:
-            print(f"[Pinecone Error] The file {i} will not be executed. Error cause: {e}")
+def get_checkpoint_file(cr_id: str, shard: tuple[int, int] = None) -> str:
+    """
+    Returns the checkpoint of a CR: the checkpoints of a shard are kept in the shard's folder of CHECKPOINT_PATH.
+    """
+    if shard is None:
+        return os.path.join(checkpoint_path, f"{cr_id}.jsonl")
+    return os.path.join(checkpoint_path, get_shard_namespace(shard), f"{cr_id}.jsonl")
+
+
+def new_outcome(snippet_name: str) -> dict:
+    """
+    Returns the outcome of a CR that was not executed (yet): it is filled in by `process_cr`.
+    """
+    return {"snippet": snippet_name, "conversation_id": None, "error": True, "rag_history_cache": None, "usage_records": [], "resumed_calls": 0, "replayed_calls": 0, "missing_calls": 0}
+
+
+def setup_cr(record: DatasetRecord, prompt_set: str, prompts_path: str, streaming: bool = False, resume: bool = False, replay_index: ReplayIndex = None, shard: tuple[int, int] = None, concurrent_reviewers: bool = False):
+    """
+    Reads a CR and creates the conversation manager that executes it. The CR is not executed if its
+    snippet or its task description cannot be read.
+
+    The completed agent calls are recorded in the CR's checkpoint (unless CHECKPOINT_PATH is empty).
+    If `resume` is True, the conversation restarts from its checkpoint: it keeps its conversation id
+    and the calls already completed are not sent to the provider again.
+    If a replay index is given, the conversation is replayed from the recording of the CR instead:
+    the agents are answered by the recorded responses, no provider is contacted and no checkpoint is written.
+    If a shard is given, the outputs are written in the shard's folder, with ids that do not collide with
+    the ones of the other shards.
+    If `concurrent_reviewers` is True, the reviewers of a round are queried concurrently, so none of them
+    sees the replies given by the others in the same round (sequentially, every reviewer sees them).
+
+    Returns:
+        tuple | None: The conversation manager, the task and the snippet of the CR, or None if the CR cannot be executed.
+    """
+    snippet_name = record.get_snippet_name()
+    try:
+        snippet_data = record.read_snippet()
+        task = record.read_task()
+    except (OSError, ValueError) as e:
+        print(f"[Dataset Error] The file {snippet_name} will not be executed. Error cause: {e}")
+        return None
+
+    conversation = conversation_setup(prompt_set, prompts_path)
+    try:
+        conversation_manager = ConversationManager(conversation, human_role="reviewer", human_flag=False, concurrent_reviewers=concurrent_reviewers, streaming=streaming, shard=shard) #reviewer, moderator or feedback_agent are accepted as roles
+    except Exception as e:
+        print(f"[Pinecone Error] The file {snippet_name} will not be executed. Error cause: {e}")
+        return None
+
+    conversation_manager.set_cr_name(record.get_cr_id())
+    if replay_index is not None:
+        replay_source = replay_index.get_source(record.get_cr_id())
+        if replay_source is None:
+            print(f"[Replay Error] The file {snippet_name} will not be executed: no recording was found for it.")
+            return None
+        conversation_manager.set_replay_source(replay_source)
+    elif checkpoint_path:
+        conversation_manager.set_checkpoint(CheckpointStore(get_checkpoint_file(record.get_cr_id(), shard), resume))
+    return conversation_manager, task, snippet_data
+
+
+def complete_cr(record: DatasetRecord, conversation_manager: ConversationManager) -> dict:
+    """
+    Marks the checkpoint of an executed CR as finished and returns the outcome of its execution.
+    """
+    outcome = new_outcome(record.get_snippet_name())
+    checkpoint = conversation_manager.get_checkpoint()
+    if checkpoint is not None:
+        checkpoint.mark_finished(conversation_manager.get_error_state())
+        outcome["resumed_calls"] = checkpoint.get_restored_calls()
+    replay_source = conversation_manager.get_replay_source()
+    if replay_source is not None:
+        outcome["replayed_calls"] = replay_source.get_replayed_calls()
+        outcome["missing_calls"] = replay_source.get_missing_calls()
+
+    outcome["conversation_id"] = conversation_manager.get_conversation_id()
+    outcome["error"] = conversation_manager.get_error_state()
+    outcome["rag_history_cache"] = conversation_manager.get_conversational_rag().get_history_cache_statistics()
+    outcome["usage_records"] = conversation_manager.get_usage_tracker().get_records()
+    return outcome
+
+
+def process_cr(record: DatasetRecord, prompt_set: str, prompts_path: str, streaming: bool = False, resume: bool = False, replay_index: ReplayIndex = None, shard: tuple[int, int] = None, concurrent_reviewers: bool = False) -> dict:
+    """
+    Executes CRANE on a single CR (see `setup_cr` for the arguments). Every call creates its own
+    conversation and conversation manager, hence it can be executed concurrently with other calls.
+
+    Returns:
+        dict: The outcome of the execution, composed by the snippet's name, the conversation id and the error state.
+    """
+    setup = setup_cr(record, prompt_set, prompts_path, streaming, resume, replay_index, shard, concurrent_reviewers)
+    if setup is None:
+        return new_outcome(record.get_snippet_name())
+    conversation_manager, task, snippet_data = setup
+    conversation_manager.simulate_conversation(task, snippet_data)
+    return complete_cr(record, conversation_manager)
+
+
+async def aprocess_cr(record: DatasetRecord, request_semaphore: asyncio.Semaphore, prompt_set: str, prompts_path: str, streaming: bool = False, resume: bool = False, replay_index: ReplayIndex = None, shard: tuple[int, int] = None, concurrent_reviewers: bool = False) -> dict:
+    """
+    Asynchronous counterpart of `process_cr`, executed by the `ConversationScheduler`: the conversation
+    is interleaved with the other ones of the event loop, and its requests share the scheduler's cap.
+    The blocking setup (reading the CR, creating the agents) is executed in a worker thread.
+    """
+    setup = await asyncio.to_thread(setup_cr, record, prompt_set, prompts_path, streaming, resume, replay_index, shard, concurrent_reviewers)
+    if setup is None:
+        return new_outcome(record.get_snippet_name())
+    conversation_manager, task, snippet_data = setup
+    conversation_manager.set_request_semaphore(request_semaphore)
+    await conversation_manager.asimulate_conversation(task, snippet_data)
+    return await asyncio.to_thread(complete_cr, record, conversation_manager)
+
+
+def select_records(dataset_loader: DatasetLoader, args):
+    """
+    Lazily yields the CRs of the dataset selected by the command line arguments.
+    """
+    records = dataset_loader.records(start=args.start, end=args.end, shard=args.shard, min_size=args.min_size, max_size=args.max_size)
+    for record in records:
+        if args.resume and checkpoint_path and args.replay is None and CheckpointStore.is_completed(get_checkpoint_file(record.get_cr_id(), args.shard)):
             continue
+        yield record
 
-        snippet_data = ""
-        snippet_path = os.path.join(snippets_folder, snippets[i])
-        try:
-            with open(snippet_path, "r") as snippet:
-                snippet_data = snippet.read()
-        except FileNotFoundError:
-            print(f"Error: File {snippets[i]} not found")
 
-        task_description_path = os.path.join(tasks_description_folder, tasks_description[i])
-        try:
-            with open(task_description_path, "r") as task_description:
-                task_description_data = json.load(task_description)
-                task = task_description_data.get("cr_task", "")
-        except FileNotFoundError:
-            print(f"Error: File {snippets[i]} not found")
-
-        cr_name, _ = os.path.splitext(snippets[i])
-        filtered_cr_name = cr_name.replace("before_", "")
-        conversation_manager.set_cr_name(filtered_cr_name)
-        conversation_manager.simulate_conversation(task, snippet_data)
-
-        error_state = conversation_manager.get_error_state()
-        if error_state:
-            conversation_outcome = f"   An error occurred during the conversation n. {int(conversation_manager.get_conversation_id())-1} while executing the snippet {snippets[i]}."
+def execute_in_threads(records, args, replay_index: ReplayIndex = None):
+    """
+    Executes the CRs in a pool of `args.concurrency` threads, each one owning a conversation, and
+    yields (record, outcome, error) as they complete. The records are submitted as the workers free
+    up, so only a few of them are in memory at a time.
+    """
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = {}
+
+        def submit_next_record() -> None:
+            record = next(records, None)
+            if record is not None:
+                futures[executor.submit(process_cr, record, args.prompt_set, args.prompts_path, args.streaming, args.resume, replay_index, args.shard, args.concurrent_reviewers)] = record
+
+        for _ in range(2 * args.concurrency):
+            submit_next_record()
+        while futures:
+            done_futures, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done_futures:
+                record = futures.pop(future)
+                submit_next_record()
+                if future.exception() is not None:
+                    yield record, None, future.exception()
+                else:
+                    yield record, future.result(), None
+
+
+def main(args):
+    dataset_loader = DatasetLoader(dataset_path, dataset_manifest)
+    dataset_loader.ensure_manifest(args.rebuild_manifest)
+    if dataset_loader.get_unpaired_files():
+        print(f"Dataset: {len(dataset_loader.get_unpaired_files())} files without their snippet or task description are ignored: {', '.join(dataset_loader.get_unpaired_files()[:10])}")
+
+    total = sum(1 for _ in select_records(dataset_loader, args)) #reads only the manifest (and the checkpoints, if resuming)
+    if args.resume:
+        skipped = dataset_loader.count(start=args.start, end=args.end, shard=args.shard, min_size=args.min_size, max_size=args.max_size) - total
+    replay_index = ReplayIndex(args.replay) if args.replay is not None else None
+    output_path = base_path if args.shard is None else os.path.join(base_path, get_shard_namespace(args.shard))
+    resumed_calls = 0
+    replayed_calls = 0
+    missing_calls = 0
+    completed = 0
+    failed = 0
+    rag_history_cache_hits = 0
+    rag_history_cache_misses = 0
+    batch_usage_tracker = UsageTracker()
+    start_time = time.perf_counter()
+
+    if args.resume:
+        print(f"Resuming: {skipped} CRs already completed are skipped")
+    if args.shard is not None:
+        print(f"Shard {args.shard[0]}/{args.shard[1]}: the outputs are written in {output_path}")
+    print(f"Executing {total} CRs with the prompt set {args.prompt_set} (concurrency: {args.concurrency})")
+    if args.scheduler:
+        print(f"Scheduler: the conversations are interleaved in a single event loop, with at most {args.max_in_flight} requests in flight")
+        scheduler = ConversationScheduler(args.max_in_flight, args.concurrency)
+        completed_records = scheduler.execute(
+            select_records(dataset_loader, args),
+            lambda record: aprocess_cr(record, scheduler.get_request_semaphore(), args.prompt_set, args.prompts_path, args.streaming, args.resume, replay_index, args.shard, args.concurrent_reviewers)
+        )
+    else:
+        completed_records = execute_in_threads(select_records(dataset_loader, args), args, replay_index)
+    for record, outcome, error in completed_records:
+        snippet_name = record.get_snippet_name()
+        if error is not None:
+            outcome = new_outcome(snippet_name)
+            print(f"   An unexpected error occurred while executing the snippet {snippet_name}: {error}")
+
+        completed = completed + 1
+        resumed_calls = resumed_calls + outcome["resumed_calls"]
+        replayed_calls = replayed_calls + outcome["replayed_calls"]
+        missing_calls = missing_calls + outcome["missing_calls"]
+        batch_usage_tracker.extend(outcome["usage_records"])
+        if outcome["rag_history_cache"] is not None:
+            rag_history_cache_hits = rag_history_cache_hits + outcome["rag_history_cache"]["hits"]
+            rag_history_cache_misses = rag_history_cache_misses + outcome["rag_history_cache"]["misses"]
+        if outcome["error"]:
+            failed = failed + 1
+            conversation_outcome = f"   An error occurred during the conversation n. {outcome['conversation_id']} while executing the snippet {snippet_name}."
         else:
-            conversation_outcome = f"   No errors occurred during the conversation n. {int(conversation_manager.get_conversation_id())-1} while executing the snippet {snippets[i]}."
+            conversation_outcome = f"   No errors occurred during the conversation n. {outcome['conversation_id']} while executing the snippet {snippet_name}."
+        elapsed_minutes = (time.perf_counter() - start_time) / 60
         print(conversation_outcome)
+        print(f"   [{completed}/{total}] completed, {failed} with errors, {completed / elapsed_minutes:.2f} CRs/minute")
         print("=======================================================================================================")
 
+    elapsed_minutes = (time.perf_counter() - start_time) / 60
+    throughput = total / elapsed_minutes if elapsed_minutes > 0 else 0.0
+    print(f"Executed {total} CRs ({failed} with errors) in {elapsed_minutes:.2f} minutes: {throughput:.2f} CRs/minute")
+    batch_usage = batch_usage_tracker.get_usage()
+    batch_usage_path = os.path.join(output_path, f"batch_usage_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    UsageTracker.save(batch_usage, batch_usage_path)
+    print(f"Token usage: {batch_usage['total']['prompt_tokens']} prompt tokens ({batch_usage['total']['cached_prompt_token_rate']:.1%} cached by the provider), "
+          f"{batch_usage['total']['completion_tokens']} completion tokens, "
+          f"estimated cost {batch_usage['total']['cost']:.4f} USD (details in {batch_usage_path})")
+    for agent_name, agent_usage in batch_usage["agents"].items():
+        print(f"   {agent_name}: {agent_usage['calls']} calls, {agent_usage['total_tokens']} tokens, {agent_usage['cost']:.4f} USD, {agent_usage['latency']:.2f} s")
+    print(f"RAG history cache: {rag_history_cache_hits} hits, {rag_history_cache_misses} retrievals from the vector store")
+    if args.resume:
+        print(f"Resumed: {resumed_calls} agent calls restored from the checkpoints instead of being sent again")
+    if replay_index is not None:
+        print(f"Replay: {replayed_calls} agent calls answered by the recordings in {args.replay}, {missing_calls} calls without a recorded response")
+    if storage_mode == "event_log":
+        event_log_writer = get_event_log_writer()
+        event_log_writer.close()
+        statistics = event_log_writer.get_statistics()
+        print(f"Event log: {statistics['records']} records, {statistics['written_bytes']} bytes written in {statistics['flushes']} flushes "
+              f"({statistics['fsyncs']} fsyncs, policy {statistics['fsync_policy']})")
+    if get_tracer().is_enabled():
+        trace_files = get_tracer().export(trace_output)
+        print(f"Trace saved in {', '.join(trace_files)}")
+    for limited_model, statistics in get_rate_limiters_statistics().items():
+        print(f"Rate limiter {limited_model}: {statistics['delayed_acquisitions']}/{statistics['acquisitions']} requests delayed, "
+              f"{statistics['total_wait']:.2f} s waited, {statistics['penalties']} Retry-After pauses")
+    print("HTTP connection reuse:")
+    print(get_session_pool().get_statistics_as_text())
+    response_cache = get_response_cache()
+    if response_cache.is_enabled():
+        statistics = response_cache.get_statistics()
+        print(f"Response cache ({statistics['mode']}): {statistics['hits']} hits, {statistics['misses']} misses, "
+              f"{statistics['stores']} stored, {statistics['evictions']} evicted, {statistics['entries']} entries")
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Executes CRANE on the CRs of the dataset.")
+    parser.add_argument("--concurrency", type=int, default=1, help="number of CRs executed concurrently")
+    parser.add_argument("--start", type=int, default=0, help="index of the first CR of the dataset (in CR id order) to execute")
+    parser.add_argument("--end", type=int, default=None, help="index after the last CR of the dataset to execute (default: the last CR)")
+    parser.add_argument("--shard", default=None, help="executes only the shard i/N of the dataset (CRs partitioned by a stable hash of their ids), writing its outputs in BASE_PATH/shard_i_of_N")
+    parser.add_argument("--min-size", type=int, default=None, help="minimum size of the snippets to execute, in bytes")
+    parser.add_argument("--max-size", type=int, default=None, help="maximum size of the snippets to execute, in bytes")
+    parser.add_argument("--rebuild-manifest", action="store_true", help="rebuilds the dataset's manifest even if the dataset's folders did not change")
+    parser.add_argument("--prompt-set", choices=PROMPT_SETS, default="system_prompt_3", help="prompt set used to configure the agents")
+    parser.add_argument("--prompts-path", default="../prompts", help="path of the folder containing the prompt sets")
+    parser.add_argument("--streaming", action="store_true", help="stream the reviewers' responses, stopping as soon as a reviewer is satisfied")
+    parser.add_argument("--concurrent-reviewers", action="store_true", help="query the reviewers of a round concurrently: a reviewer does not see the replies of the others in the same round")
+    parser.add_argument("--scheduler", action="store_true", help="executes the conversations in a single event loop, interleaving their phases (--concurrency conversations active at a time)")
+    parser.add_argument("--max-in-flight", type=int, default=16, help="with --scheduler, maximum number of requests sent to the providers at the same time")
+    parser.add_argument("--resume", action="store_true", help="skip the CRs completed by a previous run and restart the unfinished ones from their checkpoints")
+    parser.add_argument("--replay", default=None, help="replays the conversations from the recordings in this folder (checkpoints or the outputs of a previous run) without contacting the providers")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.max_in_flight < 1:
+        parser.error("--max-in-flight must be at least 1")
+    if args.shard is not None:
+        try:
+            args.shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
 
 if __name__ == "__main__":
-    conv = conversation_setup()
-    main(conv)
\ No newline at end of file
+    main(parse_arguments())
@@ -0,0 +1,151 @@
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from network.convert_event_log import convert_event_logs, find_event_logs
+from network.utils.usage_tracker import UsageTracker
+
+shard_folder_regex = re.compile(r"shard_(\d+)_of_(\d+)$")
+
+
+def find_shard_folders(paths: list[str]) -> list[str]:
+    """
+    Expands the given paths: folders containing shard folders (shard_<i>_of_<N>) are replaced by them.
+    """
+    shard_folders = []
+    for path in paths:
+        nested_shard_folders = sorted(folder for folder in glob.glob(os.path.join(path, "shard_*_of_*")) if os.path.isdir(folder))
+        shard_folders.extend(nested_shard_folders or [path])
+    return shard_folders
+
+
+def find_missing_shards(shard_folders: list[str]) -> list[str]:
+    """
+    Returns the shards (as i/N) that are missing among the given shard folders.
+    """
+    found_shards = set()
+    for shard_folder in shard_folders:
+        match = shard_folder_regex.search(os.path.basename(os.path.normpath(shard_folder)))
+        if match:
+            found_shards.add((int(match.group(1)), int(match.group(2))))
+    missing_shards = []
+    for shard_count in sorted({shard_count for _, shard_count in found_shards}):
+        missing_shards.extend(f"{shard_index}/{shard_count}" for shard_index in range(shard_count) if (shard_index, shard_count) not in found_shards)
+    return missing_shards
+
+
+def find_conversation_folders(path: str) -> list[str]:
+    return sorted(folder for folder in glob.glob(os.path.join(path, "conversation_*")) if os.path.isdir(folder))
+
+
+def copy_conversations(shard_folders: list[str], output_path: str) -> tuple[int, list[str]]:
+    """
+    Copies the conversations' directories of the shards in the output folder, and converts the event
+    logs of the shards (if they were run with STORAGE_MODE=event_log) into directories.
+
+    The event logs of a shard are converted in a temporary folder, and their conversations are merged
+    like the directories: a conversation already merged (from another shard, or from a directory of the
+    same shard) is never overwritten.
+
+    Returns:
+        tuple[int, list[str]]: The number of copied conversations, and the conversations found more
+        than once (which are not overwritten).
+    """
+    copied_conversations = 0
+    collisions = []
+    for shard_folder in shard_folders:
+        for conversation_path in find_conversation_folders(shard_folder):
+            merged_conversation_path = os.path.join(output_path, os.path.basename(conversation_path))
+            if os.path.exists(merged_conversation_path):
+                collisions.append(conversation_path)
+                continue
+            shutil.copytree(conversation_path, merged_conversation_path)
+            copied_conversations = copied_conversations + 1
+        event_logs = find_event_logs([shard_folder])
+        if not event_logs:
+            continue
+        with tempfile.TemporaryDirectory(dir=output_path) as converted_path: #in the output folder, so the conversations are moved without copying them
+            convert_event_logs(event_logs, converted_path)
+            for conversation_path in find_conversation_folders(converted_path):
+                merged_conversation_path = os.path.join(output_path, os.path.basename(conversation_path))
+                if os.path.exists(merged_conversation_path):
+                    collisions.append(f"{os.path.join(shard_folder, os.path.basename(conversation_path))} (event log)")
+                    continue
+                shutil.move(conversation_path, merged_conversation_path)
+                copied_conversations = copied_conversations + 1
+    return copied_conversations, collisions
+
+
+def merge_usage(output_path: str) -> dict:
+    """
+    Combines the usage of the merged conversations (the `usage.json` of every conversation) into the
+    usage of the whole result set, per agent and per conversation.
+    """
+    conversations_usage = {}
+    for usage_file in glob.glob(os.path.join(output_path, "conversation_*", "usage.json")):
+        with open(usage_file, "r") as usage:
+            conversation_usage = json.load(usage)
+        conversations_usage[conversation_usage["conversation_id"]] = conversation_usage
+    agent_names = sorted({agent_name for conversation_usage in conversations_usage.values() for agent_name in conversation_usage["agents"]})
+    return {
+        "total": UsageTracker.merge_summaries([conversation_usage["total"] for conversation_usage in conversations_usage.values()]),
+        "agents": {
+            agent_name: UsageTracker.merge_summaries([conversation_usage["agents"][agent_name] for conversation_usage in conversations_usage.values() if agent_name in conversation_usage["agents"]])
+            for agent_name in agent_names
+        },
+        "conversations": {conversation_id: conversations_usage[conversation_id]["total"] for conversation_id in sorted(conversations_usage, key=int)}
+    }
+
+
+def merge_errors(output_path: str) -> list[str]:
+    """
+    Collects the errors of the merged conversations: the `errors.txt` of every iteration that
+    contains at least an error (the first line of the file is its header).
+    """
+    error_reports = []
+    error_files = glob.glob(os.path.join(output_path, "conversation_*", "iteration_*", "errors.txt"))
+    for error_file in sorted(error_files, key=lambda path: [int(number) for number in re.findall(r"_(\d+)", os.path.relpath(path, output_path))]):
+        with open(error_file, "r") as errors:
+            lines = errors.read().splitlines()
+        if len(lines) > 1 and any(line.strip() for line in lines[1:]):
+            error_reports.append(f"{os.path.relpath(os.path.dirname(error_file), output_path)}\n" + "\n".join(lines[1:]))
+    return error_reports
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Merges the outputs of the shards of a batch (python -m network.main --shard i/N) into a single result set.")
+    parser.add_argument("shards", nargs="+", help="shard folders (BASE_PATH/shard_i_of_N), or folders containing them")
+    parser.add_argument("--output", required=True, help="folder in which the merged conversations, usage and errors are written")
+    return parser.parse_args(argv)
+
+
+def main(args) -> int:
+    shard_folders = find_shard_folders(args.shards)
+    os.makedirs(args.output, exist_ok=True)
+    copied_conversations, collisions = copy_conversations(shard_folders, args.output)
+
+    merged_usage = merge_usage(args.output)
+    UsageTracker.save(merged_usage, os.path.join(args.output, "merged_usage.json"))
+    error_reports = merge_errors(args.output)
+    with open(os.path.join(args.output, "merged_errors.txt"), "w") as errors:
+        errors.write("\n\n".join(error_reports) + ("\n" if error_reports else ""))
+
+    print(f"Merged {len(shard_folders)} shards: {copied_conversations} conversations copied in {args.output}")
+    print(f"Token usage: {merged_usage['total']['prompt_tokens']} prompt tokens, {merged_usage['total']['completion_tokens']} completion tokens, "
+          f"estimated cost {merged_usage['total']['cost']:.4f} USD (details in merged_usage.json)")
+    print(f"Errors: {len(error_reports)} iterations with errors (details in merged_errors.txt)")
+    missing_shards = find_missing_shards(shard_folders)
+    if missing_shards:
+        print(f"WARNING: missing shards {', '.join(missing_shards)}")
+    for collision in collisions:
+        print(f"WARNING: {collision} was already merged (from another shard or from a directory) and was not copied")
+    return 1 if collisions or missing_shards else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_arguments()))
@@ -0,0 +1,352 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from network.communication.embedders.hash_embedder import HashEmbedder
+
+default_script = [
+    {"pattern": "feedback agent", "responses": ["<<Beginning of snippet n. 1>>\n// code updated according to the suggestions\n<<End of snippet n. 1>>"]},
+    {"pattern": "moderator", "responses": ["- Corrections Suggested: none, the change request is satisfied."]},
+    {"pattern": ".*", "responses": ["Another round is not needed."]}
+]
+
+
+class LatencyDistribution:
+    """
+    Distribution of the simulated latencies, described as:
+        - "fixed:<seconds>"
+        - "uniform:<min>,<max>"
+        - "lognormal:<median>,<sigma>"
+        - "none"
+    """
+    def __init__(self, description: str):
+        self.description = description
+        kind, _, parameters = description.partition(":")
+        self.kind = kind
+        self.parameters = [float(parameter) for parameter in parameters.split(",") if parameter]
+        if self.kind not in ("fixed", "uniform", "lognormal", "none"):
+            raise ValueError(f"Unsupported latency distribution: {description}")
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.parameters[0]
+        if self.kind == "uniform":
+            return random.uniform(self.parameters[0], self.parameters[1])
+        if self.kind == "lognormal":
+            return random.lognormvariate(math.log(self.parameters[0]), self.parameters[1])
+        return 0.0
+
+
+class MockState:
+    """
+    Configuration and state shared by the handlers of the mock server: the scripted responses,
+    the simulated latencies and errors, the vector index and the counters of the served requests.
+    """
+    def __init__(self, script: list[dict] = None, latency: str = "none", vector_latency: str = "none", error_rate_429: float = 0.0, error_rate_503: float = 0.0, retry_after: float = 1.0, stream_chunk_delay: float = 0.0):
+        self.rules = [(re.compile(rule["pattern"], re.IGNORECASE | re.DOTALL), rule["responses"]) for rule in (default_script if script is None else script)]
+        self.rule_positions = [0] * len(self.rules)
+        self.latency = LatencyDistribution(latency)
+        self.vector_latency = LatencyDistribution(vector_latency)
+        self.error_rate_429 = error_rate_429
+        self.error_rate_503 = error_rate_503
+        self.retry_after = retry_after
+        self.stream_chunk_delay = stream_chunk_delay
+        self.embedder = HashEmbedder()
+        self.vectors = {}
+        self.seen_prefixes = set()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def pick_response(self, prompt: str) -> str:
+        with self.lock:
+            for position, (pattern, responses) in enumerate(self.rules):
+                if pattern.search(prompt):
+                    response = responses[self.rule_positions[position] % len(responses)]
+                    self.rule_positions[position] = self.rule_positions[position] + 1
+                    return response
+        return "Another round is not needed."
+
+    def get_cached_tokens(self, prefix: str) -> int:
+        """
+        Simulates the provider's prompt caching: a first message already seen, of at least 1024 tokens,
+        is served from the cache in blocks of 128 tokens.
+        """
+        with self.lock:
+            seen = prefix in self.seen_prefixes
+            self.seen_prefixes.add(prefix)
+        prefix_tokens = count_tokens(prefix)
+        if not seen or prefix_tokens < 1024:
+            return 0
+        return prefix_tokens // 128 * 128
+
+    def pick_error(self) -> int | None:
+        draw = random.random()
+        if draw < self.error_rate_429:
+            return 429
+        if draw < self.error_rate_429 + self.error_rate_503:
+            return 503
+        return None
+
+
+def count_tokens(text: str) -> int:
+    return max(len(text) // 4, 1)
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "CraneMock/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state
+
+    def send_json(self, data, status_code: int = 200, headers: dict = None) -> None:
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.state.lock:
+                self.send_json({"requests": dict(self.state.counters), "vectors": len(self.state.vectors)})
+        else:
+            self.send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        payload = self.read_json()
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            self.handle_llm_request("chat", payload, lambda: self.handle_chat_completion(payload))
+        elif path.endswith("/embeddings"):
+            self.handle_llm_request("embeddings", payload, lambda: self.handle_embeddings(payload))
+        elif path.startswith("/models/"):
+            self.handle_llm_request("huggingface", payload, lambda: self.handle_huggingface(payload))
+        elif path == "/vectors/upsert":
+            self.handle_vector_request("upsert", lambda: self.handle_upsert(payload))
+        elif path == "/query":
+            self.handle_vector_request("query", lambda: self.handle_query(payload))
+        elif path == "/describe_index_stats":
+            self.handle_vector_request("describe_index_stats", lambda: self.send_json({"dimension": self.state.embedder.get_dimension(), "totalVectorCount": len(self.state.vectors), "namespaces": {}}))
+        elif path == "/vectors/delete":
+            self.handle_vector_request("delete", lambda: self.handle_delete(payload))
+        else:
+            self.send_json({"error": f"unsupported path {path}"}, 404)
+
+    def handle_llm_request(self, name: str, payload: dict, handler) -> None:
+        self.state.count(name)
+        time.sleep(self.state.latency.sample())
+        error = self.state.pick_error()
+        if error is not None:
+            self.state.count(f"error_{error}")
+            self.send_json({"error": {"message": "simulated error", "code": error}}, error, {"Retry-After": str(self.state.retry_after)})
+            return
+        handler()
+
+    def handle_vector_request(self, name: str, handler) -> None:
+        self.state.count(name)
+        time.sleep(self.state.vector_latency.sample())
+        handler()
+
+    def handle_chat_completion(self, payload: dict) -> None:
+        prompt = "\n".join(str(message.get("content", "")) for message in payload.get("messages", []))
+        content = self.state.pick_response(prompt)
+        messages = payload.get("messages", [])
+        cached_tokens = self.state.get_cached_tokens(str(messages[0].get("content", ""))) if messages else 0
+        usage = {
+            "prompt_tokens": count_tokens(prompt),
+            "completion_tokens": count_tokens(content),
+            "total_tokens": count_tokens(prompt) + count_tokens(content),
+            "prompt_tokens_details": {"cached_tokens": cached_tokens}
+        }
+        if not payload.get("stream"):
+            self.send_json({
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "model": payload.get("model", ""),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in re.findall(r"\s*\S+", content):
+                self.send_event({"choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+                time.sleep(self.state.stream_chunk_delay)
+            self.send_event({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if (payload.get("stream_options") or {}).get("include_usage"):
+                self.send_event({"choices": [], "usage": usage})
+            self.send_chunk(b"data: [DONE]\n\n")
+            self.send_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True # the client closed the stream early
+
+    def send_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_event(self, data: dict) -> None:
+        self.send_chunk(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+
+    def handle_embeddings(self, payload: dict) -> None:
+        texts = payload.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        embeddings = self.state.embedder.embed([str(text) for text in texts])
+        self.send_json({
+            "object": "list",
+            "model": payload.get("model", ""),
+            "data": [{"object": "embedding", "index": index, "embedding": embedding} for index, embedding in enumerate(embeddings)],
+            "usage": {"prompt_tokens": sum(count_tokens(str(text)) for text in texts), "total_tokens": sum(count_tokens(str(text)) for text in texts)}
+        })
+
+    def handle_huggingface(self, payload: dict) -> None:
+        prompt = str(payload.get("inputs", ""))
+        self.send_json([{"generated_text": f"{prompt}\nInstructions: {self.state.pick_response(prompt)}"}])
+
+    def handle_upsert(self, payload: dict) -> None:
+        vectors = payload.get("vectors", [])
+        with self.state.lock:
+            for vector in vectors:
+                self.state.vectors[vector["id"]] = (vector.get("values", []), vector.get("metadata", {}))
+        self.send_json({"upsertedCount": len(vectors)})
+
+    def handle_query(self, payload: dict) -> None:
+        query_vector = payload.get("vector", [])
+        conditions = payload.get("filter") or {}
+        with self.state.lock:
+            candidates = list(self.state.vectors.items())
+
+        matches = []
+        for vector_id, (values, metadata) in candidates:
+            if not all(self.matches_condition(metadata.get(key), condition) for key, condition in conditions.items()):
+                continue
+            matches.append({"id": vector_id, "score": self.cosine_similarity(query_vector, values), "metadata": metadata if payload.get("includeMetadata") else None})
+        matches.sort(key=lambda match: match["score"], reverse=True)
+        self.send_json({"matches": matches[:payload.get("topK", 10)], "namespace": payload.get("namespace", "")})
+
+    def handle_delete(self, payload: dict) -> None:
+        with self.state.lock:
+            if payload.get("deleteAll"):
+                self.state.vectors = {}
+            for vector_id in payload.get("ids", []) or []:
+                self.state.vectors.pop(vector_id, None)
+        self.send_json({})
+
+    @staticmethod
+    def matches_condition(value, condition) -> bool:
+        if isinstance(condition, dict):
+            if "$eq" in condition:
+                return value == condition["$eq"]
+            if "$in" in condition:
+                return value in condition["$in"]
+            return True
+        return value == condition
+
+    @staticmethod
+    def cosine_similarity(first: list[float], second: list[float]) -> float:
+        dot_product = sum(a * b for a, b in zip(first, second))
+        norms = math.sqrt(sum(a * a for a in first)) * math.sqrt(sum(b * b for b in second))
+        return dot_product / norms if norms else 0.0
+
+
+class MockHTTPServer(ThreadingHTTPServer):
+    """
+    HTTP server of the mock: a thread per connection, with a listen backlog large enough for the
+    connection bursts of the high-concurrency load tests.
+    """
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class MockServer:
+    """
+    Local stand-in of the external services used by CRANE, for offline load tests: it implements
+    the subset of the OpenAI chat completions (also streamed) and embeddings APIs, of the Hugging Face
+    inference API and of the Pinecone data plane (upsert, query, describe_index_stats, delete) that
+    CRANE uses.
+
+    Point the `endpoint` of the agents' JSON files to `<url>/v1/chat/completions` (or `<url>/models/<model>`
+    for Hugging Face), OPENAI_BASE_URL to `<url>/v1` and PINECONE_HOST to `<url>`.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 8000, state: MockState = None):
+        self.state = MockState() if state is None else state
+        self.server = MockHTTPServer((host, port), MockRequestHandler)
+        self.server.state = self.state
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def get_chat_endpoint(self) -> str:
+        return f"{self.url}/v1/chat/completions"
+
+    def start(self) -> "MockServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve_forever(self) -> None:
+        self.server.serve_forever()
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI, Hugging Face and Pinecone APIs used by CRANE.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", default="lognormal:0.5,0.5", help="latency of the LLM requests: none, fixed:<s>, uniform:<min>,<max> or lognormal:<median>,<sigma>")
+    parser.add_argument("--vector-latency", default="none", help="latency of the vector index requests, same format of --latency")
+    parser.add_argument("--error-rate-429", type=float, default=0.0, help="fraction of the LLM requests answered with 429")
+    parser.add_argument("--error-rate-503", type=float, default=0.0, help="fraction of the LLM requests answered with 503")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds of the simulated errors")
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.0, help="seconds between the chunks of a streamed completion")
+    parser.add_argument("--script", default=None, help='JSON file with the scripted responses: [{"pattern": "<regex>", "responses": ["...", ...]}, ...]')
+    return parser.parse_args(argv)
+
+
+def main(args):
+    script = None
+    if args.script is not None:
+        with open(args.script, "r") as script_file:
+            script = json.load(script_file)
+    state = MockState(script, args.latency, args.vector_latency, args.error_rate_429, args.error_rate_503, args.retry_after, args.stream_chunk_delay)
+    mock_server = MockServer(args.host, args.port, state)
+    print(f"Mock server listening on {mock_server.url}")
+    try:
+        mock_server.serve_forever()
+    except KeyboardInterrupt:
+        mock_server.stop()
+
+
+if __name__ == "__main__":
+    main(parse_arguments())
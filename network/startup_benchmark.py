@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# modules that must be loaded on first use only, never by importing the entry points
+lazy_modules = ("tiktoken", "openai", "pinecone", "numpy", "lib2to3")
+
+probe = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"import_time": elapsed, "loaded_modules": [name for name in {lazy_modules!r} if name in sys.modules]}}))
+"""
+
+
+def measure_startup(module: str, repeats: int) -> dict:
+    """
+    Imports the module in `repeats` fresh interpreters, measuring the import time (inside the
+    interpreter) and the wall time of the whole process, and collects the lazy modules that
+    were loaded by the import.
+    """
+    import_times = []
+    process_times = []
+    loaded_lazy_modules = set()
+    repository_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for _ in range(repeats):
+        start = time.perf_counter()
+        completed_process = subprocess.run(
+            [sys.executable, "-c", probe.format(module=module, lazy_modules=lazy_modules)],
+            capture_output=True, text=True, cwd=repository_path
+        )
+        process_times.append(time.perf_counter() - start)
+        if completed_process.returncode != 0:
+            raise RuntimeError(f"Unable to import {module}: {completed_process.stderr.strip()}")
+        measurement = json.loads(completed_process.stdout.strip().splitlines()[-1]) #the last line is printed by the probe
+        import_times.append(measurement["import_time"])
+        loaded_lazy_modules.update(measurement["loaded_modules"])
+    return {
+        "module": module,
+        "repeats": repeats,
+        "import_time_median": statistics.median(import_times),
+        "import_time_max": max(import_times),
+        "process_time_median": statistics.median(process_times),
+        "loaded_lazy_modules": sorted(loaded_lazy_modules)
+    }
+
+
+def check_regressions(results: list[dict], max_seconds: float, baseline: dict | None, tolerance: float) -> list[str]:
+    """
+    Returns the regressions found: lazy modules loaded at import time, process startups slower than
+    `max_seconds`, and imports slower than the baseline by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for result in results:
+        if result["loaded_lazy_modules"]:
+            regressions.append(f"{result['module']} imports {', '.join(result['loaded_lazy_modules'])} eagerly")
+        if result["process_time_median"] > max_seconds:
+            regressions.append(f"{result['module']} starts in {result['process_time_median']:.3f} s (limit {max_seconds:.3f} s)")
+        baseline_time = (baseline or {}).get(result["module"])
+        if baseline_time is not None and result["import_time_median"] > baseline_time * (1 + tolerance):
+            regressions.append(f"{result['module']} imports in {result['import_time_median']:.3f} s (baseline {baseline_time:.3f} s, tolerance {tolerance:.0%})")
+    return regressions
+
+
+def main(args) -> int:
+    results = [measure_startup(module, args.repeats) for module in args.modules]
+    for result in results:
+        print(f"{result['module']}: import {result['import_time_median'] * 1000:.1f} ms (max {result['import_time_max'] * 1000:.1f} ms), "
+              f"process {result['process_time_median'] * 1000:.1f} ms, lazy modules loaded: {result['loaded_lazy_modules'] or 'none'}")
+
+    baseline = None
+    if args.baseline is not None and os.path.exists(args.baseline):
+        with open(args.baseline, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+    regressions = check_regressions(results, args.max_seconds, baseline, args.tolerance)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as baseline_file:
+            json.dump({result["module"]: result["import_time_median"] for result in results}, baseline_file, indent=4)
+        print(f"Baseline saved in {args.save_baseline}")
+
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Measures the startup time of CRANE's entry points and fails on regressions.")
+    parser.add_argument("--modules", nargs="+", default=["network.main", "network.agents.agent_base", "network.communication.conversation_manager"], help="modules to import")
+    parser.add_argument("--repeats", type=int, default=5, help="fresh interpreters started for each module")
+    parser.add_argument("--max-seconds", type=float, default=1.0, help="maximum median wall time of an interpreter importing a module")
+    parser.add_argument("--baseline", default=None, help="JSON file with the baseline import times of the modules")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown with respect to the baseline (fraction)")
+    parser.add_argument("--save-baseline", default=None, help="saves the measured import times as a baseline")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_arguments()))
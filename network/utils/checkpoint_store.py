@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+
+from network.utils.event_log_writer import repair_torn_tail
+
+
+class CheckpointStore:
+    """
+    Durable checkpoint of the execution of a single CR.
+
+    It records the conversation id assigned to the CR, the state of the CR (running, completed or failed)
+    and every completed agent call with its response and usage, keyed by iteration, phase, agent and
+    the number of previous calls of the same agent in the same phase.
+
+    The checkpoint is a journal of JSON lines: every update is appended as a record and flushed, so the
+    cost of checkpointing a call does not grow with the calls already recorded. A crash of the process
+    can only leave the last record half written: a torn record is ignored when the journal is read, and
+    removed when the journal is resumed, so that the next record is not appended to it.
+    The journal is synced to disk when the CR is finished.
+
+    When a conversation is executed again from its checkpoint, the recorded calls are answered from
+    the checkpoint instead of contacting the provider, so the conversation restarts from its last
+    completed call. Failed calls are not recorded and are attempted again.
+    """
+    def __init__(self, file_path: str, resume: bool = False):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.data = self.load(file_path) if resume else None
+        self.truncate = self.data is None #a new checkpoint replaces the journal of a previous run
+        if not self.truncate:
+            repair_torn_tail(file_path)
+        if self.data is None:
+            self.data = {"conversation_id": None, "status": "running", "calls": {}}
+        self.restored_calls = 0
+
+    @staticmethod
+    def load(file_path: str) -> dict | None:
+        """
+        Replays the records of a journal.
+
+        Returns:
+            dict | None: The conversation id, the status and the calls of the checkpoint, or None if the
+            journal does not exist or has no valid record.
+        """
+        data = {"conversation_id": None, "status": "running", "calls": {}}
+        valid_records = 0
+        try:
+            with open(file_path, "r") as checkpoint:
+                for line in checkpoint:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue #a record torn by a crash
+                    if record.get("type") == "call":
+                        data["calls"][record["key"]] = {"response": record["response"], "usage": record["usage"]}
+                    elif record.get("type") == "conversation":
+                        data["conversation_id"] = record["conversation_id"]
+                        data["status"] = "running"
+                    elif record.get("type") == "status":
+                        data["status"] = record["status"]
+                    else:
+                        continue
+                    valid_records = valid_records + 1
+        except FileNotFoundError:
+            return None
+        return data if valid_records > 0 else None
+
+    @staticmethod
+    def make_key(iteration_id: str, phase: str, agent_name: str, call_number: int) -> str:
+        return f"{iteration_id}|{phase}|{agent_name}|{call_number}"
+
+    def append(self, record: dict, sync: bool = False) -> None:
+        """
+        Appends a record to the journal (created, or replaced if the checkpoint is new, on the first record).
+        """
+        serialized_record = json.dumps(record) + "\n"
+        with self.lock:
+            if self.truncate:
+                os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+            with open(self.file_path, "w" if self.truncate else "a") as checkpoint:
+                checkpoint.write(serialized_record)
+                checkpoint.flush()
+                if sync:
+                    os.fsync(checkpoint.fileno())
+            self.truncate = False
+
+    def get_call(self, key: str) -> dict | None:
+        """
+        Returns the recorded call ({"response": str, "usage": dict | None}), or None if the call was not completed.
+        """
+        with self.lock:
+            call = self.data["calls"].get(key)
+            if call is not None:
+                self.restored_calls = self.restored_calls + 1
+        return call
+
+    def record_call(self, key: str, response: str, usage: dict | None) -> None:
+        with self.lock:
+            self.data["calls"][key] = {"response": response, "usage": usage}
+        self.append({"type": "call", "key": key, "response": response, "usage": usage})
+
+    def get_conversation_id(self) -> str | None:
+        return self.data["conversation_id"]
+
+    def set_conversation_id(self, conversation_id: str) -> None:
+        with self.lock:
+            self.data["conversation_id"] = conversation_id
+            self.data["status"] = "running"
+        self.append({"type": "conversation", "conversation_id": conversation_id})
+
+    def mark_finished(self, error: bool) -> None:
+        with self.lock:
+            self.data["status"] = "failed" if error else "completed"
+        self.append({"type": "status", "status": self.data["status"]}, sync=True)
+
+    def get_status(self) -> str:
+        return self.data["status"]
+
+    def get_restored_calls(self) -> int:
+        return self.restored_calls
+
+    @classmethod
+    def is_completed(cls, file_path: str) -> bool:
+        data = cls.load(file_path)
+        return data is not None and data.get("status") == "completed"
@@ -0,0 +1,168 @@
+import re
+
+from network.utils.crane_tokenizer import CraneTokenizer
+
+
+def extractive_summary(items: list) -> str:
+    """
+    Default summarizer of the overflowing context: keeps the first sentence of every item.
+
+    Args:
+        items (list): The dropped items, either strings or messages (Message or {"sender": str, "content": str}).
+
+    Returns:
+        str: The summary of the items.
+    """
+    sentences = []
+    for item in items:
+        if hasattr(item, "to_dict"):
+            item = item.to_dict()
+        if isinstance(item, dict):
+            content = str(item.get("content", ""))
+            prefix = f"{item.get('sender', '')}: "
+        else:
+            content = str(item)
+            prefix = ""
+        first_sentence = re.split(r"(?<=[.!?])\s+", content.strip(), maxsplit=1)[0]
+        if first_sentence:
+            sentences.append(f"{prefix}{first_sentence}")
+    return " ".join(sentences)
+
+
+class ContextAssembler:
+    """
+    Fits the additional context of an agent (the conversation history and the RAG content)
+    within a token budget.
+
+    The context is either a string or a list of items (messages or RAG entries), which is
+    rendered in the prompt as a Python list (views of the conversation's rendered history are
+    handled like lists). When the prompt exceeds the budget, the context is reduced with one of
+    the following strategies:
+        - "drop_oldest": the oldest items are dropped.
+        - "latest_per_sender": only the latest message of each sender is kept; if it is not enough,
+          the oldest of the remaining items are dropped.
+        - "summarize": the oldest items are replaced by a single summary item, produced by a
+          pluggable summarizer (by default an extractive summary).
+    Strings that exceed the budget are truncated, keeping their end.
+
+    The number of tokens saved by each strategy is recorded.
+
+    The token counts of the rendered messages of a history are cached, so a history that grows between
+    the calls (the history is only appended to within an iteration) is tokenized once per message
+    instead of once per call.
+    """
+    STRATEGIES = ("drop_oldest", "latest_per_sender", "summarize")
+
+    def __init__(self, tokenizer: CraneTokenizer, token_budget: int, strategy: str = "drop_oldest", summarizer=None):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unsupported context strategy: {strategy}")
+        self.tokenizer = tokenizer
+        self.token_budget = token_budget
+        self.strategy = strategy
+        self.summarizer = extractive_summary if summarizer is None else summarizer
+        self.tokens_saved = {strategy_name: 0 for strategy_name in self.STRATEGIES}
+        self.reduced_contexts = 0
+        self.piece_tokens = {} #rendered message -> tokens
+        self.max_cached_pieces = 10000
+
+    def count_item_tokens(self, item) -> int:
+        return self.tokenizer.calculate_tokens_from_string(repr(item)) + 1 # +1 for the separator
+
+    def count_piece_tokens(self, piece: str) -> int:
+        tokens = self.piece_tokens.get(piece)
+        if tokens is None:
+            if len(self.piece_tokens) >= self.max_cached_pieces:
+                self.piece_tokens = {}
+            tokens = self.tokenizer.calculate_tokens_from_string(piece)
+            self.piece_tokens[piece] = tokens
+        return tokens
+
+    def count_items_tokens(self, items) -> list[int]:
+        """
+        Counts the tokens of every item, reusing the cached renderings of the items and their token counts if available.
+        """
+        if hasattr(items, "get_pieces"):
+            return [self.count_piece_tokens(piece) + 1 for piece in items.get_pieces()]
+        return [self.count_item_tokens(item) for item in items]
+
+    def count_context_tokens(self, context) -> int:
+        if hasattr(context, "get_pieces"):
+            return sum(self.count_items_tokens(context)) + 1 # +1 for the brackets
+        return self.tokenizer.calculate_tokens_from_string(str(context))
+
+    def fit(self, context, fixed_tokens: int):
+        """
+        Reduces the context so that the whole prompt fits within the token budget.
+
+        Args:
+            context (str | list): The additional context of the agent.
+            fixed_tokens (int): The number of tokens of the rest of the prompt, which cannot be reduced.
+
+        Returns:
+            str | list: The context, reduced if necessary. It has the same type of the input (except for
+            the "latest_per_sender" and "summarize" strategies, which return a list for a rendered history).
+        """
+        available_tokens = max(self.token_budget - fixed_tokens, 0)
+        original_tokens = self.count_context_tokens(context)
+        if original_tokens <= available_tokens:
+            return context
+
+        if isinstance(context, str):
+            reduced_context = self.tokenizer.truncate_string(context, available_tokens)
+        elif self.strategy == "latest_per_sender":
+            reduced_context = self.drop_oldest(self.keep_latest_per_sender(list(context)), available_tokens)
+        elif self.strategy == "summarize":
+            reduced_context = self.summarize_overflow(list(context), available_tokens)
+        else:
+            reduced_context = self.drop_oldest(context, available_tokens) #views of the rendered history are sliced without rendering the messages again
+
+        self.tokens_saved[self.strategy] = self.tokens_saved[self.strategy] + original_tokens - self.count_context_tokens(reduced_context)
+        self.reduced_contexts = self.reduced_contexts + 1
+        return reduced_context
+
+    def count_overflow(self, items: list, available_tokens: int) -> int:
+        """
+        Returns the number of oldest items that have to be dropped to fit in the available tokens.
+        """
+        item_tokens = self.count_items_tokens(items)
+        total_tokens = sum(item_tokens) + 1 # +1 for the brackets
+        overflow = 0
+        while overflow < len(items) and total_tokens > available_tokens:
+            total_tokens = total_tokens - item_tokens[overflow]
+            overflow = overflow + 1
+        return overflow
+
+    def drop_oldest(self, items: list, available_tokens: int) -> list:
+        return items[self.count_overflow(items, available_tokens):]
+
+    @staticmethod
+    def keep_latest_per_sender(items: list) -> list:
+        latest_positions = {}
+        for position, item in enumerate(items):
+            sender = item.get("sender") if isinstance(item, dict) else getattr(item, "sender", None)
+            latest_positions[sender if sender is not None else ("item", position)] = position
+        kept_positions = set(latest_positions.values())
+        return [item for position, item in enumerate(items) if position in kept_positions]
+
+    def summarize_overflow(self, items: list, available_tokens: int) -> list:
+        overflow = self.count_overflow(items, available_tokens)
+        if overflow == 0:
+            return items
+        kept_items = items[overflow:]
+        summary_item = {"sender": "Summary", "content": self.summarizer(items[:overflow])}
+
+        # the summary takes the place of the dropped items, so other items may need to be dropped to make room for it
+        summary_tokens = self.count_item_tokens(summary_item)
+        while kept_items and self.count_context_tokens(kept_items) + summary_tokens > available_tokens:
+            kept_items = kept_items[1:]
+        remaining_tokens = available_tokens - self.count_context_tokens(kept_items) - self.count_item_tokens({"sender": "Summary", "content": ""})
+        summary_item["content"] = self.tokenizer.truncate_string(summary_item["content"], remaining_tokens, keep_end=False)
+        if not summary_item["content"]:
+            return kept_items
+        return [summary_item] + kept_items
+
+    def get_tokens_saved(self) -> dict:
+        return dict(self.tokens_saved)
+
+    def get_reduced_contexts(self) -> int:
+        return self.reduced_contexts
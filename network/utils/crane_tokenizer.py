@@ -1,10 +1,35 @@
-import tiktoken
+import threading
+
+shared_encodings = {} #model -> tiktoken encoding, shared by every tokenizer of the process
+shared_encodings_lock = threading.Lock()
+
+
+def get_shared_encoding(model: str):
+    """
+    Returns the tiktoken encoding of the model, loading it on the first request only.
+    tiktoken itself is imported here, so that importing the agents does not load it.
+    """
+    encoding = shared_encodings.get(model)
+    if encoding is None:
+        with shared_encodings_lock:
+            encoding = shared_encodings.get(model)
+            if encoding is None:
+                import tiktoken
+                encoding = tiktoken.encoding_for_model(model)
+                shared_encodings[model] = encoding
+    return encoding
+
 
 class CraneTokenizer:
     def __init__(self, model):
         self.input_tokens = 0
         self.output_tokens = 0
-        self.encoding = tiktoken.encoding_for_model(model)
+        self.model = model
+
+    @property
+    def encoding(self):
+        # the encoding is loaded when the first string is tokenized, and shared by all the agents
+        return get_shared_encoding(self.model)
 
     def get_input_tokens(self) -> int:
         return self.input_tokens
@@ -26,4 +51,24 @@ class CraneTokenizer:
 
     def calculate_tokens_from_string(self, string: str) -> int:
         tokens = self.encoding.encode(string)
-        return len(tokens)
\ No newline at end of file
+        return len(tokens)
+
+    def truncate_string(self, string: str, max_tokens: int, keep_end: bool = True) -> str:
+        """
+        Truncates a string to at most `max_tokens` tokens.
+
+        Args:
+            string (str): The string to truncate.
+            max_tokens (int): The maximum number of tokens of the result.
+            keep_end (bool): If True the last tokens are kept, otherwise the first ones.
+
+        Returns:
+            str: The truncated string.
+        """
+        tokens = self.encoding.encode(string)
+        if len(tokens) <= max_tokens:
+            return string
+        if max_tokens <= 0:
+            return ""
+        kept_tokens = tokens[-max_tokens:] if keep_end else tokens[:max_tokens]
+        return self.encoding.decode(kept_tokens)
@@ -0,0 +1,235 @@
+import itertools
+import json
+import mmap
+import os
+import tempfile
+import zlib
+
+snippet_prefix = "before_"
+task_prefix = "cr_task_"
+
+
+def get_cr_id(file_name: str) -> str:
+    """
+    Returns the id of the CR of a snippet (before_<id>.java) or of a task description (cr_task_<id>.json).
+    """
+    cr_id, _ = os.path.splitext(file_name)
+    for prefix in (snippet_prefix, task_prefix):
+        if cr_id.startswith(prefix):
+            return cr_id[len(prefix):]
+    return cr_id
+
+
+def get_shard(cr_id: str, shard_count: int) -> int:
+    """
+    Returns the shard of a CR: the partitioning depends only on the CR id, so it is the same on
+    every machine and for every ordering of the dataset.
+    """
+    return zlib.crc32(cr_id.encode("utf-8")) % shard_count
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """
+    Parses a shard written as "i/N" (the shard i, from 0 to N - 1, out of N).
+
+    Raises:
+        ValueError: If the shard is malformed or out of range.
+    """
+    try:
+        shard_index, shard_count = (int(part) for part in shard.split("/"))
+    except ValueError:
+        raise ValueError(f"The shard must be written as i/N, not {shard}")
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"The shard {shard} does not exist: i must be between 0 and N - 1")
+    return shard_index, shard_count
+
+
+def get_shard_namespace(shard: tuple[int, int]) -> str:
+    """
+    Returns the name of the folder in which a shard writes its outputs.
+    """
+    return f"shard_{shard[0]}_of_{shard[1]}"
+
+
+class DatasetRecord:
+    """
+    A CR of the dataset: its snippet and its task description, which are read only when needed.
+    """
+    __slots__ = ("cr_id", "snippet_path", "task_path", "snippet_size")
+
+    def __init__(self, cr_id: str, snippet_path: str, task_path: str, snippet_size: int):
+        self.cr_id = cr_id
+        self.snippet_path = snippet_path
+        self.task_path = task_path
+        self.snippet_size = snippet_size
+
+    def get_cr_id(self) -> str:
+        return self.cr_id
+
+    def get_snippet_name(self) -> str:
+        return os.path.basename(self.snippet_path)
+
+    def get_snippet_size(self) -> int:
+        return self.snippet_size
+
+    def read_snippet(self, mmap_threshold: int = 1 << 20) -> str:
+        """
+        Reads the snippet. Snippets larger than `mmap_threshold` bytes are memory mapped and decoded
+        in place, instead of being copied through the file buffers.
+
+        Raises:
+            OSError: If the snippet cannot be read.
+        """
+        with open(self.snippet_path, "rb") as snippet:
+            size = os.fstat(snippet.fileno()).st_size
+            if size < mmap_threshold or size == 0:
+                return snippet.read().decode("utf-8")
+            with mmap.mmap(snippet.fileno(), 0, access=mmap.ACCESS_READ) as mapped_snippet:
+                with memoryview(mapped_snippet) as view:
+                    return str(view, "utf-8")
+
+    def read_task(self) -> str:
+        """
+        Reads the task of the CR (the "cr_task" field of its description).
+
+        Raises:
+            OSError: If the task description cannot be read.
+            ValueError: If the task description is not valid JSON or it has no task.
+        """
+        with open(self.task_path, "r") as task_description:
+            task = json.load(task_description).get("cr_task")
+        if not task:
+            raise ValueError(f"The task description {os.path.basename(self.task_path)} has no cr_task")
+        return task
+
+
+class DatasetLoader:
+    """
+    Loads the CRs of the dataset (snippets/before_<id>.java and tasks_description/cr_task_<id>.json).
+
+    The snippets and the task descriptions are paired by CR id in a manifest, written next to the
+    dataset as JSON lines ({"cr_id", "snippet", "task", "snippet_size"}, sorted by CR id). The manifest
+    is built once, by scanning the folders, and it is rebuilt only when a file is added to or removed
+    from them (i.e. when a folder is newer than the manifest): every other run streams the records
+    from the manifest without listing the folders or reading the files.
+    CRs missing either the snippet or the task description are left out of the manifest, and their files
+    are listed in a sidecar file (<manifest>_unpaired.json), so they are reported by every run.
+
+    Rewriting a file in place does not change the modification time of its folder, so the manifest is not
+    rebuilt and keeps the previous size of a rewritten snippet (used by the size filters): the manifest
+    has to be rebuilt explicitly (`ensure_manifest(rebuild=True)`, --rebuild-manifest) after such a change.
+    """
+    def __init__(self, dataset_path: str, manifest_path: str = None):
+        self.dataset_path = dataset_path
+        self.snippets_folder = os.path.join(dataset_path, "snippets")
+        self.tasks_description_folder = os.path.join(dataset_path, "tasks_description")
+        self.manifest_path = manifest_path or os.path.join(dataset_path, "manifest.jsonl")
+        self.unpaired_path = f"{os.path.splitext(self.manifest_path)[0]}_unpaired.json"
+        self.unpaired_files = None #read from the sidecar file on first use, unless the manifest is built by this loader
+
+    def get_manifest_path(self) -> str:
+        return self.manifest_path
+
+    def get_unpaired_files(self) -> list[str]:
+        """
+        Returns the files left out of the manifest because their snippet or task description is missing.
+        """
+        if self.unpaired_files is None:
+            try:
+                with open(self.unpaired_path, "r") as unpaired:
+                    self.unpaired_files = json.load(unpaired)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self.unpaired_files = []
+        return self.unpaired_files
+
+    def is_manifest_stale(self) -> bool:
+        try:
+            manifest_time = os.stat(self.manifest_path).st_mtime
+        except FileNotFoundError:
+            return True
+        return any(os.stat(folder).st_mtime > manifest_time for folder in (self.snippets_folder, self.tasks_description_folder))
+
+    def build_manifest(self) -> int:
+        """
+        Scans the dataset's folders, pairs the snippets with the task descriptions by CR id and writes
+        the manifest (atomically, so concurrent runs never read a partial manifest).
+
+        Returns:
+            int: The number of CRs in the manifest.
+        """
+        snippets = {}
+        with os.scandir(self.snippets_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.startswith(snippet_prefix):
+                    snippets[get_cr_id(entry.name)] = (entry.name, entry.stat().st_size)
+        tasks = {}
+        with os.scandir(self.tasks_description_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.startswith(task_prefix):
+                    tasks[get_cr_id(entry.name)] = entry.name
+
+        self.unpaired_files = sorted([snippets[cr_id][0] for cr_id in snippets.keys() - tasks.keys()] + [tasks[cr_id] for cr_id in tasks.keys() - snippets.keys()])
+        cr_ids = sorted(snippets.keys() & tasks.keys())
+        self.write_atomically(self.unpaired_path, [json.dumps(self.unpaired_files)])
+        self.write_atomically(self.manifest_path, (json.dumps({"cr_id": cr_id, "snippet": snippets[cr_id][0], "task": tasks[cr_id], "snippet_size": snippets[cr_id][1]}) for cr_id in cr_ids))
+        return len(cr_ids)
+
+    @staticmethod
+    def write_atomically(file_path: str, lines) -> None:
+        directory = os.path.dirname(file_path) or "."
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=".manifest", suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "w") as output:
+                for line in lines:
+                    output.write(line + "\n")
+            os.replace(temporary_path, file_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    def ensure_manifest(self, rebuild: bool = False) -> None:
+        if rebuild or self.is_manifest_stale():
+            self.build_manifest()
+
+    def iterate_manifest(self):
+        with open(self.manifest_path, "r") as manifest:
+            for line in manifest:
+                if line.strip():
+                    yield json.loads(line)
+
+    def records(self, start: int = 0, end: int = None, shard: tuple[int, int] = None, min_size: int = None, max_size: int = None):
+        """
+        Lazily yields the CRs of the dataset, in CR id order.
+
+        Args:
+            start (int): Index of the first CR (of the whole dataset) to yield.
+            end (int): Index after the last CR to yield (default: the last CR).
+            shard (tuple[int, int]): (index, count): only the CRs whose id is hashed to the shard `index`
+                out of `count` are yielded.
+            min_size (int): Minimum size of the snippets, in bytes.
+            max_size (int): Maximum size of the snippets, in bytes.
+
+        Yields:
+            DatasetRecord: The CRs that match the filters.
+        """
+        self.ensure_manifest()
+        for entry in itertools.islice(self.iterate_manifest(), start, end):
+            if shard is not None and get_shard(entry["cr_id"], shard[1]) != shard[0]:
+                continue
+            if min_size is not None and entry["snippet_size"] < min_size:
+                continue
+            if max_size is not None and entry["snippet_size"] > max_size:
+                continue
+            yield DatasetRecord(
+                entry["cr_id"],
+                os.path.join(self.snippets_folder, entry["snippet"]),
+                os.path.join(self.tasks_description_folder, entry["task"]),
+                entry["snippet_size"]
+            )
+
+    def count(self, **filters) -> int:
+        """
+        Counts the CRs matching the filters of `records`, reading only the manifest.
+        """
+        return sum(1 for _ in self.records(**filters))
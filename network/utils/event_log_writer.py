@@ -0,0 +1,155 @@
+import atexit
+import json
+import os
+import threading
+
+from network.config import event_log_flush_interval, event_log_fsync
+
+
+def repair_torn_tail(file_path: str) -> None:
+    """
+    Repairs the last line of a JSON lines file left without its trailing newline by a crash, so that the
+    next appended record starts on its own line. A complete record is terminated, a torn one is removed.
+    """
+    try:
+        with open(file_path, "r+b") as log:
+            size = log.seek(0, os.SEEK_END)
+            if size == 0:
+                return None
+            log.seek(size - 1)
+            if log.read(1) == b"\n":
+                return None
+            line_start = 0
+            position = size
+            while position > 0:
+                chunk_start = max(position - 4096, 0)
+                log.seek(chunk_start)
+                newline = log.read(position - chunk_start).rfind(b"\n")
+                if newline >= 0:
+                    line_start = chunk_start + newline + 1
+                    break
+                position = chunk_start
+            log.seek(line_start)
+            try:
+                json.loads(log.read(size - line_start))
+                log.write(b"\n")
+            except ValueError:
+                log.truncate(line_start)
+    except FileNotFoundError:
+        return None
+
+
+class EventLogWriter:
+    """
+    Buffered writer of append-only JSON lines logs.
+
+    Records are serialized when they are appended (so later changes of the data are not logged)
+    and kept in memory; a background thread appends them to their logs every `flush_interval`
+    seconds, or earlier when `max_buffered_records` records are waiting. Logs are opened only
+    while they are flushed, so any number of logs can be written without keeping files open.
+    The first time a log is written, a line torn by a previous crash is repaired (see `repair_torn_tail`).
+
+    The durability is selected by the fsync policy:
+        - "always": every record is written and fsynced before `append` returns.
+        - "interval": the logs are fsynced after every background flush.
+        - "never": the data is left to the operating system's cache.
+    """
+    FSYNC_POLICIES = ("always", "interval", "never")
+
+    def __init__(self, flush_interval: float = None, fsync_policy: str = None, max_buffered_records: int = 1000):
+        self.flush_interval = event_log_flush_interval if flush_interval is None else flush_interval
+        self.fsync_policy = event_log_fsync if fsync_policy is None else fsync_policy
+        if self.fsync_policy not in self.FSYNC_POLICIES:
+            raise ValueError(f"Unsupported fsync policy: {self.fsync_policy}")
+        self.max_buffered_records = max_buffered_records
+        self.pending = {} #log path -> serialized records waiting to be written
+        self.repaired_logs = set() #logs whose tail has been checked by this writer
+        self.pending_records = 0
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock() #flushes are serialized, so the records of a log keep their order
+        self.wake_up = threading.Event()
+        self.stopped = False
+        self.thread = None
+        self.records = 0
+        self.flushes = 0
+        self.fsyncs = 0
+        self.written_bytes = 0
+
+    def append(self, log_path: str, record: dict) -> None:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self.lock:
+            self.pending.setdefault(log_path, []).append(line)
+            self.pending_records = self.pending_records + 1
+            self.records = self.records + 1
+            buffer_full = self.pending_records >= self.max_buffered_records
+            if self.thread is None and self.fsync_policy != "always":
+                self.thread = threading.Thread(target=self.run, name="event-log-writer", daemon=True)
+                self.thread.start()
+        if self.fsync_policy == "always":
+            self.flush()
+        elif buffer_full:
+            self.wake_up.set()
+
+    def run(self) -> None:
+        while not self.stopped:
+            self.wake_up.wait(self.flush_interval)
+            self.wake_up.clear()
+            self.flush()
+
+    def flush(self, fsync: bool = None) -> None:
+        """
+        Appends the pending records to their logs.
+
+        Args:
+            fsync (bool, optional): Whether the logs are fsynced; by default, according to the fsync policy.
+        """
+        if fsync is None:
+            fsync = self.fsync_policy != "never"
+        with self.flush_lock:
+            with self.lock:
+                pending = self.pending
+                self.pending = {}
+                self.pending_records = 0
+            for log_path, lines in pending.items():
+                if log_path not in self.repaired_logs:
+                    repair_torn_tail(log_path)
+                    self.repaired_logs.add(log_path)
+                data = "".join(lines).encode("utf-8")
+                with open(log_path, "ab") as log:
+                    log.write(data)
+                    if fsync:
+                        log.flush()
+                        os.fsync(log.fileno())
+                        self.fsyncs = self.fsyncs + 1
+                self.written_bytes = self.written_bytes + len(data)
+            if pending:
+                self.flushes = self.flushes + 1
+
+    def close(self) -> None:
+        """
+        Stops the background thread and writes the remaining records.
+        """
+        self.stopped = True
+        self.wake_up.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+        self.stopped = False
+
+    def get_statistics(self) -> dict:
+        return {
+            "records": self.records,
+            "flushes": self.flushes,
+            "fsyncs": self.fsyncs,
+            "written_bytes": self.written_bytes,
+            "fsync_policy": self.fsync_policy
+        }
+
+
+shared_event_log_writer = EventLogWriter()
+atexit.register(shared_event_log_writer.close)
+
+
+def get_event_log_writer() -> EventLogWriter:
+    return shared_event_log_writer
@@ -0,0 +1,120 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from network.config import http_pool_connections, http_pool_maxsize
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that keeps track of the urllib3 connection pools it uses, so that the number
+    of requests sent and of connections opened can be read back for statistics.
+    """
+    def __init__(self, *args, **kwargs):
+        self.connection_pools = []
+        super().__init__(*args, **kwargs)
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        connection_pool = super().get_connection_with_tls_context(request, verify, proxies=proxies, cert=cert)
+        if not any(pool is connection_pool for pool in self.connection_pools):
+            self.connection_pools.append(connection_pool)
+        return connection_pool
+
+    def get_requests_count(self) -> int:
+        return sum(pool.num_requests for pool in self.connection_pools)
+
+    def get_connections_count(self) -> int:
+        return sum(pool.num_connections for pool in self.connection_pools)
+
+
+class HttpSessionPool:
+    """
+    Process-wide registry of keep-alive HTTP sessions, one for each endpoint (scheme and host).
+
+    Every agent sending requests to the same provider shares the same session, hence the same
+    pool of TCP/TLS connections, avoiding a new handshake for each request.
+    """
+    def __init__(self, pool_connections: int = None, pool_maxsize: int = None):
+        self.pool_connections = http_pool_connections if pool_connections is None else pool_connections
+        self.pool_maxsize = http_pool_maxsize if pool_maxsize is None else pool_maxsize
+        self.sessions = {}
+        self.adapters = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_endpoint_key(url: str) -> str:
+        split_url = urlsplit(url)
+        return f"{split_url.scheme}://{split_url.netloc}"
+
+    def get_session(self, url: str) -> requests.Session:
+        """
+        Returns the session associated to the endpoint of the given url, creating it on first use.
+
+        Args:
+            url (str): The url the request will be sent to.
+
+        Returns:
+            requests.Session: The pooled session for the url's endpoint.
+        """
+        endpoint_key = self.get_endpoint_key(url)
+        session = self.sessions.get(endpoint_key)
+        if session is not None:
+            return session
+
+        with self.lock:
+            session = self.sessions.get(endpoint_key)
+            if session is None:
+                adapter = CountingHTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session = requests.Session()
+                session.mount(f"{endpoint_key}/", adapter)
+                session.headers.update({"Connection": "keep-alive"})
+                self.adapters[endpoint_key] = adapter
+                self.sessions[endpoint_key] = session
+            return session
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.get_session(url).post(url, **kwargs)
+
+    def get_statistics(self) -> dict:
+        """
+        Collects the connection reuse statistics of every endpoint.
+
+        Returns:
+            dict: For each endpoint, the number of requests sent, of connections opened,
+                  of requests served by an already open connection and the reuse ratio.
+        """
+        statistics = {}
+        for endpoint_key, adapter in list(self.adapters.items()):
+            requests_count = adapter.get_requests_count()
+            connections_count = adapter.get_connections_count()
+            reused_connections = max(requests_count - connections_count, 0)
+            statistics[endpoint_key] = {
+                "requests": requests_count,
+                "new_connections": connections_count,
+                "reused_connections": reused_connections,
+                "reuse_ratio": reused_connections / requests_count if requests_count else 0.0
+            }
+        return statistics
+
+    def get_statistics_as_text(self) -> str:
+        lines = []
+        for endpoint_key, statistics in self.get_statistics().items():
+            lines.append(f"   {endpoint_key}: {statistics['requests']} requests, {statistics['new_connections']} connections opened, "
+                         f"{statistics['reused_connections']} reused ({statistics['reuse_ratio']:.0%})")
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+            self.adapters = {}
+
+
+shared_session_pool = HttpSessionPool()
+
+
+def get_session_pool() -> HttpSessionPool:
+    return shared_session_pool
@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import threading
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+class InterProcessLock:
+    """
+    Exclusive lock based on a lock file, used to serialize the access to a file shared by several processes.
+    """
+    def __init__(self, lock_path: str):
+        self.lock_path = lock_path
+        self.lock_file = None
+
+    def __enter__(self):
+        self.lock_file = open(self.lock_path, "a+")
+        if os.name == "nt":
+            self.lock_file.seek(0)
+            msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if os.name == "nt":
+                self.lock_file.seek(0)
+                msvcrt.locking(self.lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self.lock_file.close()
+            self.lock_file = None
+
+
+class IdAllocator:
+    """
+    Allocates unique conversation ids backed by the `conversation_id.json` file.
+
+    The file stores the next free conversation id. Every allocation reserves an id under an
+    inter-process lock and persists the new value atomically, so concurrent threads and processes
+    always obtain different ids. Once allocated, the id lives in memory: reading it again does not
+    require any file access.
+
+    An allocator can be restricted to the ids congruent to `id_offset` modulo `id_stride`: the shard
+    `i` of `N` allocates i, i + N, i + 2N, ..., so the ids allocated by different shards never collide.
+    """
+    def __init__(self, file_path: str, id_offset: int = 0, id_stride: int = 1):
+        self.file_path = file_path
+        self.lock_path = f"{file_path}.lock"
+        self.thread_lock = threading.Lock()
+        self.id_offset = id_offset
+        self.id_stride = id_stride
+
+    def read_data(self) -> dict:
+        try:
+            with open(self.file_path, "r") as id_file:
+                return json.load(id_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"conversation_id": "0", "iteration_id": "0"}
+
+    def write_data(self, data: dict) -> None:
+        """
+        Writes the data into a temporary file which then replaces the original one, so that
+        readers never observe a partially written file.
+        """
+        directory = os.path.dirname(self.file_path) or "."
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=".conversation_id", suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "w") as temporary_file:
+                json.dump(data, temporary_file, indent=4)
+                temporary_file.flush()
+                os.fsync(temporary_file.fileno())
+            os.replace(temporary_path, self.file_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    def allocate_conversation_id(self) -> str:
+        """
+        Reserves the next free conversation id.
+
+        Returns:
+            str: The reserved conversation id.
+        """
+        with self.thread_lock, InterProcessLock(self.lock_path):
+            data = self.read_data()
+            conversation_id = int(data.get("conversation_id", "0"))
+            conversation_id = conversation_id + (self.id_offset - conversation_id) % self.id_stride #the first id of the allocator not lower than the stored one
+            data["conversation_id"] = str(conversation_id + self.id_stride)
+            self.write_data(data)
+        return str(conversation_id)
+
+    def get_next_conversation_id(self) -> str:
+        with self.thread_lock, InterProcessLock(self.lock_path):
+            return str(self.read_data().get("conversation_id", "0"))
+
+    def reset(self) -> None:
+        with self.thread_lock, InterProcessLock(self.lock_path):
+            data = self.read_data()
+            data["conversation_id"] = "0"
+            data["iteration_id"] = "0"
+            self.write_data(data)
+
+
+id_allocators = {}
+id_allocators_lock = threading.Lock()
+
+
+def get_id_allocator(file_path: str, id_offset: int = 0, id_stride: int = 1) -> IdAllocator:
+    """
+    Returns the allocator associated to the given file, shared by every caller of the process.
+    """
+    absolute_path = os.path.abspath(file_path)
+    with id_allocators_lock:
+        if absolute_path not in id_allocators:
+            id_allocators[absolute_path] = IdAllocator(absolute_path, id_offset, id_stride)
+        return id_allocators[absolute_path]
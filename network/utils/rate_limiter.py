@@ -0,0 +1,110 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `capacity` tokens per minute.
+
+    Callers reserve tokens in advance: the bucket may go in debt, and the caller is told how long
+    it has to wait before the reserved tokens are actually available. This keeps the requests in
+    order of arrival without holding any lock while waiting.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.refill_rate = capacity / 60
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_rate)
+        self.last_refill = now
+        self.tokens = self.tokens - min(amount, self.capacity)
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_rate
+
+
+class RateLimiter:
+    """
+    Client-side limiter of the requests sent to a model of a provider, shared by every agent using it.
+
+    It enforces a requests-per-minute and a tokens-per-minute budget (a budget of 0 is unlimited),
+    and pauses every request after the provider asked to retry later (Retry-After). The time spent
+    waiting is collected as a metric.
+    """
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+        self.acquisitions = 0
+        self.delayed_acquisitions = 0
+        self.total_wait = 0.0
+        self.penalties = 0
+
+    def limits_tokens(self) -> bool:
+        return self.tokens_bucket is not None
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Reserves the capacity for a request.
+
+        Args:
+            tokens (int): The estimated number of tokens of the request (prompt and completion).
+
+        Returns:
+            float: The seconds to wait before sending the request.
+        """
+        with self.lock:
+            now = time.monotonic()
+            wait = max(self.blocked_until - now, 0.0)
+            if self.requests_bucket is not None:
+                wait = max(wait, self.requests_bucket.reserve(1, now))
+            if self.tokens_bucket is not None:
+                wait = max(wait, self.tokens_bucket.reserve(tokens, now))
+            self.acquisitions = self.acquisitions + 1
+            if wait > 0:
+                self.delayed_acquisitions = self.delayed_acquisitions + 1
+                self.total_wait = self.total_wait + wait
+        return wait
+
+    def penalize(self, seconds: float) -> None:
+        """
+        Blocks every request to the model for the given seconds, e.g. after a 429 response with a Retry-After header.
+        """
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.penalties = self.penalties + 1
+
+    def get_statistics(self) -> dict:
+        with self.lock:
+            return {
+                "acquisitions": self.acquisitions,
+                "delayed_acquisitions": self.delayed_acquisitions,
+                "total_wait": round(self.total_wait, 6),
+                "penalties": self.penalties
+            }
+
+
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str, model: str, requests_per_minute: int = 0, tokens_per_minute: int = 0) -> RateLimiter:
+    """
+    Returns the rate limiter of the given provider's model, shared by every agent of the process.
+    The limits are set by the first caller.
+    """
+    key = (provider, model)
+    with rate_limiters_lock:
+        if key not in rate_limiters:
+            rate_limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return rate_limiters[key]
+
+
+def get_rate_limiters_statistics() -> dict:
+    with rate_limiters_lock:
+        limiters = dict(rate_limiters)
+    return {f"{provider}/{model}": limiter.get_statistics() for (provider, model), limiter in limiters.items()}
@@ -0,0 +1,138 @@
+import glob
+import json
+import os
+import re
+import threading
+
+from network.utils.checkpoint_store import CheckpointStore
+
+change_file_regex = re.compile(r"change_(.+)\.json$")
+
+
+class ReplaySource:
+    """
+    Recorded agent responses of a single CR, which answer the agent calls of a replayed conversation
+    instead of the provider.
+
+    The calls are keyed like the calls of a checkpoint (iteration, phase, agent and call number), so
+    a recording can be:
+        - a recording log: the checkpoint of the CR, which contains every completed call with its
+          usage, in the exact order in which the calls were issued;
+        - the saved artifacts of the conversation (responses.json, summary.json and change_*.json of
+          every iteration), from which the keys are reconstructed. The artifacts contain neither the
+          usage nor the failed calls, so they only reproduce conversations whose calls all succeeded.
+    """
+    def __init__(self, calls: dict, conversation_id: str | None = None, origin: str = ""):
+        self.calls = calls
+        self.conversation_id = conversation_id
+        self.origin = origin
+        self.replayed_calls = 0
+        self.missing_calls = 0
+
+    @classmethod
+    def from_recording(cls, file_path: str) -> "ReplaySource | None":
+        data = CheckpointStore.load(file_path)
+        if data is None:
+            return None
+        return cls(data["calls"], data.get("conversation_id"), file_path)
+
+    @classmethod
+    def from_artifacts(cls, conversation_path: str) -> "ReplaySource":
+        """
+        Reconstructs the calls from the outputs of a conversation. In every iteration, the first
+        response of a reviewer answered its initial review and the following ones the subsequent rounds.
+        """
+        calls = {}
+        iteration_paths = glob.glob(os.path.join(conversation_path, "iteration_*"))
+        for iteration_path in sorted(iteration_paths, key=lambda path: int(path.rsplit("_", 1)[1])):
+            iteration_id = iteration_path.rsplit("_", 1)[1]
+            responses = cls.read_messages(os.path.join(iteration_path, "responses.json"), "responses")
+            call_counters = {}
+            for message in responses:
+                call_number = call_counters.get(message["sender"], 0)
+                call_counters[message["sender"]] = call_number + 1
+                if call_number == 0:
+                    key = CheckpointStore.make_key(iteration_id, "initial_review", message["sender"], 0)
+                else:
+                    key = CheckpointStore.make_key(iteration_id, "subsequent_round", message["sender"], call_number - 1)
+                calls[key] = {"response": cls.get_raw_response(message), "usage": None}
+            for message in cls.read_messages(os.path.join(iteration_path, "summary.json"), "response"):
+                calls[CheckpointStore.make_key(iteration_id, "summarization", message["sender"], 0)] = {"response": cls.get_raw_response(message), "usage": None}
+            for change_file in glob.glob(os.path.join(iteration_path, "change_*.json")):
+                for message in cls.read_messages(change_file, "response"):
+                    calls[CheckpointStore.make_key(iteration_id, "feedback", message["sender"], 0)] = {"response": cls.get_raw_response(message), "usage": None}
+        conversation_id = os.path.basename(os.path.normpath(conversation_path)).replace("conversation_", "")
+        return cls(calls, conversation_id, conversation_path)
+
+    @staticmethod
+    def read_messages(file_path: str, field: str) -> list[dict]:
+        try:
+            with open(file_path, "r") as output:
+                return json.load(output).get(field, [])
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def get_raw_response(message: dict) -> str:
+        """
+        Rebuilds a response from its saved message: the "in response to" pattern, removed from the
+        content when the message was created, is put back (at the end, where it cannot absorb the
+        following characters) so that the message is parsed again in the same way.
+        """
+        if message.get("in response to"):
+            return f"{message['content']}in response to: {message['in response to']}"
+        return message["content"]
+
+    @staticmethod
+    def index_artifacts(base_path: str) -> dict:
+        """
+        Maps the names of the CRs to the folders of the conversations that produced their changes.
+        """
+        conversation_paths = {}
+        for change_file in glob.glob(os.path.join(base_path, "conversation_*", "iteration_*", "change_*.json")):
+            cr_name = change_file_regex.search(os.path.basename(change_file)).group(1)
+            conversation_paths[cr_name] = os.path.dirname(os.path.dirname(change_file))
+        return conversation_paths
+
+    def get_call(self, key: str) -> dict | None:
+        call = self.calls.get(key)
+        if call is None:
+            self.missing_calls = self.missing_calls + 1
+        else:
+            self.replayed_calls = self.replayed_calls + 1
+        return call
+
+    def get_conversation_id(self) -> str | None:
+        return self.conversation_id
+
+    def get_origin(self) -> str:
+        return self.origin
+
+    def get_replayed_calls(self) -> int:
+        return self.replayed_calls
+
+    def get_missing_calls(self) -> int:
+        return self.missing_calls
+
+
+class ReplayIndex:
+    """
+    Locates the recording of every CR in a folder, which contains either recording logs (checkpoints,
+    named after the CRs) or the outputs of a previous run (the conversations' folders).
+    """
+    def __init__(self, recordings_path: str):
+        self.recordings_path = recordings_path
+        self.conversation_paths = None #indexed on first use, only if a CR has no recording log
+        self.lock = threading.Lock()
+
+    def get_source(self, cr_name: str) -> ReplaySource | None:
+        source = ReplaySource.from_recording(os.path.join(self.recordings_path, f"{cr_name}.jsonl"))
+        if source is not None:
+            return source
+        with self.lock:
+            if self.conversation_paths is None:
+                self.conversation_paths = ReplaySource.index_artifacts(self.recordings_path)
+        conversation_path = self.conversation_paths.get(cr_name)
+        if conversation_path is None:
+            return None
+        return ReplaySource.from_artifacts(conversation_path)
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from network.config import response_cache_max_bytes, response_cache_max_entries, response_cache_mode, response_cache_path, response_cache_ttl
+
+
+class CachedResponse:
+    """
+    Minimal replacement of `requests.Response` built from a cached response body, so that
+    cached responses can be processed exactly as the ones received from the provider.
+    """
+    def __init__(self, text: str, status_code: int = 200):
+        self.text = text
+        self.status_code = status_code
+        self.headers = {}
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of the providers' responses, stored in a local SQLite database.
+
+    Responses are keyed by the hash of the provider, the model and the full payload, so a response
+    is reused only if the exact same request has already been sent. The least recently used entries
+    are evicted when the cache exceeds its size limits, and entries older than the TTL are discarded.
+
+    Supported modes:
+        - "off": the cache is not used.
+        - "read_through": cached responses are returned; misses are sent to the provider and stored.
+        - "record_only": every request is sent to the provider and its response is stored.
+        - "replay_only": only cached responses are returned; misses are never sent to the provider.
+    """
+    MODES = ("off", "read_through", "record_only", "replay_only")
+
+    def __init__(self, path: str, mode: str = "read_through", max_entries: int = 0, max_bytes: int = 0, ttl: float = 0):
+        if mode not in self.MODES:
+            raise ValueError(f"Unsupported response cache mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.connection = None
+        if self.mode != "off":
+            self.connection = self.connect()
+
+    def connect(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, body TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+        connection.commit()
+        return connection
+
+    def is_enabled(self) -> bool:
+        return self.mode != "off"
+
+    def is_replay_only(self) -> bool:
+        return self.mode == "replay_only"
+
+    @staticmethod
+    def make_key(provider: str, model: str, payload: dict) -> str:
+        serialized_request = json.dumps([provider, model, payload], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(serialized_request.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> CachedResponse | None:
+        """
+        Looks up a cached response.
+
+        Args:
+            key (str): The key of the request, computed by `make_key`.
+
+        Returns:
+            CachedResponse | None: The cached response, or None if it is not cached, it expired
+            or the cache mode does not allow reads.
+        """
+        if self.mode not in ("read_through", "replay_only"):
+            return None
+
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT body, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl and now - row[1] > self.ttl:
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.connection.commit()
+                self.evictions = self.evictions + 1
+                row = None
+            if row is None:
+                self.misses = self.misses + 1
+                return None
+            self.connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+            self.hits = self.hits + 1
+        return CachedResponse(row[0])
+
+    def put(self, key: str, body: str) -> None:
+        """
+        Stores the body of a successful response and evicts the entries exceeding the cache limits.
+
+        Args:
+            key (str): The key of the request, computed by `make_key`.
+            body (str): The body of the response.
+        """
+        if self.mode not in ("read_through", "record_only"):
+            return None
+
+        now = time.time()
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, body, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, body, len(body.encode("utf-8")), now, now)
+            )
+            self.stores = self.stores + 1
+            self.evict(now)
+            self.connection.commit()
+
+    def evict(self, now: float) -> None:
+        """
+        Removes the expired entries and then the least recently used ones until the cache respects
+        its limits. It must be called while holding the lock.
+        """
+        if self.ttl:
+            cursor = self.connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+            self.evictions = self.evictions + max(cursor.rowcount, 0)
+
+        if self.max_entries:
+            entries = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if entries > self.max_entries:
+                cursor = self.connection.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access ASC LIMIT ?)",
+                    (entries - self.max_entries,)
+                )
+                self.evictions = self.evictions + max(cursor.rowcount, 0)
+
+        if self.max_bytes:
+            total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total_bytes > self.max_bytes:
+                exceeding_bytes = total_bytes - self.max_bytes
+                evicted_keys = []
+                for key, size in self.connection.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+                    if exceeding_bytes <= 0:
+                        break
+                    evicted_keys.append((key,))
+                    exceeding_bytes = exceeding_bytes - size
+                self.connection.executemany("DELETE FROM responses WHERE key = ?", evicted_keys)
+                self.evictions = self.evictions + len(evicted_keys)
+
+    def get_statistics(self) -> dict:
+        entries = 0
+        total_bytes = 0
+        if self.connection is not None:
+            with self.lock:
+                entries, total_bytes = self.connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total_bytes
+        }
+
+    def clear(self) -> None:
+        if self.connection is not None:
+            with self.lock:
+                self.connection.execute("DELETE FROM responses")
+                self.connection.commit()
+
+    def close(self) -> None:
+        if self.connection is not None:
+            with self.lock:
+                self.connection.close()
+                self.connection = None
+
+
+shared_response_cache = None
+shared_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Returns the response cache shared by every agent of the process, configured by the
+    RESPONSE_CACHE_* environment variables.
+    """
+    global shared_response_cache
+    with shared_response_cache_lock:
+        if shared_response_cache is None:
+            shared_response_cache = ResponseCache(response_cache_path, response_cache_mode, response_cache_max_entries, response_cache_max_bytes, response_cache_ttl)
+        return shared_response_cache
+
+
+def set_response_cache(response_cache: ResponseCache) -> None:
+    global shared_response_cache
+    with shared_response_cache_lock:
+        shared_response_cache = response_cache
@@ -0,0 +1,91 @@
+import json
+import time
+
+from network.exceptions.malformed_stream_exception import MalformedStreamException
+
+
+class StreamedResponse:
+    """
+    Response assembled from a streamed chat completion. It exposes the same interface used for
+    the non-streamed responses (`status_code`, `text`, `headers`, `json()`), where the body is a
+    regular chat completion containing the whole streamed content.
+    """
+    def __init__(self, text: str, time_to_first_token: float | None, stopped_early: bool, headers=None):
+        self.text = text
+        self.status_code = 200
+        self.headers = {} if headers is None else headers
+        self.time_to_first_token = time_to_first_token
+        self.stopped_early = stopped_early
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def read_chat_completion_stream(response, start_time: float, stop_sentence: str = None) -> StreamedResponse:
+    """
+    Reads the server-sent events of an OpenAI streamed chat completion.
+
+    If a stop sentence is provided and the content received so far is exactly the stop sentence,
+    the stream is closed without waiting for the remaining events, so the caller obtains the
+    answer as soon as it is known. The early stop assumes that a reply equal to the stop sentence
+    is the whole reply: the rest of the stream (if any) is not read, and the response is marked as
+    `stopped_early`.
+
+    Args:
+        response: The streamed `requests.Response`, with status code 200.
+        start_time (float): The `time.perf_counter()` value when the request was sent.
+        stop_sentence (str, optional): The sentence that ends the stream as soon as it is received.
+
+    Returns:
+        StreamedResponse: The response containing the streamed content and, if the stream was
+        completed, the usage reported by the provider.
+
+    Raises:
+        MalformedStreamException: If an event of the stream is not valid JSON (e.g. a truncated chunk).
+    """
+    content = []
+    usage = None
+    finish_reason = None
+    time_to_first_token = None
+    stopped_early = False
+    checked_text = "" # content compared with the stop sentence, kept only while it can still match it
+    check_stop_sentence = bool(stop_sentence)
+
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+            except ValueError as e:
+                raise MalformedStreamException(f"Malformed event in the stream: {e}")
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            for choice in chunk.get("choices", []):
+                finish_reason = choice.get("finish_reason") or finish_reason
+                delta = (choice.get("delta") or {}).get("content")
+                if not delta:
+                    continue
+                if time_to_first_token is None:
+                    time_to_first_token = time.perf_counter() - start_time
+                content.append(delta)
+                if check_stop_sentence:
+                    checked_text = checked_text + delta
+                    stripped_text = checked_text.strip()
+                    if stripped_text == stop_sentence:
+                        stopped_early = True
+                    elif not stop_sentence.startswith(stripped_text):
+                        check_stop_sentence = False
+            if stopped_early:
+                break
+    finally:
+        response.close()
+
+    body = {
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(content)}, "finish_reason": "stop" if stopped_early else finish_reason}],
+        "usage": usage
+    }
+    return StreamedResponse(json.dumps(body), time_to_first_token, stopped_early, response.headers)
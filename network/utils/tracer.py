@@ -0,0 +1,192 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+from network.config import trace_output
+
+current_tags = contextvars.ContextVar("current_tags", default={})
+
+
+class NullSpan:
+    """
+    Span returned while tracing is disabled: entering and exiting it does nothing.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set_tag(self, key: str, value) -> None:
+        pass
+
+
+null_span = NullSpan()
+
+
+class Span:
+    """
+    Timed section of the execution. The tags of the enclosing spans (e.g. the conversation and
+    iteration ids) are inherited, also across the threads started with `asyncio.to_thread`.
+    """
+    __slots__ = ("tracer", "name", "tags", "start", "token")
+
+    def __init__(self, tracer, name: str, tags: dict):
+        self.tracer = tracer
+        self.name = name
+        self.tags = tags
+        self.start = 0
+        self.token = None
+
+    def __enter__(self):
+        self.tags = {**current_tags.get(), **self.tags}
+        self.token = current_tags.set(self.tags)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        current_tags.reset(self.token)
+        if exc_type is not None:
+            self.tags["error"] = exc_type.__name__
+        self.tracer.add_span(self.name, self.start, end, self.tags)
+        return False
+
+    def set_tag(self, key: str, value) -> None:
+        self.tags[key] = value
+
+
+class Tracer:
+    """
+    Lightweight tracer collecting the duration of the phases of the conversations.
+
+    Spans are kept in memory and can be exported as JSON lines or in the Chrome trace event
+    format (readable by chrome://tracing or Perfetto). While the tracer is disabled, `span`
+    returns a shared no-op span, hence the overhead is a single attribute check.
+    """
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.spans = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter_ns()
+        self.process_id = os.getpid()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def is_enabled(self) -> bool:
+        return self.enabled
+
+    def span(self, name: str, **tags):
+        if not self.enabled:
+            return null_span
+        return Span(self, name, tags)
+
+    def add_span(self, name: str, start: int, end: int, tags: dict) -> None:
+        with self.lock:
+            self.spans.append((name, start, end, threading.get_ident(), tags))
+
+    def get_spans(self) -> list[dict]:
+        with self.lock:
+            spans = list(self.spans)
+        return [
+            {
+                "name": name,
+                "start": (start - self.origin) / 1_000_000_000,
+                "duration": (end - start) / 1_000_000_000,
+                "thread": thread_id,
+                "tags": tags
+            }
+            for name, start, end, thread_id, tags in spans
+        ]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.spans = []
+
+    def export_jsonl(self, file_path: str) -> None:
+        """
+        Writes a JSON object for each span: name, start and duration in seconds, thread and tags.
+        """
+        with open(file_path, "w") as output:
+            for span in self.get_spans():
+                output.write(json.dumps(span) + "\n")
+
+    def export_chrome_trace(self, file_path: str) -> None:
+        """
+        Writes the spans as complete events ("ph": "X") of the Chrome trace event format.
+        """
+        events = [
+            {
+                "name": span["name"],
+                "cat": "crane",
+                "ph": "X",
+                "ts": span["start"] * 1_000_000,
+                "dur": span["duration"] * 1_000_000,
+                "pid": self.process_id,
+                "tid": span["thread"],
+                "args": span["tags"]
+            }
+            for span in self.get_spans()
+        ]
+        with open(file_path, "w") as output:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, output)
+
+    def export(self, path_prefix: str) -> list[str]:
+        """
+        Exports the spans in both formats, as `<path_prefix>.jsonl` and `<path_prefix>.chrome.json`.
+
+        Returns:
+            list[str]: The paths of the written files.
+        """
+        directory = os.path.dirname(path_prefix)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        jsonl_path = f"{path_prefix}.jsonl"
+        chrome_trace_path = f"{path_prefix}.chrome.json"
+        self.export_jsonl(jsonl_path)
+        self.export_chrome_trace(chrome_trace_path)
+        return [jsonl_path, chrome_trace_path]
+
+
+tracer = Tracer(enabled=bool(trace_output))
+
+
+def get_tracer() -> Tracer:
+    return tracer
+
+
+def traced(name: str, get_tags=None):
+    """
+    Decorator tracing every call of a function (or coroutine function) as a span.
+
+    Args:
+        name (str): The name of the span.
+        get_tags (callable, optional): Function receiving the same arguments of the decorated
+            function and returning the tags of the span (e.g. the ids of the conversation).
+    """
+    def decorator(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await function(*args, **kwargs)
+                with tracer.span(name, **(get_tags(*args, **kwargs) if get_tags else {})):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.span(name, **(get_tags(*args, **kwargs) if get_tags else {})):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+
+from network.config import model_pricing
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0) -> float:
+    """
+    Estimates the cost in USD of a request, based on the pricing of the model. The prompt tokens
+    served from the provider's prefix cache are charged at the cached price, if the model has one.
+    Models without a known pricing (e.g. the Hugging Face ones) are considered free.
+    """
+    pricing = model_pricing.get(model)
+    if pricing is None:
+        return 0.0
+    uncached_prompt_tokens = prompt_tokens - cached_prompt_tokens
+    cached_prompt_cost = cached_prompt_tokens * pricing.get("cached_prompt", pricing["prompt"])
+    return (uncached_prompt_tokens * pricing["prompt"] + cached_prompt_cost + completion_tokens * pricing["completion"]) / 1_000_000
+
+
+class UsageTracker:
+    """
+    Collects the token usage of every agent call, and aggregates it per agent, per iteration
+    and per conversation.
+
+    Every record is composed by the conversation and iteration ids, the agent's name, the model,
+    the prompt tokens (and how many of them were served from the provider's prefix cache), the
+    completion tokens, whether the tokens were estimated locally, whether the response came from
+    the response cache (or from the checkpoint of a resumed conversation) and the latency of the call.
+    """
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+    def record(self, conversation_id: str, iteration_id: str, agent_name: str, usage: dict) -> None:
+        if usage is None:
+            return None
+        record = {
+            "conversation_id": str(conversation_id),
+            "iteration_id": str(iteration_id),
+            "agent": agent_name,
+            **usage
+        }
+        record["cost"] = 0.0 if usage.get("cached_response") or usage.get("resumed") else estimate_cost(usage.get("model", ""), usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), usage.get("cached_prompt_tokens", 0))
+        with self.lock:
+            self.records.append(record)
+
+    def get_records(self) -> list[dict]:
+        with self.lock:
+            return list(self.records)
+
+    @staticmethod
+    def summarize(records: list[dict]) -> dict:
+        prompt_tokens = sum(record.get("prompt_tokens", 0) for record in records)
+        times_to_first_token = [record["time_to_first_token"] for record in records if record.get("time_to_first_token") is not None]
+        completion_tokens = sum(record.get("completion_tokens", 0) for record in records)
+        cached_prompt_tokens = sum(record.get("cached_prompt_tokens", 0) for record in records)
+        return {
+            "calls": len(records),
+            "cached_responses": sum(1 for record in records if record.get("cached_response")),
+            "resumed_calls": sum(1 for record in records if record.get("resumed")),
+            "estimated_calls": sum(1 for record in records if record.get("estimated")),
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_prompt_tokens,
+            "cached_prompt_token_rate": round(cached_prompt_tokens / prompt_tokens, 4) if prompt_tokens else 0.0,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cost": round(sum(record.get("cost", 0.0) for record in records), 8),
+            "latency": round(sum(record.get("latency", 0.0) for record in records), 6),
+            "rate_limit_wait": round(sum(record.get("rate_limit_wait", 0.0) for record in records), 6),
+            "streamed_calls": len(times_to_first_token),
+            "stopped_early": sum(1 for record in records if record.get("stopped_early")),
+            "mean_time_to_first_token": round(sum(times_to_first_token) / len(times_to_first_token), 6) if times_to_first_token else None
+        }
+
+    @staticmethod
+    def merge_summaries(summaries: list[dict]) -> dict:
+        """
+        Combines summaries produced by `summarize` (e.g. the ones of different runs or shards) into
+        the summary of all their records.
+        """
+        merged = {}
+        for field in ("calls", "cached_responses", "resumed_calls", "estimated_calls", "prompt_tokens", "cached_prompt_tokens", "completion_tokens", "total_tokens", "streamed_calls", "stopped_early"):
+            merged[field] = sum(summary.get(field, 0) for summary in summaries)
+        merged["cached_prompt_token_rate"] = round(merged["cached_prompt_tokens"] / merged["prompt_tokens"], 4) if merged["prompt_tokens"] else 0.0
+        merged["cost"] = round(sum(summary.get("cost", 0.0) for summary in summaries), 8)
+        merged["latency"] = round(sum(summary.get("latency", 0.0) for summary in summaries), 6)
+        merged["rate_limit_wait"] = round(sum(summary.get("rate_limit_wait", 0.0) for summary in summaries), 6)
+        total_time_to_first_token = sum(summary["mean_time_to_first_token"] * summary["streamed_calls"] for summary in summaries if summary.get("mean_time_to_first_token") is not None)
+        merged["mean_time_to_first_token"] = round(total_time_to_first_token / merged["streamed_calls"], 6) if merged["streamed_calls"] else None
+        return merged
+
+    @classmethod
+    def summarize_by(cls, records: list[dict], key: str) -> dict:
+        groups = {}
+        for record in records:
+            groups.setdefault(record[key], []).append(record)
+        return {group: cls.summarize(group_records) for group, group_records in groups.items()}
+
+    def get_iteration_usage(self, conversation_id: str, iteration_id: str) -> dict:
+        records = [record for record in self.get_records() if record["conversation_id"] == str(conversation_id) and record["iteration_id"] == str(iteration_id)]
+        return {
+            "conversation_id": str(conversation_id),
+            "iteration_id": str(iteration_id),
+            "total": self.summarize(records),
+            "agents": self.summarize_by(records, "agent")
+        }
+
+    def get_conversation_usage(self, conversation_id: str) -> dict:
+        records = [record for record in self.get_records() if record["conversation_id"] == str(conversation_id)]
+        return {
+            "conversation_id": str(conversation_id),
+            "total": self.summarize(records),
+            "agents": self.summarize_by(records, "agent"),
+            "iterations": self.summarize_by(records, "iteration_id")
+        }
+
+    def get_usage(self) -> dict:
+        records = self.get_records()
+        return {
+            "total": self.summarize(records),
+            "agents": self.summarize_by(records, "agent"),
+            "conversations": self.summarize_by(records, "conversation_id")
+        }
+
+    def extend(self, records: list[dict]) -> None:
+        with self.lock:
+            self.records.extend(records)
+
+    @staticmethod
+    def save(usage: dict, file_path: str) -> None:
+        directory = os.path.dirname(file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(file_path, "w") as output:
+            json.dump(usage, output, indent=4)
@@ -0,0 +1,48 @@
+import json
+
+from network.utils.checkpoint_store import CheckpointStore
+from network.utils.event_log_writer import EventLogWriter
+
+
+def test_append_after_torn_record_is_readable(tmp_path):
+    file_path = str(tmp_path / "CR_1.jsonl")
+    checkpoint = CheckpointStore(file_path)
+    checkpoint.set_conversation_id("3")
+    checkpoint.record_call("0|initial_review|R1|0", "first", None)
+    with open(file_path, "a") as journal:
+        journal.write('{"type": "call", "key": "0|initial_review|R2|0", "resp') #a record torn by a crash
+
+    resumed_checkpoint = CheckpointStore(file_path, resume=True)
+    resumed_checkpoint.record_call("0|initial_review|R2|0", "second", None)
+
+    data = CheckpointStore.load(file_path)
+    assert data["conversation_id"] == "3"
+    assert data["calls"]["0|initial_review|R1|0"]["response"] == "first"
+    assert data["calls"]["0|initial_review|R2|0"]["response"] == "second"
+
+
+def test_append_after_unterminated_record_keeps_it(tmp_path):
+    file_path = str(tmp_path / "CR_1.jsonl")
+    with open(file_path, "w") as journal:
+        journal.write(json.dumps({"type": "conversation", "conversation_id": "3"}) + "\n")
+        journal.write(json.dumps({"type": "call", "key": "0|feedback|F|0", "response": "first", "usage": None})) #the newline was not written
+
+    resumed_checkpoint = CheckpointStore(file_path, resume=True)
+    resumed_checkpoint.mark_finished(error=False)
+
+    data = CheckpointStore.load(file_path)
+    assert data["calls"]["0|feedback|F|0"]["response"] == "first"
+    assert data["status"] == "completed"
+
+
+def test_event_log_append_after_torn_record(tmp_path):
+    log_path = str(tmp_path / "events.jsonl")
+    with open(log_path, "w") as log:
+        log.write('{"type": "message", "content": "first"}\n{"type": "mess')
+
+    writer = EventLogWriter(fsync_policy="always")
+    writer.append(log_path, {"type": "message", "content": "second"})
+
+    with open(log_path, "r") as log:
+        records = [json.loads(line) for line in log]
+    assert [record["content"] for record in records] == ["first", "second"]